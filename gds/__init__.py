@@ -1,6 +1,9 @@
-from .fds import couple
+from .fds import couple, parareal
 from .gds import *
 from .system import *
+from .events import *
+from .expr import *
+from .coupling import *
 from .types import *
 from .utils.graph import *
 from .utils.boundary import *
@@ -0,0 +1,145 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.spatial import cKDTree
+from typing import Any, Union, Tuple, Callable, Iterable, Dict, List
+
+from .types import *
+from .utils import *
+from .gds import GraphObservable
+from .expr import Expr, Op
+
+''' Coupling operators between observables on distinct graphs '''
+
+class Coupling:
+	'''
+	Sparse linear map carrying the values of a source observable onto the domain of a target, possibly on another graph,
+	e.g. from a coarse city network onto the fine neighborhood graphs it overlays. Built by a function of the two
+	observables (see correspondence_coupling, proximity_coupling); the matrix is cached, and rebuilt only when either
+	domain changes topology, so that applying it each step is a single SpMV. Use transfer() to couple within laws.
+	'''
+	def __init__(self, source: GraphObservable, target: GraphObservable, build: Callable[[GraphObservable, GraphObservable], sp.spmatrix]):
+		self.source = source
+		self.target = target
+		self.build = build
+		self._matrix = None
+		self._key = None
+		self._version = 0 # Bumped by invalidate(), so that compiled laws fold the rebuilt matrix
+
+	@property
+	def matrix(self) -> sp.csr_matrix:
+		''' |target| x |source| transfer matrix '''
+		key = (self.source.ndim, self.target.ndim, getattr(self.source, '_topology', 0), getattr(self.target, '_topology', 0))
+		if key != self._key:
+			dtype = getattr(self.target, 'dtype', np.float64)
+			M = sp.csr_matrix(self.build(self.source, self.target), dtype=dtype)
+			assert M.shape == (self.target.ndim, self.source.ndim), 'Coupling does not map between the given domains'
+			M.sort_indices()
+			self._matrix, self._key = M, key
+		return self._matrix
+
+	def invalidate(self):
+		''' Rebuild the matrix on next use, e.g. after moving nodes '''
+		self._key = None
+		self._version += 1
+
+	def __call__(self, y: np.ndarray=None, out: np.ndarray=None) -> np.ndarray:
+		''' Source values (by default, the current state) carried onto the target domain '''
+		return spmv(self.matrix, self.source.y if y is None else y, out)
+
+class Transfer(Op):
+	''' Coupling applied to its source observable; folded into compiled laws like the differential operators '''
+	def __init__(self, coupling: Coupling):
+		Op.__init__(self, 'transfer', coupling.source)
+		self.coupling = coupling
+
+	def assemble(self) -> Tuple[sp.spmatrix, Any]:
+		return self.coupling.matrix, 0.
+
+	def evaluate(self, target: Observable, y: np.ndarray) -> np.ndarray:
+		return self.coupling(y if self.obs is target else None)
+
+	def version(self) -> Any:
+		return self.coupling._version
+
+def transfer(coupling: Coupling) -> Expr:
+	''' Values of the coupling's source on the target domain, for use in laws, e.g.
+
+		dydt = D*laplacian(fine) + k*(transfer(C) - ident(fine))
+	'''
+	return Expr([(1., (Transfer(coupling),))])
+
+''' Constructors '''
+
+def correspondence_coupling(source: GraphObservable, target: GraphObservable, pairs: Union[Dict[Point, Point], Iterable[Tuple]]=None) -> Coupling:
+	'''
+	Coupling by a correspondence of points: target point -> source point, or (target, source, weight) triples, with several
+	sources per target summed. By default, points with the same label in both domains are identified. Between edge
+	domains, values change sign where the two graphs orient a pair of edges oppositely.
+	'''
+	def build(source: GraphObservable, target: GraphObservable) -> sp.csr_matrix:
+		if pairs is None:
+			items = [(x, x, 1.) for x in target.X if x in source.X]
+		elif isinstance(pairs, dict):
+			items = [(x, s, 1.) for x, s in pairs.items()]
+		else:
+			items = [p if len(p) == 3 else (p[0], p[1], 1.) for p in pairs]
+		rows = np.array([target.X[x] for x, _, _ in items], dtype=np.intp)
+		cols = np.array([source.X[s] for _, s, _ in items], dtype=np.intp)
+		vals = np.array([w for _, _, w in items], dtype=np.float64)
+		if source.Gd is GraphDomain.edges and target.Gd is GraphDomain.edges:
+			vals *= [source.orientation[s] * target.orientation[x] for x, s, _ in items]
+		return sp.csr_matrix((vals, (rows, cols)), shape=(target.ndim, source.ndim))
+	return Coupling(source, target, build)
+
+def proximity_coupling(source: GraphObservable, target: GraphObservable, k: int=1, radius: float=None, power: float=1.,
+		aggregate: str=None, attr: str='pos') -> Coupling:
+	'''
+	Coupling by spatial proximity of points, found with a KD-tree over node positions (edges are placed at their midpoints).
+	By default each target point interpolates its k nearest source points within radius, by inverse distance to the given
+	power (coincident points take all the weight); with aggregate='mean' or 'sum', each source point is instead
+	assigned to its nearest target point within radius, e.g. to restrict a fine graph onto a coarse one.
+	'''
+	assert aggregate in (None, 'mean', 'sum'), 'Aggregate by mean or sum'
+	radius = np.inf if radius is None else radius
+
+	def build(source: GraphObservable, target: GraphObservable) -> sp.csr_matrix:
+		P, Q = point_positions(source, attr), point_positions(target, attr)
+		if aggregate is not None:
+			d, j = cKDTree(Q).query(P, k=1, distance_upper_bound=radius)
+			found = np.isfinite(d)
+			rows, cols = j[found], np.flatnonzero(found)
+			M = sp.csr_matrix((np.ones(rows.size), (rows, cols)), shape=(target.ndim, source.ndim))
+			if aggregate == 'mean':
+				count = np.bincount(rows, minlength=target.ndim)
+				M = sp.diags(1. / np.maximum(count, 1))@M
+			return M
+		d, j = cKDTree(P).query(Q, k=k, distance_upper_bound=radius)
+		d, j = d.reshape(len(Q), k), j.reshape(len(Q), k)
+		found = np.isfinite(d)
+		exact = (d == 0).any(axis=1)
+		with np.errstate(divide='ignore'):
+			w = np.where(found, 1. / d**power, 0.)
+		w[exact] = (d[exact] == 0)
+		w /= np.maximum(w.sum(axis=1, keepdims=True), np.finfo(np.float64).tiny)
+		rows = np.repeat(np.arange(len(Q)), k)
+		keep = found.ravel()
+		return sp.csr_matrix((w.ravel()[keep], (rows[keep], j.ravel()[keep])), shape=(target.ndim, source.ndim))
+	return Coupling(source, target, build)
+
+def point_positions(obs: GraphObservable, attr: str='pos') -> np.ndarray:
+	''' Position of each point of a node or edge observable, in index order '''
+	G = obs.G
+	if getattr(G, 'pos', None) is not None and attr == 'pos':
+		pos = np.asarray(G.pos, dtype=np.float64)
+	else:
+		pos = np.array([G.nodes[obs.nodes_i[i]][attr] for i in range(len(obs.nodes))], dtype=np.float64)
+	if obs.Gd is GraphDomain.nodes:
+		return pos
+	elif obs.Gd is GraphDomain.edges:
+		if hasattr(obs, 'edge_ends'):
+			tails, heads = obs.edge_ends()
+		else:
+			ends = np.array([(obs.nodes[u], obs.nodes[v]) for u, v in (obs.iX[i] for i in range(obs.ndim))], dtype=np.intp).reshape(-1, 2)
+			tails, heads = ends[:, 0], ends[:, 1]
+		return (pos[tails] + pos[heads]) / 2
+	raise NotImplementedError('Positions are defined for node and edge observables')
@@ -0,0 +1,179 @@
+import numpy as np
+from typing import Any, Union, Tuple, Callable, Iterable, Dict, List
+
+from .types import *
+
+''' Events for continuous-time systems '''
+
+class Event:
+	def __init__(self, fun: Callable[[Time, np.ndarray], np.ndarray], direction: int=0, terminal: bool=False, n_sub: int=4):
+		'''
+		Vectorized event: fires wherever a component of fun(t, y) crosses zero between two integrator steps.
+
+		fun: Callable[Time, np.ndarray]
+			Event function evaluated on the observable's state; may return an array (one event per component) or a scalar
+		direction: int
+			[default 0] Only detect rising (+1) or falling (-1) crossings, or both (0)
+		terminal: bool
+			[default False] Stop the run once the event fires
+		n_sub: int
+			[default 4] Number of dense-output samples used to locate crossings within a step
+		'''
+		self.fun = fun
+		self.direction = direction
+		self.terminal = terminal
+		self.n_sub = n_sub
+		self.reset()
+
+	def reset(self):
+		self.t_events = [] # Times at which the event fired
+		self.i_events = [] # Components which fired at those times
+		self._g = None
+
+	def prime(self, t: Time, y: np.ndarray):
+		''' Evaluate the event function at the start of a step '''
+		if self._g is None:
+			self._g = np.atleast_1d(np.asarray(self.fun(t, y), dtype=np.float64))
+
+	def reprime(self, t: Time, y: np.ndarray):
+		''' Evaluate the event function afresh after the state jumped (e.g. on restarting the integrator), so that the jump is not taken for a crossing '''
+		self._g = None
+		self.prime(t, y)
+
+	def crossings(self, g0: np.ndarray, g1: np.ndarray) -> np.ndarray:
+		rising = (g0 < 0) & (g1 >= 0)
+		falling = (g0 > 0) & (g1 <= 0)
+		if self.direction > 0:
+			return rising
+		elif self.direction < 0:
+			return falling
+		return rising | falling
+
+	def locate(self, t0: Time, t1: Time, g0: np.ndarray, g1: np.ndarray, idx: np.ndarray, sol: Callable[[Time], np.ndarray]) -> np.ndarray:
+		''' Crossing times of components idx, by sampling the dense output and interpolating linearly between samples '''
+		ts = np.linspace(t0, t1, self.n_sub+1)
+		tc = np.full(idx.size, np.nan)
+		g_prev = g0[idx]
+		for k in range(1, self.n_sub+1):
+			g_k = g1[idx] if k == self.n_sub else np.atleast_1d(self.fun(ts[k], sol(ts[k])))[idx]
+			hit = np.isnan(tc) & self.crossings(g_prev, g_k)
+			tc[hit] = ts[k-1] + (ts[k] - ts[k-1]) * g_prev[hit] / (g_prev[hit] - g_k[hit])
+			g_prev = g_k
+		tc[np.isnan(tc)] = t1 # Crossings missed by the sampling are attributed to the end of the step
+		return tc
+
+	def record(self, tc: np.ndarray, idx: np.ndarray):
+		self.t_events.append(tc.min())
+		self.i_events.append(idx)
+
+	def check(self, t0: Time, t1: Time, y1: np.ndarray, sol: Callable[[Time], np.ndarray]) -> bool:
+		''' Detect and record crossings in [t0, t1]; returns whether the run should stop '''
+		g0, g1 = self._g, np.atleast_1d(np.asarray(self.fun(t1, y1), dtype=np.float64))
+		self._g = g1
+		idx = np.flatnonzero(self.crossings(g0, g1))
+		if idx.size == 0:
+			return False
+		self.record(self.locate(t0, t1, g0, g1, idx, sol), idx)
+		return self.terminal
+
+	@property
+	def fired(self) -> bool:
+		return len(self.t_events) > 0
+
+class SteadyStateEvent(Event):
+	def __init__(self, tol: float, terminal: bool=True, t_min: float=0.):
+		''' Fires when the rate of change max|dy/dt| over a step falls below tol, once t >= t_min '''
+		self.tol = tol
+		self.t_min = t_min
+		Event.__init__(self, None, terminal=terminal)
+
+	def prime(self, t: Time, y: np.ndarray):
+		if self._g is None:
+			self._g = y.copy()
+
+	def check(self, t0: Time, t1: Time, y1: np.ndarray, sol: Callable[[Time], np.ndarray]) -> bool:
+		residual = np.abs(y1 - self._g).max(initial=0.) / (t1 - t0) if t1 > t0 else np.inf
+		np.copyto(self._g, y1)
+		if residual < self.tol and t1 >= self.t_min:
+			self.record(np.array([t1]), np.arange(y1.size))
+			return self.terminal
+		return False
+
+class DivergenceEvent(Event):
+	def __init__(self, bound: float=np.inf, terminal: bool=True):
+		''' Fires when any component becomes NaN/infinite or exceeds bound in magnitude '''
+		self.bound = bound
+		Event.__init__(self, None, terminal=terminal)
+
+	def prime(self, t: Time, y: np.ndarray):
+		pass
+
+	def check(self, t0: Time, t1: Time, y1: np.ndarray, sol: Callable[[Time], np.ndarray]) -> bool:
+		idx = np.flatnonzero(~(np.abs(y1) <= self.bound)) # NaN compares false
+		if idx.size == 0:
+			return False
+		self.record(np.array([t1]), idx)
+		return self.terminal
+
+class FirstPassage(Event):
+	def __init__(self, value: Union[float, np.ndarray], direction: int=1, n_sub: int=4):
+		''' Records the first time each component crosses a threshold, keeping a single float per component '''
+		Event.__init__(self, lambda t, y: y - value, direction=direction, n_sub=n_sub)
+
+	def reset(self):
+		Event.reset(self)
+		self.times = None # NaN until the component first crosses
+
+	def prime(self, t: Time, y: np.ndarray):
+		if self._g is None:
+			Event.prime(self, t, y)
+			self.times = np.full(self._g.shape, np.nan)
+			already = (self._g >= 0) if self.direction >= 0 else (self._g <= 0)
+			self.times[already] = t
+
+	def reprime(self, t: Time, y: np.ndarray):
+		''' Keeps the passage times recorded so far; components which the jump put past the threshold pass at t '''
+		if self.times is None:
+			return self.prime(t, y)
+		Event.reprime(self, t, y)
+		already = (self._g >= 0) if self.direction >= 0 else (self._g <= 0)
+		self.times[np.isnan(self.times) & already] = t
+
+	def check(self, t0: Time, t1: Time, y1: np.ndarray, sol: Callable[[Time], np.ndarray]) -> bool:
+		g0, g1 = self._g, np.atleast_1d(np.asarray(self.fun(t1, y1), dtype=np.float64))
+		self._g = g1
+		idx = np.flatnonzero(np.isnan(self.times) & self.crossings(g0, g1))
+		if idx.size > 0:
+			self.times[idx] = self.locate(t0, t1, g0, g1, idx, sol)
+		return False
+
+''' Event constructors '''
+
+def threshold_event(value: Union[float, np.ndarray], direction: int=1, terminal: bool=False) -> Event:
+	''' Per-component crossing of a threshold value '''
+	return Event(lambda t, y: y - value, direction=direction, terminal=terminal)
+
+def first_passage(value: Union[float, np.ndarray], direction: int=1) -> FirstPassage:
+	''' Per-component first-passage times of a threshold; read them from the .times array '''
+	return FirstPassage(value, direction=direction)
+
+def steady_state_event(tol: float, terminal: bool=True, t_min: float=0.) -> Event:
+	return SteadyStateEvent(tol, terminal=terminal, t_min=t_min)
+
+def divergence_event(bound: float=np.inf, terminal: bool=True) -> Event:
+	return DivergenceEvent(bound, terminal=terminal)
+
+''' Detection '''
+
+def detect_events(events: List[Event], t0: Time, t1: Time, y1: np.ndarray, dense: Callable[[], Callable[[Time], np.ndarray]]) -> bool:
+	''' Check all events over an integrator step. The dense output is only constructed if an event function needs it. '''
+	sol = None
+	def sol_fun(t: Time) -> np.ndarray:
+		nonlocal sol
+		if sol is None:
+			sol = dense()
+		return sol(t)
+	stop = False
+	for event in events:
+		stop |= event.check(t0, t1, y1, sol_fun)
+	return stop
@@ -0,0 +1,525 @@
+import numpy as np
+import scipy.sparse as sp
+from typing import Any, Union, Tuple, Callable, Iterable, Dict, List
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+import weakref
+
+from .types import *
+from .utils import *
+from .utils.partition import *
+
+''' Lazy evolution laws: sums of sparse linear operators on observables and pointwise products of them '''
+
+class Expr:
+	'''
+	Polynomial over atoms: const + sum(coef * atom_1 * ... * atom_k), where atoms are operators applied to observables.
+	Built from the constructors below and ordinary arithmetic with scalars, arrays and observables, e.g.
+
+		dydt = dS*laplacian(S) - muS*ident(S) - beta*ident(S)*I + Lambda
+	'''
+	__array_ufunc__ = None # Make NumPy arrays defer to our reflected operators
+
+	def __init__(self, terms: Iterable[Tuple[Any, Tuple['Atom', ...]]]=(), const: Any=0.):
+		self.terms = list(terms)
+		self.const = const
+
+	@staticmethod
+	def wrap(x: Any) -> 'Expr':
+		if isinstance(x, Expr):
+			return x
+		elif isinstance(x, Observable):
+			return ident(x)
+		return Expr(const=x)
+
+	def __add__(self, other: Any) -> 'Expr':
+		other = Expr.wrap(other)
+		return Expr(self.terms + other.terms, self.const + other.const)
+
+	def __mul__(self, other: Any) -> 'Expr':
+		other = Expr.wrap(other)
+		terms = [(c1*c2, a1+a2) for c1, a1 in self.terms for c2, a2 in other.terms]
+		if not is_zero(other.const):
+			terms += [(c*other.const, a) for c, a in self.terms]
+		if not is_zero(self.const):
+			terms += [(self.const*c, a) for c, a in other.terms]
+		return Expr(terms, self.const*other.const)
+
+	def __neg__(self) -> 'Expr':
+		return self * -1.
+
+	def __sub__(self, other: Any) -> 'Expr':
+		return self + (-Expr.wrap(other))
+
+	def __rsub__(self, other: Any) -> 'Expr':
+		return (-self) + other
+
+	def __truediv__(self, other: Any) -> 'Expr':
+		if isinstance(other, (Expr, Observable)):
+			return self * pointwise(np.reciprocal, other)
+		return self * (1. / other)
+
+	__radd__ = __add__
+	__rmul__ = __mul__
+
+	def fields(self) -> List[Observable]:
+		''' Observables the expression depends on '''
+		return unique([obs for _, atoms in self.terms for atom in atoms for obs in atom.fields()])
+
+	def evaluate(self, target: Observable=None, y: np.ndarray=None) -> np.ndarray:
+		''' Evaluate on the current state, substituting y for the state of target '''
+		ret = self.const
+		for coef, atoms in self.terms:
+			prod = coef
+			for atom in atoms:
+				prod = prod * atom.evaluate(target, y)
+			ret = ret + prod
+		return ret
+
+	def bind(self, target: Observable, partitions: int=None) -> 'Law':
+		return Law(self, target, partitions=partitions)
+
+class Atom:
+	''' Factor of a term '''
+	linear = False
+
+	def fields(self) -> List[Observable]:
+		raise NotImplementedError
+
+	def evaluate(self, target: Observable, y: np.ndarray) -> np.ndarray:
+		raise NotImplementedError
+
+	def version(self) -> Any:
+		''' Changes whenever the atom's operator does other than through its fields' operators ''' 
+		return None
+
+class Op(Atom):
+	''' Affine operator applied to an observable: matrix@y + const '''
+	linear = True
+
+	def __init__(self, name: str, obs: Observable):
+		self.name = name
+		self.obs = obs
+
+	def fields(self) -> List[Observable]:
+		return [self.obs]
+
+	def assemble(self) -> Tuple[sp.spmatrix, Any]:
+		return operators[self.name](self.obs)
+
+	def evaluate(self, target: Observable, y: np.ndarray) -> np.ndarray:
+		y = y if self.obs is target else None
+		if self.name == 'ident':
+			return self.obs.y if y is None else y
+		return getattr(self.obs, self.name)(y)
+
+class Pointwise(Atom):
+	''' Elementwise function of expressions '''
+	def __init__(self, fun: Callable[..., np.ndarray], args: Tuple[Expr]):
+		self.fun = fun
+		self.args = args
+
+	def fields(self) -> List[Observable]:
+		return [obs for arg in self.args for obs in arg.fields()]
+
+	def evaluate(self, target: Observable, y: np.ndarray) -> np.ndarray:
+		return self.fun(*[arg.evaluate(target, y) for arg in self.args])
+
+class Advect(Atom):
+	''' Transport of an observable by a velocity field; linear in the observable, but assembled per velocity '''
+	def __init__(self, obs: Observable, v_field: Any):
+		self.obs = obs
+		self.v_field = v_field
+
+	def fields(self) -> List[Observable]:
+		return [self.obs] + ([self.v_field] if isinstance(self.v_field, Observable) else [])
+
+	def evaluate(self, target: Observable, y: np.ndarray) -> np.ndarray:
+		return self.obs.advect(self.v_field, y if self.obs is target else None)
+
+''' Operator assembly '''
+
+def assemble_ident(obs: Observable) -> Tuple[sp.spmatrix, Any]:
+	return sp.identity(obs.ndim, format='csr'), 0.
+
+def assemble_laplacian(obs: Observable) -> Tuple[sp.spmatrix, Any]:
+	if obs.Gd is GraphDomain.nodes:
+		return obs.dirichlet_laplacian, obs.neumann_correction
+	elif obs.curl3.shape[0] > 0:
+		return obs.dirichlet_laplacian - obs.curl3.T@obs.curl3, 0.
+	return obs.dirichlet_laplacian, 0.
+
+def assemble_bilaplacian(obs: Observable) -> Tuple[sp.spmatrix, Any]:
+	if obs.Gd is GraphDomain.nodes:
+		return obs.dirichlet_laplacian@obs.dirichlet_laplacian, obs.dirichlet_laplacian@obs.neumann_correction
+	L, _ = assemble_laplacian(obs)
+	return L@L, 0.
+
+def assemble_grad(obs: Observable) -> Tuple[sp.spmatrix, Any]:
+	return obs.incidence_t, 0.
+
+def assemble_div(obs: Observable) -> Tuple[sp.spmatrix, Any]:
+	return -obs.incidence, 0.
+
+operators = {
+	'ident': assemble_ident,
+	'laplacian': assemble_laplacian,
+	'bilaplacian': assemble_bilaplacian,
+	'grad': assemble_grad,
+	'div': assemble_div,
+}
+
+''' Constructors '''
+
+def ident(obs: Observable) -> Expr:
+	return Expr([(1., (Op('ident', obs),))])
+
+def laplacian(obs: Observable) -> Expr:
+	return Expr([(1., (Op('laplacian', obs),))])
+
+def bilaplacian(obs: Observable) -> Expr:
+	return Expr([(1., (Op('bilaplacian', obs),))])
+
+def grad(obs: Observable) -> Expr:
+	assert obs.Gd is GraphDomain.nodes, 'Gradient is defined on node observables'
+	return Expr([(1., (Op('grad', obs),))])
+
+def div(obs: Observable) -> Expr:
+	assert obs.Gd is GraphDomain.edges, 'Divergence is defined on edge observables'
+	return Expr([(1., (Op('div', obs),))])
+
+def advect(obs: Observable, v_field: Any) -> Expr:
+	return Expr([(1., (Advect(obs, v_field),))])
+
+def pointwise(fun: Callable[..., np.ndarray], *args: Any) -> Expr:
+	''' Elementwise function of expressions, e.g. pointwise(np.tanh, I) '''
+	return Expr([(1., (Pointwise(fun, tuple(Expr.wrap(a) for a in args)),))])
+
+''' Compiled laws '''
+
+class Law:
+	'''
+	An expression compiled against the observable it evolves. Terms consisting of a single linear operator are folded into one
+	sparse matrix per source observable plus a constant; the remaining terms are evaluated pointwise into a work buffer.
+	The target's own state is read from the integrator's argument, and other observables' from their .y.
+	Assembly is redone only when the operators of a source observable change (e.g. new boundary conditions); when only 
+	their entries change (e.g. time-varying weights), the folded matrices are refilled in place.
+	For ensembles, linear terms with per-member coefficients are left unfolded, and per-point vectors are applied to all members.
+	With partitions, the law is evaluated by a PartitionedLaw in that many worker processes.
+	'''
+	def __init__(self, expr: Expr, target: Observable, partitions: int=None):
+		assert partitions is None or target.ensemble is None, 'Ensembles cannot be partitioned'
+		unsupported = [] if partitions is None else unpartitionable(expr)
+		if unsupported:
+			raise ValueError(f'{", ".join(unsupported)} terms cannot be evaluated by partition')
+		self.expr = expr
+		self.target = target
+		self.fields = unique([target] + expr.fields())
+		self.partitions = partitions
+		self.dtype = getattr(target, 'dtype', np.dtype(np.float64)) # Operators are folded in the target's precision
+		self._key = None
+		self._values = None
+		self._fills = None # Per block, the structure of each folded term and the places of its entries in the block
+		self._work = None
+		self._jac = None
+		self._runner = None
+
+	def compile(self):
+		key = (tuple(obs._op_version for obs in self.fields), tuple(atom.version() for _, atoms in self.expr.terms for atom in atoms))
+		values = tuple(obs._op_values for obs in self.fields)
+		if key == self._key:
+			if values != self._values and not self.refill():
+				self._key = None
+				return self.compile()
+			self._values = values
+			return
+		n = self.target.ndim
+		const, linear, nonlinear = self.fold()
+		self.blocks, self._fills = [], []
+		for obs, terms in linear:
+			# The union of the terms' sparsity, keeping entries which cancel, so that each term's entries have a fixed place
+			rows = np.concatenate([entry_rows(A) for _, _, A in terms])
+			cols = np.concatenate([A.indices for _, _, A in terms])
+			data = np.concatenate([scaled_data(coef, A) for coef, _, A in terms])
+			B = sp.csr_matrix((data.astype(self.dtype), (rows, cols)), shape=(n, obs.ndim))
+			keys = entry_rows(B).astype(np.int64) * B.shape[1] + B.indices
+			fill = [(A.indptr.copy(), A.indices.copy(), np.searchsorted(keys, entry_rows(A).astype(np.int64) * B.shape[1] + A.indices)) 
+				for _, _, A in terms]
+			self.blocks.append((obs, B))
+			self._fills.append(fill)
+		self.const = const.astype(self.dtype)
+		self.nonlinear = nonlinear
+		self._work = None
+		self._jac = None
+		if self._runner is not None:
+			self._runner.close()
+			self._runner = None
+		self._key, self._values = key, values
+
+	def fold(self) -> Tuple[np.ndarray, List[Tuple[Observable, List[Tuple[Any, Atom, sp.csr_matrix]]]], List[Tuple[Any, Tuple[Atom]]]]:
+		''' The constant, the terms of a single linear operator (with their assembled matrices) by source, and the remaining terms '''
+		n, target = self.target.ndim, self.target
+		col = (n,) if target.ensemble is None else (n, 1) # Shape of per-point vectors
+		const = np.zeros(col) + self.expr.const
+		linear, nonlinear = dict(), []
+		for coef, atoms in self.expr.terms:
+			if len(atoms) == 1 and atoms[0].linear and (np.isscalar(coef) or np.shape(coef) == col):
+				A, c = atoms[0].assemble()
+				assert A.shape[0] == n, f'Operator {atoms[0].name} does not map onto the domain of the evolving observable'
+				A = sp.csr_matrix(A)
+				A.sum_duplicates()
+				linear.setdefault(id(atoms[0].obs), (atoms[0].obs, []))[1].append((coef, atoms[0], A))
+				const = const + coef*np.reshape(c, col) if np.ndim(c) > 0 else const
+			else:
+				nonlinear.append((coef, atoms))
+		return const, list(linear.values()), nonlinear
+
+	def refill(self) -> bool:
+		''' Refill the folded matrices after their operators' entries changed; False if a sparsity changed after all '''
+		const, linear, _ = self.fold()
+		for (_, B), fill, (_, terms) in zip(self.blocks, self._fills, linear):
+			B.data[:] = 0.
+			for (indptr, indices, pos), (coef, _, A) in zip(fill, terms):
+				if not (np.array_equal(A.indptr, indptr) and np.array_equal(A.indices, indices)):
+					return False
+				B.data[pos] += scaled_data(coef, A)
+		self.const = const.astype(self.dtype)
+		self._jac = None
+		if self._runner is not None: # Workers hold restricted copies of the matrices
+			self._runner.close()
+			self._runner = None
+		return True
+
+	def __call__(self, t: Time, y: np.ndarray, out: np.ndarray=None) -> np.ndarray:
+		self.compile()
+		if out is None:
+			out = np.empty_like(y)
+		if self.partitions is not None:
+			if self._runner is None:
+				self._runner = PartitionedLaw(self, self.partitions)
+			return self._runner(y, out)
+		if self.nonlinear and (self._work is None or self._work.shape != out.shape):
+			self._work = np.empty_like(out)
+		target = self.target
+		terms = [(coef, *[atom.evaluate(target, y) for atom in atoms]) for coef, atoms in self.nonlinear]
+		lincomb(out, *terms, const=self.const, work=self._work)
+		threads = getattr(target, 'spmv_threads', None)
+		for obs, A in self.blocks:
+			spmv(A, y if obs is target else obs.y, out, accumulate=True, threads=threads)
+		return out
+
+	def buffer(self) -> np.ndarray:
+		''' 
+		Buffer which a partitioned law's workers write their results to, which callers may pass as out to avoid copying 
+		the result; it is overwritten by the next evaluation. None unless partitioned.
+		'''
+		if self.partitions is None:
+			return None
+		self.compile()
+		if self._runner is None:
+			self._runner = PartitionedLaw(self, self.partitions)
+		return self._runner.out
+
+	@property
+	def exact(self) -> bool:
+		''' Whether the linear part is the full Jacobian, i.e. the target does not appear in a nonlinear term '''
+		self.compile()
+		return not any(obs is self.target for _, atoms in self.nonlinear for atom in atoms for obs in atom.fields())
+
+	def jacobian(self) -> sp.csr_matrix:
+		''' Derivative of the linear part with respect to the target's state; rows of Dirichlet-constrained points are zero '''
+		self.compile()
+		n = self.target.ndim
+		J = next((A for obs, A in self.blocks if obs is self.target), sp.csr_matrix((n, n)))
+		mask = np.ones(n)
+		mask[self.target.dirichlet_indices] = 0.
+		return sp.diags(mask)@J
+
+	def dense_jacobian(self, t: Time=None, y: np.ndarray=None) -> np.ndarray:
+		''' Jacobian in the dense form expected by LSODA; constant between recompilations '''
+		self.compile()
+		if self._jac is None:
+			self._jac = self.jacobian().toarray().astype(np.float64, copy=False) # The solver works in double precision
+		return self._jac
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['_runner'] = None # Worker processes are restarted on demand
+		return state
+
+def entry_rows(A: sp.csr_matrix) -> np.ndarray:
+	''' Row of each stored entry '''
+	return np.repeat(np.arange(A.shape[0]), np.diff(A.indptr))
+
+def scaled_data(coef: Any, A: sp.csr_matrix) -> np.ndarray:
+	''' Entries of coef*A, for a scalar or per-row coefficient '''
+	return A.data*coef if np.isscalar(coef) else A.data*np.ravel(coef)[entry_rows(A)]
+
+''' Partitioned evaluation '''
+
+class PartitionedLaw:
+	'''
+	Evaluates a compiled law in worker processes, each owning a part of the target's points found by spectral bisection of 
+	the law's sparsity. The states of all source observables are published to shared memory before each evaluation; each 
+	worker gathers only its halo (off-part points its rows depend on) from there, and writes its rows of the result to a 
+	shared output buffer. Workers are forked, and so inherit the shared buffers and restricted operators without pickling.
+	Each evaluation copies the target's state into shared memory, since the solver owns it (other sources are copied 
+	only when they have changed), and costs one pipe round trip per worker. The result is copied out only if the caller's 
+	buffer is not the shared one (see Law.buffer); this pays off only when evaluating the law's rows dominates, i.e. for 
+	large targets.
+	'''
+	def __init__(self, law: Law, parts: int):
+		self.law = law
+		n = law.target.ndim
+		pattern = next((A for obs, A in law.blocks if obs is law.target), None)
+		if pattern is None or pattern.nnz == 0:
+			labels = np.arange(n) * parts // n
+		else:
+			labels = spectral_bisection(pattern, parts)
+		self.rows = partition_sets(labels, parts)
+		locals_ = [LocalLaw(law, rows) for rows in self.rows] # Before allocating anything that must be released
+
+		# Released by the finalizer, registered before any segment or worker exists, should construction fail midway
+		self._shm, self._conns, self._procs = [], [], []
+		self._finalizer = weakref.finalize(self, close_partitions, self._conns, self._procs, self._shm)
+		try:
+			dtypes = [getattr(obs, 'dtype', np.dtype(np.float64)) for obs in law.fields] + [law.dtype]
+			for obs, dt in zip(law.fields + [law.target], dtypes):
+				self._shm.append(SharedMemory(create=True, size=max(obs.ndim, 1) * dt.itemsize))
+			self.ys = [np.ndarray(obs.ndim, dtype=dt, buffer=shm.buf) for obs, dt, shm in zip(law.fields, dtypes, self._shm)]
+			self.out = np.ndarray(n, dtype=law.dtype, buffer=self._shm[-1].buf)
+			self._versions = [None] * len(law.fields) # State versions of the sources last published
+
+			ctx = mp.get_context('fork')
+			for local in locals_:
+				conn, child_conn = ctx.Pipe()
+				proc = ctx.Process(target=partition_worker, args=(child_conn, local, self.ys, self.out), daemon=True)
+				proc.start()
+				child_conn.close()
+				self._conns.append(conn)
+				self._procs.append(proc)
+		except BaseException:
+			self._finalizer()
+			raise
+
+	def __call__(self, y: np.ndarray, out: np.ndarray) -> np.ndarray:
+		np.copyto(self.ys[0], y)
+		for s, obs in enumerate(self.law.fields[1:], 1):
+			version = getattr(obs, 'state_version', None)
+			if version is None or version != self._versions[s]:
+				np.copyto(self.ys[s], obs.y)
+				self._versions[s] = version
+		for conn in self._conns:
+			conn.send(True)
+		errors = [conn.recv() for conn in self._conns]
+		for err in errors:
+			if err is not None:
+				raise err
+		if not np.may_share_memory(out, self.out):
+			np.copyto(out, self.out)
+		return out
+
+	def close(self):
+		self._finalizer()
+
+def partition_worker(conn: Any, local: 'LocalLaw', ys: List[np.ndarray], out: np.ndarray):
+	while conn.recv() is not None:
+		try:
+			local(ys, out)
+			conn.send(None)
+		except Exception as e:
+			conn.send(e)
+
+def close_partitions(conns: List[Any], procs: List[Any], shms: List[SharedMemory]):
+	for conn, proc in zip(conns, procs):
+		try:
+			conn.send(None)
+		except (BrokenPipeError, OSError):
+			pass
+		proc.join(timeout=1.)
+		if proc.is_alive():
+			proc.terminate()
+		conn.close()
+	for shm in shms:
+		try:
+			shm.close()
+		except BufferError: # Still viewed by an array; the mapping is released with it
+			pass
+		shm.unlink()
+
+class LocalLaw:
+	''' A compiled law restricted to some rows of the target, reading source states from flat buffers by position '''
+	def __init__(self, law: Law, rows: np.ndarray):
+		index = {id(obs): s for s, obs in enumerate(law.fields)}
+		self.rows = rows
+		self.const = restrict_coef(law.const, rows)
+		self.blocks = [(index[id(obs)], *restrict_matrix(A, rows)) for obs, A in law.blocks]
+		self.nonlinear = [(restrict_coef(coef, rows), [restrict_atom(atom, rows, index) for atom in atoms]) for coef, atoms in law.nonlinear]
+		self._buf = np.zeros(rows.size, dtype=law.dtype)
+		self._work = np.zeros(rows.size, dtype=law.dtype)
+		self._halo = [np.zeros(cols.size, dtype=A.dtype) for _, A, cols in self.blocks]
+
+	def __call__(self, ys: List[np.ndarray], out: np.ndarray):
+		terms = [(coef, *[atom(ys) for atom in atoms]) for coef, atoms in self.nonlinear]
+		lincomb(self._buf, *terms, const=self.const, work=self._work)
+		for (s, A, cols), x in zip(self.blocks, self._halo):
+			np.take(ys[s], cols, out=x) # Halo exchange
+			spmv(A, x, self._buf, accumulate=True)
+		out[self.rows] = self._buf
+
+def restrict_matrix(A: sp.spmatrix, rows: np.ndarray) -> Tuple[sp.csr_matrix, np.ndarray]:
+	''' Rows of an operator, with columns compressed to those it reads '''
+	A = sp.csr_matrix(A)[rows]
+	cols = np.unique(A.indices)
+	return sp.csr_matrix(A[:, cols]), cols
+
+def restrict_coef(c: Any, rows: np.ndarray) -> Any:
+	return c if np.ndim(c) == 0 else np.asarray(c)[rows]
+
+def restrict_atom(atom: Atom, rows: np.ndarray, index: Dict[int, int]) -> Callable[[List[np.ndarray]], np.ndarray]:
+	if isinstance(atom, Op) and atom.name == 'ident':
+		s = index[id(atom.obs)]
+		return lambda ys: ys[s][rows]
+	elif isinstance(atom, Op):
+		s = index[id(atom.obs)]
+		A, c = atom.assemble()
+		A, cols = restrict_matrix(A, rows)
+		c = restrict_coef(c, rows)
+		return lambda ys: A@ys[s][cols] + c
+	elif isinstance(atom, Pointwise):
+		args = [restrict_expr(arg, rows, index) for arg in atom.args]
+		return lambda ys: atom.fun(*[arg(ys) for arg in args])
+	raise ValueError(f'{type(atom).__name__} terms cannot be evaluated by partition')
+
+def unpartitionable(expr: Expr) -> List[str]:
+	''' Names of the atoms of an expression which restrict_atom cannot evaluate by partition ''' 
+	names = []
+	for _, atoms in expr.terms:
+		for atom in atoms:
+			if isinstance(atom, Pointwise):
+				names += [name for arg in atom.args for name in unpartitionable(arg)]
+			elif not isinstance(atom, Op):
+				names.append(type(atom).__name__)
+	return list(dict.fromkeys(names))
+
+def restrict_expr(expr: Expr, rows: np.ndarray, index: Dict[int, int]) -> Callable[[List[np.ndarray]], np.ndarray]:
+	const = restrict_coef(expr.const, rows)
+	terms = [(restrict_coef(coef, rows), [restrict_atom(atom, rows, index) for atom in atoms]) for coef, atoms in expr.terms]
+	def evaluate(ys: List[np.ndarray]) -> np.ndarray:
+		ret = const
+		for coef, atoms in terms:
+			prod = coef
+			for atom in atoms:
+				prod = prod * atom(ys)
+			ret = ret + prod
+		return ret
+	return evaluate
+
+''' Utilities '''
+
+def is_zero(x: Any) -> bool:
+	return np.isscalar(x) and x == 0
+
+def unique(xs: List[Any]) -> List[Any]:
+	''' Unique elements by identity, in order '''
+	return list({id(x): x for x in xs}.values())
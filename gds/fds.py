@@ -1,42 +1,74 @@
 import numpy as np
 from typing import Any, Union, Tuple, Callable, NewType, Iterable, Dict
-from scipy.integrate import DOP853, LSODA
+from scipy.integrate import DOP853, LSODA, OdeSolver
 from abc import ABC, abstractmethod
 import pdb
 from enum import Enum
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing as mp
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu
 import cvxpy as cp
 
 from .types import *
 from .utils import *
 from .system import *
+from .events import *
+from .expr import Expr
 
 ''' Base class: dynamical system on arbitrary finite domain ''' 
 
 class fds(Observable, Steppable):
-	def __init__(self, X: Domain):
+	_registry = None # StateRegistry, when stepped by another object
+	_version = 0 # Bumped whenever the state or operators change
+	_op_version = 0 # Bumped only when the operators (or constraints) change
+	_op_values = 0 # Bumped when only the entries of the operators change, e.g. on reweighting
+	_law = None # Compiled evolution law, when dydt is given as an expression
+	dtype = np.dtype(np.float64) # Precision of the observed state and of the operators acting on it
+
+	def __init__(self, X: Domain, ensemble: int=None, dtype: np.dtype=np.float64):
 		''' 
 		Finite-space dynamical system.
+
+		ensemble: int
+			[optional] Number of ensemble members. The state is then an (ndim, ensemble) array, each column an independent 
+			member (e.g. initial conditions or parameters) which is stepped together with the others. Parameters of shape 
+			(ensemble,) broadcast across members, and per-point ones should be shaped (ndim, 1). Constraints are shared.
+		dtype: np.dtype
+			[default float64] Precision of the state and of the operators acting on it, e.g. float32 to halve the memory 
+			traffic of large or ensemble runs. Only recurrences, convex programs and trajectories may be reduced: the 
+			differential solvers integrate in float64, so a reduced state would be cast on every RHS evaluation.
 		''' 
 		Observable.__init__(self, X)
+		self.dtype = np.dtype(dtype)
 		Steppable.__init__(self, IterationMode.none)
+		self.ensemble = ensemble
+		self.member_shape = () if ensemble is None else (ensemble,)
 
 		self._set_bcs()
 		self.t0 = 0.
 		self.y0_fun = lambda _: 0.
+		self.events = []
 
 	''' Dynamics ''' 
 
 	def set_evolution(self,
-			dydt: Callable[[Time, np.ndarray], np.ndarray]=None, order: int=1, max_step: float=1e-3, solver_args: Dict={},
+			dydt: Union[Callable[[Time, np.ndarray], np.ndarray], Expr]=None, order: int=1, max_step: float=1e-3, solver_args: Dict={},
 			lhs: Callable[[Time, np.ndarray], np.ndarray]=None, cost: Callable[[Time, np.ndarray], float]=None, 
 			map_fun: Callable[[Time, np.ndarray], np.ndarray]=None, dt: float=1.0,
-			traj_t: Iterable[Time]=None, traj_y: Iterable[np.ndarray]=None,
+			traj_t: Iterable[Time]=None, traj_y: Union[Iterable[np.ndarray], str]=None, traj_interp: str='hold',
+			partitions: int=None,
 		): 
 		''' Define evolution law for the dynamics.
 
 		Option 1: As a PDE
-			dydt: Callable[Time]
-				RHS of differential equation [uses LSODA for stiffness detection; falls back to DOP853 if not available]
+			dydt: Union[Callable[Time], Expr]
+				RHS of differential equation [uses LSODA for stiffness detection; falls back to DOP853 if not available].
+				May be given as an expression (see gds.expr), whose linear part is precomputed as a sparse matrix and, 
+				if exact, supplied to the solver as the Jacobian.
+			partitions: int
+				[optional] Evaluate an expression RHS in this many worker processes, each owning a part of the domain. 
+				Worthwhile for large domains, where the RHS outweighs exchanging states through shared memory.
 			order: int
 				[optional] Order of time-difference; if greater than one, automatically creates (order*ndim) state vector
 			max_step: float
@@ -60,32 +92,37 @@ class fds(Observable, Steppable):
 
 		Option 4: As a data-derived trajectory
 			traj_t: Iterable[Time]
-			traj_y: Iterable[np.ndarray]
+				Increasing times of the recorded frames
+			traj_y: Union[Iterable[np.ndarray], str]
+				Recorded frames, or path to a .npy file of shape (len(traj_t), ndim) which is memory-mapped rather than loaded
+			traj_interp: str
+				[default 'hold'] Interpolation between frames; one of 'hold' (most recent frame), 'linear', 'hermite'
 		'''
-		assert oneof([dydt != None, lhs != None, cost != None, map_fun != None, traj_t != None]), 'Exactly one evolution law must be specified'
+		assert oneof([dydt != None, lhs != None, cost != None, map_fun != None, traj_t is not None]), 'Exactly one evolution law must be specified'
 
 		if dydt != None:
 			self.iter_mode = IterationMode.dydt
 			self.dydt_fun = dydt
+			assert not self.reduced, 'Differential equations are integrated in float64; use a reduced dtype with map_fun, lhs/cost or traj_y'
+			assert partitions is None or isinstance(dydt, Expr), 'Only expression laws (see gds.expr) can be partitioned'
+			self.partitions = partitions
+			self._law = dydt.bind(self, partitions=partitions) if isinstance(dydt, Expr) else None
 			self.max_step = max_step
 			self._dt = self.max_step
 			self.order = order
 			self.solver_args = solver_args
-			self.y0 = np.zeros(self.ndim*order)
-			try:
-				self.integrator = LSODA(self.dydt, self.t0, self.y0, np.inf, max_step=max_step, **solver_args)
-			except:
-				print('Failed to use LSODA, falling back to DOP853')
-				self.integrator = DOP853(lambda t, y: self.y0, self.t0, self.y0, np.inf, max_step=max_step, **solver_args)
-				self.integrator.fun = self.dydt
+			self.y0 = np.zeros((self.ndim*order, *self.member_shape))
+			self._dydt_buf = np.zeros(self.y0.size) # Reused across RHS evaluations
+			self.integrator = make_integrator(self.dydt, self.t0, self.y0.ravel(), max_step, self.integrator_args)
 
 		elif lhs != None or cost != None:
+			assert self.ensemble is None, 'Ensembles of convex programs are not supported'
 			if lhs != None:
 				cost = lambda t, y: cp.sum_squares(lhs(t, y))
 			self.iter_mode = IterationMode.cvx
 			self.cost_fun = cost
 			self.solver_args = solver_args
-			self.y0 = np.zeros(self.ndim)
+			self.y0 = np.zeros(self.ndim, dtype=self.dtype)
 			self._t = self.t0
 			self._y = self.y0.copy()
 			self._t_prb = cp.Parameter(nonneg=True)
@@ -98,18 +135,29 @@ class fds(Observable, Steppable):
 		elif map_fun != None:
 			self.iter_mode = IterationMode.map
 			self.map_fun = map_fun
-			self.y0 = np.zeros(self.ndim)
+			self.y0 = np.zeros((self.ndim, *self.member_shape), dtype=self.dtype)
 			self._dt = dt
 			self._t = self.t0
 			self._n = self._t
-			self._y = self.t0.copy()
+			self._y = self.y0.copy()
 
-		elif traj_t != None:
+		elif traj_t is not None:
 			assert traj_t[0] == self.t0, 'Ensure trajectory starts at t=0'
+			assert traj_interp in ('hold', 'linear', 'hermite'), f'Unsupported interpolation: {traj_interp}'
+			if isinstance(traj_y, str):
+				traj_y = np.load(traj_y, mmap_mode='r') # Only the pages in use are resident
+			else:
+				traj_y = np.asarray(traj_y, dtype=self.dtype)
 			self.iter_mode = IterationMode.traj
-			self.traj_t, self.traj_y = traj_t, traj_y
+			self.traj_t, self.traj_y = np.asarray(traj_t, dtype=np.float64), traj_y
+			assert self.traj_y.shape[0] == self.traj_t.size, 'Trajectory times and frames have different lengths'
+			self.traj_interp = traj_interp
 			self._t = self.t0
 			self._i = 0
+			self._traj_buf = np.zeros(self.traj_y.shape[1:], dtype=self.dtype)
+			self.interpolate_traj()
+
+		self.invalidate()
 
 	def set_initial(self, 
 			t0: float=0., 
@@ -119,33 +167,44 @@ class fds(Observable, Steppable):
 			t0: float
 				Starting time
 			y0: Union[Callable[[Point], float], np.ndarray]
-				Function or array of points specifying intial condition.
+				Function or array of points specifying intial condition. In ensemble mode, either may also give per-member
+				values, i.e. the function may return an (ensemble,) array, or the array may be shaped (ndim, ensemble).
 
 		TODO: support for higher-order initial conditions in differential equations.
 		'''
 		assert self.iter_mode != IterationMode.none, 'Use set_evolution() before setting initial conditions'
 		assert self.iter_mode != IterationMode.traj, 'Cannot set initial conditions on trajectory-derived system'
-		if type(y0) is np.ndarray:
-			y0 = lambda x: y0[self.X[x]]
+		values = None
+		if isinstance(y0, np.ndarray):
+			values = y0
+			y0 = lambda x: values[self.X[x]]
 		self.t0 = t0
 		self.y0_fun = y0
 
-		if self.iter_mode is IterationMode.dydt:
-			self.integrator.t = t0
-		elif self.iter_mode is IterationMode.cvx:
+		if self.iter_mode is IterationMode.cvx:
 			self._t = t0
 		elif self.iter_mode is IterationMode.map:
 			self._t = t0
 			self._n = int(t0)
 
-		for x in self.X.keys() - self.X_dirichlet:
-			i, y = self.X[x], y0(x)
-			self.y0[i] = y
+		if values is not None: # Assign all unconstrained points at once
+			free = np.ones(self.ndim, dtype=bool)
+			free[self.dirichlet_indices] = False
+			free = np.flatnonzero(free)
+			self.y0[free] = values[free]
+			if self.iter_mode is IterationMode.cvx or self.iter_mode is IterationMode.map:
+				self._y[free] = values[free]
+		else:
+			for x in self.X.keys() - self.X_dirichlet:
+				i, y = self.X[x], y0(x)
+				self.y0[i] = y
+
+				if self.iter_mode is IterationMode.cvx or self.iter_mode is IterationMode.map:
+					self._y[i] = y
 
-			if self.iter_mode is IterationMode.dydt:
-				self.integrator.y[i] = y
-			elif self.iter_mode is IterationMode.cvx or self.iter_mode is IterationMode.map:
-				self._y[i] = y
+		if self.iter_mode is IterationMode.dydt:
+			self.restart_integrator(t0, self.y0.copy())
+		self.invalidate()
 
 	def set_constraints(self, 
 			dirichlet: BoundaryCondition={}, 
@@ -154,10 +213,12 @@ class fds(Observable, Steppable):
 		):
 		''' Impose constraints. Assumes domain boundaries do not change.
 
-		dirichlet: callable or dictionary
-			Impose fixed values at boundary; either a function (t, x) or function (x) or static lookup dictionary
-		neumann: callable or dictionary:
-			Impose fixed fluxes at boundary; either a function (t, x) or function (x) or static lookup dictionary
+		dirichlet: callable, dictionary or pair
+			Impose fixed values at boundary; either a function (t, x) or function (x) or static lookup dictionary, or a 
+			pair (indices, values) of point indices and their values (or a function (t) giving them), e.g. index sets of 
+			array graphs
+		neumann: callable, dictionary or pair:
+			Impose fixed fluxes at boundary; same forms as dirichlet
 		project: callable
 			Project solutions onto feasible set.
 		''' 
@@ -166,10 +227,12 @@ class fds(Observable, Steppable):
 		
 		self._set_bcs(dirichlet, neumann, project)
 
-		self.y0 = project(replace(self.y0, self.dirichlet_indices, self.dirichlet_values))
+		self.y0 = project(replace(self.y0, self.dirichlet_indices, self.rows(self.dirichlet_values)))
 
 		if self.iter_mode is IterationMode.dydt:
-			self.integrator.y[self.dirichlet_indices - self.ndim] = self.dirichlet_values
+			y = self.shaped(self.integrator.y.copy())
+			y[self.dirichlet_indices - self.ndim] = self.rows(self.dirichlet_values)
+			self.restart_integrator(self.integrator.t, y)
 		elif self.iter_mode is IterationMode.cvx:
 			self._y = self.y0.copy()
 			self._y_cstr = cp.Parameter(self.dirichlet_values.size)
@@ -178,26 +241,38 @@ class fds(Observable, Steppable):
 			self._prb = cp.Problem(self._prb.objective, constr)
 		elif self.iter_mode is IterationMode.map:
 			self._y = self.y0.copy()
+		self.invalidate(operators=True)
 
 	def _set_bcs(self, 
 			dirichlet: BoundaryCondition={}, 
 			neumann: BoundaryCondition={},
 			project: Callable[[np.ndarray], np.ndarray]=lambda x: x,
 		):
-		if isinstance(dirichlet, dict):
+		if isinstance(dirichlet, dict) and len(dirichlet) > 0:
 			dirichlet = dict_fun(dirichlet)
-		if isinstance(neumann, dict):
+		if isinstance(neumann, dict) and len(neumann) > 0:
 			neumann = dict_fun(neumann)
 		self.dirichlet_fun = dirichlet
 		self.neumann_fun = neumann
 		self.project_fun = project
 
 		# Store whether we will require recalculation
-		self.dynamic_dirichlet = fun_ary(dirichlet) > 1 
-		self.dynamic_neumann = fun_ary(neumann) > 1
+		def is_dynamic(bc: BoundaryCondition) -> bool:
+			if isinstance(bc, dict):
+				return False
+			elif isinstance(bc, tuple):
+				return callable(bc[1])
+			return fun_ary(bc) > 1
+		self.dynamic_dirichlet = is_dynamic(dirichlet)
+		self.dynamic_neumann = is_dynamic(neumann)
 
 		def populate(fun: Callable, dynamic: bool) -> Tuple[List, np.ndarray, np.ndarray]:
-			if dynamic:
+			if isinstance(fun, dict): # Empty
+				return [], np.array([], dtype=np.intp), np.array([])
+			elif isinstance(fun, tuple):
+				indices = np.asarray(fun[0], dtype=np.intp)
+				return [self.iX[i] for i in indices], indices, self.indexed_values(fun, indices, 0.)
+			elif dynamic:
 				domain = [x for x in self.X if (fun(0., x) is not None)]
 				indices = np.array([self.X[x] for x in domain], dtype=np.intp)
 				values = np.array([fun(0., x) for x in domain])
@@ -217,19 +292,30 @@ class fds(Observable, Steppable):
 		assert len(intersect) == 0, f'Dirichlet and Neumann conditions overlap on {intersect}'
 
 
+	def add_event(self, event: Event) -> Event:
+		''' Detect an event between integrator steps; see gds.events ''' 
+		assert self.iter_mode is IterationMode.dydt, 'Events are only supported on differential equations'
+		self.events.append(event)
+		return event
+
 	''' Stepping ''' 
 
 	def reset(self):
 		''' Reset the system to initial conditions ''' 
 		assert self.iter_mode != IterationMode.none
+		self.terminated = False
+		for event in self.events:
+			event.reset()
 		if self.iter_mode is IterationMode.dydt:
-			self.set_evolution(dydt=self.dydt_fun, order=self.order, max_step=self.max_step, solver_args=self.solver_args)
+			self.set_evolution(dydt=self.dydt_fun, order=self.order, max_step=self.max_step, solver_args=self.solver_args, partitions=self.partitions)
 		elif self.iter_mode is IterationMode.cvx:
 			self.set_evolution(cost=self.cost_fun, solver_args=self.solver_args)
 		elif self.iter_mode is IterationMode.map:
 			self.set_evolution(map_fun=self.map_fun)
 		elif self.iter_mode is IterationMode.traj:
+			self._t = self.t0
 			self._i = 0
+			self.interpolate_traj()
 
 		if self.iter_mode != IterationMode.traj:
 			self.set_initial(t0=self.t0, y0=self.y0_fun)
@@ -237,6 +323,8 @@ class fds(Observable, Steppable):
 
 	def step(self, dt: float):
 		''' Step the system to t+dt ''' 
+		if self.terminated:
+			return
 		if self.iter_mode is IterationMode.none:
 			raise Exception('Evolution law not specified')
 		elif self.iter_mode is IterationMode.dydt:
@@ -253,27 +341,52 @@ class fds(Observable, Steppable):
 	''' Differential stepping ''' 
 
 	def step_dydt(self, dt: float):
-		self.integrator.t_bound = self.t + dt
-		self.integrator.status = 'running'
+		# Times are the integrator's, rather than self.t, which is that of a driver observing this system (see parareal_fds)
+		self.integrator = set_t_bound(self.integrator, self.integrator.t + dt)
+		for event in self.events:
+			event.prime(self.integrator.t, self.y)
 		while self.integrator.status != 'finished':
+			t0 = self.integrator.t
 			self.integrator.step()
-			self.update_constraints(self.t)
+			self.update_constraints(self.integrator.t)
 			self.apply_constraints()
+			self.invalidate()
+			if self.events and detect_events(self.events, t0, self.integrator.t, self.y, self.dense_output):
+				self.terminated = True
+				break
 
-	def dydt(self, t: Time, y: np.ndarray):
+	def restart_integrator(self, t: Time, y: np.ndarray):
+		''' 
+		Restart the integrator from the given state; the solver does not observe writes to integrator.y between steps. 
+		Events are primed on the new state, so that a jump is not detected as a crossing.
+		''' 
+		self.integrator = make_integrator(self.dydt, t, np.ravel(y), self.max_step, self.integrator_args)
+		self.invalidate()
+		for event in self.events:
+			event.reprime(t, self.shaped(self.integrator.y)[:self.ndim])
+
+	def dense_output(self) -> Callable[[Time], np.ndarray]:
+		''' Interpolant of the observable over the last integrator step ''' 
+		sol = self.integrator.dense_output()
+		return lambda t: self.shaped(sol(t))[:self.ndim]
+
+	def dydt(self, t: Time, y: np.ndarray, out: np.ndarray=None):
+		''' Full RHS including higher-order terms; written into out (or an internal buffer) ''' 
 		self._dt = self.integrator.t - t
 		self.update_constraints(t)
 		n, order = self.ndim, self.order
-		ret = np.zeros_like(y)
+		flat = self._dydt_buf if out is None else out
+		if out is None and order == 1 and self.partitions is not None:
+			flat = self._law.buffer() # Workers write the derivative where the solver reads it
+		y, ret = self.shaped(y), self.shaped(flat)
 		for i in range(order-1):
 			ret[n*i:n*(i+1)] = y[n*(i+1):n*(i+2)]
-		if self.order > 1:
-			diff = self.dydt_fun(t, y[n*(order-1):])
+		if self._law is not None:
+			self._law(t, y[n*(order-1):], out=ret[n*(order-1):])
 		else:
-			diff = self.dydt_fun(t, y)
-		diff[self.dirichlet_indices] = 0. # Do not modify constrained nodes
-		ret[n*(order-1):] = diff
-		return ret
+			ret[n*(order-1):] = self.dydt_fun(t, y[n*(order-1):])
+		ret[n*(order-1) + self.dirichlet_indices] = 0. # Do not modify constrained nodes
+		return flat
 
 	''' Convex stepping ''' 
 
@@ -292,8 +405,9 @@ class fds(Observable, Steppable):
 		self.rebuild_cvx() # TODO: see if there are other ways to pass time-varying parameters explicitly...
 		self._prb.solve(warm_start=True, **self.solver_args)
 		assert self._prb.status == 'optimal', f'CVXPY solve unsuccessful, status is: {self._prb.status}'
-		self._y = self._y_prb.value
+		self._y = self._y_prb.value.astype(self.dtype, copy=False)
 		self.apply_constraints()
+		self.invalidate()
 
 	''' Discrete stepping ''' 
 
@@ -302,61 +416,206 @@ class fds(Observable, Steppable):
 		if (self._t - self._n) >= self._dt:
 			self._n = self._t
 			self.update_constraints(self.t)
-			self._y = self.map_fun(self.y) 
+			self._y = np.asarray(self.map_fun(self.y), dtype=self.dtype)
 			self.apply_constraints()
-			self._y[self.dirichlet_indices] = self.dirichlet_values
+			self._y[self.dirichlet_indices] = self.rows(self.dirichlet_values)
+			self.invalidate()
 
 	''' Trajectory stepping ''' 
 
 	def step_traj(self, dt: float):
 		self._t += dt
-		if self._t >= self.traj_t[self._n+1]:
-			self._n += 1
+		self.interpolate_traj()
+		self.invalidate()
+
+	def interpolate_traj(self):
+		''' Locate the current frame by binary search on traj_t and read (or interpolate) the state ''' 
+		ts, n = self.traj_t, self.traj_t.size
+		self._i = i = min(max(np.searchsorted(ts, self._t, side='right') - 1, 0), n - 1)
+		if i == n - 1 or self.traj_interp == 'hold':
+			self._y = self.traj_y[i] # View; no copy is made of memory-mapped frames
+			return
+		h = ts[i+1] - ts[i]
+		s = (self._t - ts[i]) / h
+		y0, y1, ret = self.traj_y[i], self.traj_y[i+1], self._traj_buf
+		if self.traj_interp == 'linear':
+			np.multiply(y0, 1-s, out=ret)
+			ret += s * y1
+		else:
+			# Cubic Hermite with finite-difference tangents, which only touches frames i-1..i+2
+			m0 = (y1 - self.traj_y[i-1]) / (ts[i+1] - ts[i-1]) if i > 0 else (y1 - y0) / h
+			m1 = (self.traj_y[i+2] - y0) / (ts[i+2] - ts[i]) if i < n - 2 else (y1 - y0) / h
+			s2, s3 = s*s, s*s*s
+			np.multiply(y0, 2*s3 - 3*s2 + 1, out=ret)
+			ret += (s3 - 2*s2 + s) * h * m0
+			ret += (-2*s3 + 3*s2) * y1
+			ret += (s3 - s2) * h * m1
+		self._y = ret
 
 	''' Constaint setting '''
 
 	def update_constraints(self, t: float):
 		''' Update the possibly time-varying state constraints ''' 
-		if self.dynamic_dirichlet:
+		if self.dynamic_dirichlet and isinstance(self.dirichlet_fun, tuple):
+			self.dirichlet_values = self.indexed_values(self.dirichlet_fun, self.dirichlet_indices, t)
+			if self.iter_mode is IterationMode.cvx:
+				self._y_cstr.value = self.dirichlet_values
+		elif self.dynamic_dirichlet:
 			self.dirichlet_values = np.array([self.dirichlet_fun(t, x) for x in self.X_dirichlet])
 			if self.iter_mode is IterationMode.cvx:
 				self._y_cstr.value = self.dirichlet_values
-		if self.dynamic_neumann:
+		if self.dynamic_neumann and isinstance(self.neumann_fun, tuple):
+			self.neumann_values = self.indexed_values(self.neumann_fun, self.neumann_indices, t)
+		elif self.dynamic_neumann:
 			self.neumann_values = np.array([self.neumann_fun(t, x) for x in self.X_neumann])
 
+	@staticmethod
+	def indexed_values(bc: Tuple[np.ndarray, Any], indices: np.ndarray, t: float) -> np.ndarray:
+		''' Values of a constraint given as (indices, values) at time t; scalars apply to all indices ''' 
+		values = np.asarray(bc[1](t) if callable(bc[1]) else bc[1], dtype=np.float64)
+		return np.full(indices.size, values) if values.ndim == 0 else values
+
 	def apply_constraints(self):
 		''' Set the state constraints ''' 
 		if self.iter_mode is IterationMode.dydt:
-			self.integrator.y[self.dirichlet_indices - self.ndim] = self.dirichlet_values
-			self.integrator.y = self.project_fun(self.integrator.y)
+			y = self.shaped(self.integrator.y)
+			y[self.dirichlet_indices - self.ndim] = self.rows(self.dirichlet_values)
+			self.integrator.y = np.ravel(self.project_fun(y))
 		elif self.iter_mode is IterationMode.cvx:
 			# No need to set boundary conditions since guaranteed by solution
 			self._y = self.project_fun(self._y)
 		elif self.iter_mode is IterationMode.map:
-			self._y[self.dirichlet_indices] = self.dirichlet_values
+			self._y[self.dirichlet_indices] = self.rows(self.dirichlet_values)
 			self._y = self.project_fun(self._y)
 
+	''' Ensembles ''' 
+
+	def shaped(self, y: np.ndarray) -> np.ndarray:
+		''' View of a flat state vector as (points, members) in ensemble mode ''' 
+		return y if self.ensemble is None else y.reshape(-1, self.ensemble)
+
+	def rows(self, values: np.ndarray) -> np.ndarray:
+		''' Per-point values, shaped for assignment to rows of the state ''' 
+		return values if self.ensemble is None else values[:, None]
+
+	''' Domain changes ''' 
+
+	def remap_points(self, src: np.ndarray, values: Any=0.):
+		''' 
+		Carry the state over to a new indexing of the domain, once self.X has been updated: src gives the previous index 
+		of each point, or -1 for new points, which take the given values (unless constrained). Constraints are carried 
+		over likewise and evaluated on the new points, and the integrator restarts from the carried state.
+		''' 
+		assert self.iter_mode in (IterationMode.none, IterationMode.dydt, IterationMode.map), 'Only differential equations and recurrences support changes of domain'
+		assert len(self.events) == 0, 'Events do not support changes of domain'
+		n_old, n = self.ndim, src.size
+		kept = src >= 0
+		inv = np.full(n_old, -1, dtype=np.intp)
+		inv[src[kept]] = np.flatnonzero(kept)
+		added = np.flatnonzero(~kept)
+		t = self.t0 if self.iter_mode is IterationMode.none else self.t
+		self.ndim = n
+		self.dirichlet_fun, self.X_dirichlet, self.dirichlet_indices, self.dirichlet_values = self.remap_constraint(
+			self.dirichlet_fun, self.X_dirichlet, self.dirichlet_indices, self.dirichlet_values, self.dynamic_dirichlet, inv, added, t
+		)
+		self.neumann_fun, self.X_neumann, self.neumann_indices, self.neumann_values = self.remap_constraint(
+			self.neumann_fun, self.X_neumann, self.neumann_indices, self.neumann_values, self.dynamic_neumann, inv, added, t
+		)
+		values = np.asarray(values)
+		if self.ensemble is not None and values.ndim == 1:
+			values = values[:, None]
+
+		def carry(y: np.ndarray) -> np.ndarray:
+			y = self.shaped(y)
+			blocks = y.reshape((-1, n_old) + y.shape[1:]) # One block per order of the time-difference
+			ret = np.zeros((blocks.shape[0], n) + blocks.shape[2:], dtype=y.dtype)
+			ret[:, kept] = blocks[:, src[kept]]
+			ret[0, added] = values
+			ret = ret.reshape((-1,) + blocks.shape[2:])
+			ret[self.dirichlet_indices - n] = self.rows(self.dirichlet_values)
+			return ret
+
+		if self.iter_mode is IterationMode.dydt:
+			self.y0 = carry(self.y0)
+			y = carry(self.integrator.y)
+			self._dydt_buf = np.zeros(self.y0.size)
+			self.restart_integrator(self.integrator.t, y)
+		elif self.iter_mode is IterationMode.map:
+			self.y0 = carry(self.y0)
+			self._y = carry(self._y)
+		self.invalidate(operators=True)
+
+	def remap_constraint(self, fun: BoundaryCondition, domain: List[Point], indices: np.ndarray, values: np.ndarray, dynamic: bool,
+			inv: np.ndarray, added: np.ndarray, t: float) -> Tuple[BoundaryCondition, List[Point], np.ndarray, np.ndarray]:
+		''' A constraint's condition, domain, indices and values after a change of domain (see remap_points) ''' 
+		new = inv[indices]
+		keep = new >= 0
+		domain = [x for x, k in zip(domain, keep) if k]
+		indices, values = new[keep], values[keep]
+		if isinstance(fun, tuple):
+			assert keep.all() or not callable(fun[1]), 'Points constrained by a function of time cannot be removed'
+			fun = (indices, fun[1] if callable(fun[1]) or np.ndim(fun[1]) == 0 else values)
+		elif not isinstance(fun, dict): # Evaluate on the new points
+			xs = [self.iX[i] for i in added]
+			vs = [fun(t, x) if dynamic else fun(x) for x in xs]
+			new = [(x, i, v) for x, i, v in zip(xs, added, vs) if v is not None]
+			domain = domain + [x for x, _, _ in new]
+			indices = np.concatenate((indices, np.array([i for _, i, _ in new], dtype=np.intp)))
+			values = np.concatenate((values, np.array([v for _, _, v in new], dtype=np.float64)))
+		return fun, domain, indices, values
+
+	''' Precision ''' 
+
+	@property
+	def reduced(self) -> bool:
+		''' Whether the state is held in less than the float64 precision of the differential solvers ''' 
+		return self.dtype != np.float64
+
+	''' Versioning ''' 
+
+	def invalidate(self, operators: bool=False, values: bool=False):
+		''' 
+		Mark the state or operators as changed, invalidating memoized operator results. With values, only the operators' 
+		entries changed and not their sparsity, so compiled laws refill their matrices in place rather than reassembling.
+		''' 
+		self._version += 1
+		if operators:
+			self._op_version += 1
+		if values:
+			self._op_values += 1
+
+	@property
+	def state_version(self) -> Tuple[int, int]:
+		''' Changes whenever the observed state or the operators acting on it change ''' 
+		return (self._version, self._registry.version if self._registry is not None else 0)
+
 	''' Properties ''' 
 
 	@property
+	def integrator_args(self) -> Dict:
+		''' Solver arguments, including the Jacobian of a compiled evolution law if it is exact and none was given ''' 
+		if self._law is not None and self.order == 1 and self.ensemble is None and 'jac' not in self.solver_args and self._law.exact:
+			return {'jac': self._law.dense_jacobian, **self.solver_args}
+		return self.solver_args
+
+	@bound_state
 	def y(self):
+		''' The observed state; a plain attribute holding a view of the shared state when bound to a StateRegistry ''' 
 		if self.iter_mode is IterationMode.none:
-			return np.zeros(self.ndim)
+			return np.zeros((self.ndim, *self.member_shape), dtype=self.dtype)
 		elif self.iter_mode is IterationMode.dydt:
-			return self.integrator.y[:self.ndim]
-		elif self.iter_mode is IterationMode.cvx or self.iter_mode is IterationMode.map:
+			return self.shaped(self.integrator.y)[:self.ndim]
+		elif self.iter_mode is IterationMode.cvx or self.iter_mode is IterationMode.map or self.iter_mode is IterationMode.traj:
 			return self._y
-		elif self.iter_mode is IterationMode.traj:
-			return self.traj_y[self._n]
 
 	@property
 	def t(self):
-		if self.iter_mode is IterationMode.dydt:
+		if self._registry is not None:
+			return self._registry.t
+		elif self.iter_mode is IterationMode.dydt:
 			return self.integrator.t
-		elif self.iter_mode is IterationMode.cvx or self.iter_mode is IterationMode.map:
+		elif self.iter_mode is IterationMode.cvx or self.iter_mode is IterationMode.map or self.iter_mode is IterationMode.traj:
 			return self._t
-		elif self.iter_mode is IterationMode.traj:
-			return self.traj_t[self._n]
 
 	@property 
 	def dt(self):
@@ -371,16 +630,73 @@ class fds(Observable, Steppable):
 		return System(self, {name: self})
 
 
+''' Integrators ''' 
+
+def make_integrator(fun: Callable[[Time, np.ndarray], np.ndarray], t0: Time, y0: np.ndarray, max_step: float, solver_args: Dict, 
+		t_bound: Time=np.inf) -> OdeSolver:
+	''' LSODA for stiffness detection, falling back to DOP853 if not available ''' 
+	try:
+		integrator = LSODA(fun, t0, y0, t_bound, max_step=max_step, **solver_args)
+		integrator.remake = lambda t, y, t_bound: make_integrator(fun, t, y, max_step, solver_args, t_bound) # See set_t_bound
+		return integrator
+	except:
+		print('Failed to use LSODA, falling back to DOP853')
+		integrator = DOP853(lambda t, y: y0, t0, y0, t_bound, max_step=max_step, **solver_args)
+		integrator.fun = lambda t, y: fun(t, y).copy() # DOP853 keeps references to past evaluations
+		return integrator
+
+def lsoda_rwork(integrator: LSODA) -> np.ndarray:
+	''' LSODA's real work array, whose first entry is the critical time it will not step over; None if scipy no longer exposes it ''' 
+	rwork = getattr(getattr(getattr(integrator, '_lsoda_solver', None), '_integrator', None), 'rwork', None)
+	return rwork if isinstance(rwork, np.ndarray) and rwork.size > 0 else None
+
+def set_t_bound(integrator: OdeSolver, t_bound: Time) -> OdeSolver:
+	''' 
+	Integrate up to, and not past, t_bound; returns the integrator to step. LSODA only observes the bound through its 
+	critical time, held privately by scipy's wrapper; if that cannot be reached, LSODA is restarted from its current state 
+	with the new bound (losing its step size and order history).
+	''' 
+	if isinstance(integrator, LSODA):
+		rwork = lsoda_rwork(integrator)
+		if rwork is None:
+			return integrator.remake(integrator.t, integrator.y, t_bound)
+		rwork[0] = t_bound
+	integrator.t_bound = t_bound
+	integrator.status = 'running'
+	return integrator
+
 ''' Coupled dynamical systems on the same domain ''' 
 
 class coupled_fds(Steppable):
 	''' Coupling multiple fds objects in time, including those with different evolution laws.
 	''' 
-	def __init__(self, *systems: Tuple[fds]):
+	def __init__(self, *systems: Tuple[fds], splitting: str=None, workers: int=None, depends: Dict[fds, Iterable[fds]]=None):
+		''' 
+		splitting: str
+			[optional] Operator splitting scheme, one of 'lie' or 'strang'. By default all continuous systems are integrated 
+			monolithically with the smallest max_step among them. With splitting, each continuous system advances with its 
+			own integrator and step size, and systems synchronize only at the coupling times passed to step().
+		workers: int
+			[optional] Evaluate independent subsystem updates concurrently on a pool of this many threads: the right-hand 
+			sides of monolithically integrated systems, and the discrete systems of each level. Worthwhile when updates are 
+			dominated by sparse products and solver calls, which release the GIL. Operator calls on any one field are 
+			serialized by its lock (see memoized). Split continuous systems are always stepped one after another.
+		depends: Dict[fds, Iterable[fds]]
+			[optional] Systems whose updated state each system reads within a step. Systems are updated in dependency 
+			order, and discrete ones at the same level concurrently (trajectories after the others). Split continuous systems at the same level advance 
+			one after another, each reading the others' state from the start of the level, so that results do not depend 
+			on the order (or timing) of their updates. Without it, discrete systems are independent (each reads the others' 
+			state from the previous step) and split continuous systems advance sequentially.
+		''' 
 		assert len(systems) >= 1, 'Pass one or more systems to couple'
 		assert all([sys.t == 0. for sys in systems]), 'All systems must be at zero-time initial conditions.'
 		assert all([sys.iter_mode != IterationMode.none for sys in systems]), 'All systems must have evolution laws.'
+		assert splitting in (None, 'lie', 'strang'), f'Unsupported splitting: {splitting}'
 		self.t0 = 0.
+		self.splitting = splitting
+		self.split_t = self.t0
+		self.workers = workers
+		self._executor = None
 		for sys in systems:
 			sys.uuid = shortuuid.uuid() # Hacky..
 		self.systems = {
@@ -390,52 +706,112 @@ class coupled_fds(Steppable):
 			IterationMode.traj: list(filter(lambda sys: sys.iter_mode is IterationMode.traj, systems)),
 		}
 
+		# Update order
+		discrete = self.systems[IterationMode.cvx] + self.systems[IterationMode.map] + self.systems[IterationMode.traj]
+		continuous = self.systems[IterationMode.dydt]
+		if depends is None:
+			levels = [discrete]
+			self.split_levels = [[sys] for sys in continuous]
+		else:
+			levels = topological_levels(discrete, depends)
+			self.split_levels = topological_levels(continuous, depends)
+		# Trajectories expose their frames directly rather than committed copies, so step after the systems which may read them
+		traj = lambda sys: sys.iter_mode is IterationMode.traj
+		self.discrete_levels = [part for level in levels for part in ([s for s in level if not traj(s)], list(filter(traj, level))) if part]
+
 		# Common state for discrete systems
 		self.discrete_t = self.t0 
 		self.discrete_y = {
-			sys.uuid: sys.y0 for sys in self.systems[IterationMode.cvx] + self.systems[IterationMode.map]
+			sys.uuid: sys.y0.copy() for sys in self.systems[IterationMode.cvx] + self.systems[IterationMode.map]
 		}
 
-		# Common state for continuous systems
-		self.has_integrator = len(self.systems[IterationMode.dydt]) > 0
+		# Common state for continuous systems; with splitting, each system keeps its own integrator
+		self.has_integrator = len(self.systems[IterationMode.dydt]) > 0 and splitting is None
 		if self.has_integrator:
 			dydt_systems = self.systems[IterationMode.dydt]
 			self.dydt_max_step = min([sys.max_step for sys in dydt_systems])
 			self.dydt_solver_args = merge_dicts([sys.solver_args for sys in dydt_systems])
-			self.dydt_y0 = np.concatenate([sys.y0 for sys in self.systems[IterationMode.dydt]])
-			try:
-				self.integrator = LSODA(self.dydt, self.t0, self.dydt_y0, np.inf, max_step=self.dydt_max_step, **self.dydt_solver_args)
-			except:
-				print('Failed to use LSODA, falling back to DOP853')
-				self.integrator = DOP853(lambda t, y: self.dydt_y0, self.t0, self.dydt_y0, np.inf, max_step=self.dydt_max_step, **self.dydt_solver_args)
-				self.integrator.fun = self.dydt
-
-		# Attach views to state
-		last_index = 0
-		for sys in self.systems[IterationMode.dydt]:
-			sys.view = slice(last_index, last_index + sys.y0.size)
-			attach_dyn_props(sys, {'y': lambda sys: self.integrator.y[sys.view], 't': lambda _: self.t})
-			last_index += sys.y0.size
-
-		for sys in self.systems[IterationMode.cvx]:
-			attach_dyn_props(sys, {'y': lambda sys: self.discrete_y[sys.uuid], 't': lambda _: self.t})
+			self.dydt_y0 = np.concatenate([sys.y0.ravel() for sys in self.systems[IterationMode.dydt]])
+			self._dydt_buf = np.zeros_like(self.dydt_y0) # Subsystems write their derivatives into their views of this buffer
+			self.integrator = make_integrator(self.dydt, self.t0, self.dydt_y0, self.dydt_max_step, self.dydt_solver_args)
+			# Committed state, copied from the integrator after each of its steps: subsystems observe fixed views of it, since 
+			# the solver replaces its own state array as it steps
+			self.dydt_y = self.dydt_y0.copy()
+
+		# Bind observables to views of the common state
+		self.registry = StateRegistry(self)
+		if self.has_integrator:
+			last_index = 0
+			for sys in self.systems[IterationMode.dydt]:
+				sys.view = slice(last_index, last_index + sys.y0.size)
+				self.registry.bind(sys, sys.shaped(self.dydt_y[sys.view])[:sys.ndim])
+				last_index += sys.y0.size
 
-		for sys in self.systems[IterationMode.map]:
-			attach_dyn_props(sys, {'y': lambda sys: self.discrete_y[sys.uuid], 't': lambda _: self.t})
+		for sys in self.systems[IterationMode.cvx] + self.systems[IterationMode.map]:
+			self.registry.bind(sys, self.discrete_y[sys.uuid])
 
 
 	''' Stepping ''' 
 
 	def step(self, dt: float):
-		if self.has_integrator:
+		if self.terminated:
+			return
+		if self.splitting is not None:
+			self.step_split(dt)
+		elif self.has_integrator:
 			self.step_continuous(dt)
 		else:
 			self.step_discrete(dt)
 
+	def step_split(self, dt: float):
+		''' Advance each continuous system in turn over the coupling interval, holding the others fixed ''' 
+		continuous, levels = self.systems[IterationMode.dydt], self.split_levels
+		if self.splitting == 'lie' or len(levels) <= 1:
+			for level in levels:
+				self.step_level(dt, level)
+		elif self.splitting == 'strang':
+			for level in levels[:-1]:
+				self.step_level(dt/2, level)
+			self.step_level(dt, levels[-1])
+			for level in reversed(levels[:-1]):
+				self.step_level(dt/2, level)
+		self.step_discrete(dt)
+		self.split_t += dt
+		self.terminated = any(sys.terminated for sys in continuous)
+
+	def step_level(self, dt: float, level: List[fds]):
+		''' 
+		Advance split systems which do not read each other's updated state. Each steps with the others bound to their 
+		state at the start of the level; they are not stepped concurrently, since each would read the others' integrators 
+		(and memoized operators) mid-step.
+		''' 
+		if len(level) <= 1:
+			for sys in level:
+				sys.step(dt)
+			return
+		frozen = StateRegistry(self)
+		start = {sys.uuid: sys.shaped(sys.integrator.y)[:sys.ndim].copy() for sys in level}
+		try:
+			for sys in level:
+				for peer in level:
+					if peer is not sys:
+						frozen.bind(peer, start[peer.uuid])
+				StateRegistry.unbind(sys)
+				sys.invalidate()
+				sys.step(dt)
+		finally:
+			for sys in level:
+				StateRegistry.unbind(sys)
+				sys.invalidate()
+
 	def step_continuous(self, dt: float):
-		self.integrator.t_bound = self.t + dt
-		self.integrator.status = 'running'
+		self.integrator = set_t_bound(self.integrator, self.t + dt)
+		evented = [sys for sys in self.systems[IterationMode.dydt] if sys.events]
+		for sys in evented:
+			for event in sys.events:
+				event.prime(self.t, sys.shaped(self.integrator.y[sys.view])[:sys.ndim])
 		while self.integrator.status != 'finished':
+			t0 = self.t
 			self.integrator.step()
 			# Make final step on discrete systems if necessary
 			if self.integrator.t > self.discrete_t:
@@ -443,35 +819,70 @@ class coupled_fds(Steppable):
 			# Apply constraints to continuous subsystems
 			for sys in self.systems[IterationMode.dydt]:
 				sys.update_constraints(self.integrator.t)
-				self.integrator.y[sys.view][sys.dirichlet_indices - sys.ndim] = sys.dirichlet_values
-				self.integrator.y[sys.view] = sys.project_fun(self.integrator.y[sys.view])
+				y = sys.shaped(self.integrator.y[sys.view])
+				y[sys.dirichlet_indices - sys.ndim] = sys.rows(sys.dirichlet_values)
+				self.integrator.y[sys.view] = np.ravel(sys.project_fun(y))
+			np.copyto(self.dydt_y, self.integrator.y)
+			self.registry.invalidate()
+			# Detect events on continuous subsystems
+			if evented:
+				sol = lazy(self.integrator.dense_output)
+				for sys in evented:
+					dense = lambda sys=sys: (lambda t: sys.shaped(sol()(t)[sys.view])[:sys.ndim])
+					self.terminated |= detect_events(sys.events, t0, self.t, sys.shaped(self.integrator.y[sys.view])[:sys.ndim], dense)
+				if self.terminated:
+					break
 
 	def step_discrete(self, dt: float):
-		for sys in self.systems[IterationMode.cvx]:
-			# sys.rebuild_cvx()
-			sys.step(dt)
-		for sys in self.systems[IterationMode.map]:
-			sys.step(dt)
-		for sys in self.systems[IterationMode.traj]:
-			sys.step(dt)
-		for sys in self.systems[IterationMode.cvx]:
-			np.copyto(self.discrete_y[sys.uuid], sys._y)
-		for sys in self.systems[IterationMode.map]:
-			np.copyto(self.discrete_y[sys.uuid], sys._y)
+		for level in self.discrete_levels:
+			self.map_systems(lambda sys: sys.step(dt), level)
+			# Publish this level's state to the levels which depend on it
+			for sys in level:
+				if sys.iter_mode is IterationMode.cvx or sys.iter_mode is IterationMode.map:
+					np.copyto(self.discrete_y[sys.uuid], sys._y)
+					self.registry.invalidate()
 		self.discrete_t += dt
 
 	def dydt(self, t: Time, y: np.ndarray):
 		self.step_discrete(t - self.discrete_t) # Interleave discrete system with continuous one
-		return np.concatenate([sys.dydt(t, y[sys.view]) for sys in self.systems[IterationMode.dydt]])
+		# Right-hand sides read the committed state and write disjoint slices, so are always independent
+		self.map_systems(lambda sys: sys.dydt(t, y[sys.view], out=self._dydt_buf[sys.view]), self.systems[IterationMode.dydt])
+		return self._dydt_buf
+
+	def map_systems(self, fun: Callable[[fds], Any], systems: List[fds]):
+		''' Apply an update to each system, concurrently if a thread pool was requested ''' 
+		if self.workers is None or len(systems) <= 1:
+			for sys in systems:
+				fun(sys)
+		else:
+			if self._executor is None:
+				self._executor = ThreadPoolExecutor(max_workers=self.workers)
+			for _ in self._executor.map(fun, systems): # Propagate exceptions
+				pass
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['_executor'] = None # Thread pools cannot be pickled; recreated on demand
+		return state
 
 	def reset(self):
+		self.terminated = False
+		for sys in self.systems[IterationMode.dydt]:
+			for event in sys.events:
+				event.reset()
 		if self.has_integrator:
-			self.integrator = LSODA(self.dydt, self.t0, self.dydt_y0, np.inf, max_step=self.dydt_max_step, **self.dydt_solver_args)
+			self.integrator = make_integrator(self.dydt, self.t0, self.dydt_y0, self.dydt_max_step, self.dydt_solver_args)
+			np.copyto(self.dydt_y, self.dydt_y0)
+		elif self.splitting is not None:
+			self.split_t = self.t0
+			for sys in self.systems[IterationMode.dydt]:
+				sys.reset()
 		for sys in self.systems[IterationMode.cvx] + self.systems[IterationMode.map]:
 			sys.reset()
-			self.discrete_y[sys.uuid] = sys._y.copy()
+			np.copyto(self.discrete_y[sys.uuid], sys._y)
 		for sys in self.systems[IterationMode.traj]:
 			sys.reset()
+		self.registry.invalidate()
 
 	''' Observation ''' 
 
@@ -482,12 +893,189 @@ class coupled_fds(Steppable):
 	def t(self):
 		if self.has_integrator:
 			return self.integrator.t
+		elif self.splitting is not None:
+			return self.split_t
 		else:
 			return self.discrete_t
 
 
-def couple(observables: Dict[str, Observable]) -> System:
-	''' Couple multiple observables, stepping those which can be together '''
+def couple(observables: Dict[str, Observable], **kwargs) -> System:
+	''' Couple multiple observables, stepping those which can be together; see coupled_fds for options '''
+	steppables = [obs for obs in observables.values() if isinstance(obs, Steppable)] 
+	stepper = coupled_fds(*steppables, **kwargs)
+	return System(stepper, observables)
+
+''' Parallel-in-time integration ''' 
+
+class parareal_fds(Steppable):
+	''' Parareal integration of a differential system: windows of time slices are integrated concurrently, iterating to convergence.
+	''' 
+	def __init__(self, sys: fds, slices: int=8, workers: int=None, coarse: str='rk4', coarse_steps: int=1, iters: int=None, tol: float=1e-6):
+		''' 
+		Each call to step(dt) is served from a window of slices of length dt, computed when the previous one is used up. 
+		A cheap coarse propagator predicts the window serially; the system's own solver (the fine propagator) then 
+		integrates all slices concurrently from the predicted states, and the coarse propagator corrects them, until 
+		successive iterates agree. Wall-clock time drops by about slices / iterations for long runs on many cores.
+
+		slices: int
+			[default 8] Time slices per window, integrated concurrently by the fine propagator
+		workers: int
+			[optional] Fine propagators run in a pool of this many forked processes, which inherit the system as it is 
+			when the pool starts; by default they run in this process
+		coarse: str
+			[default 'rk4'] Coarse propagator, one of 'rk4' (explicit, for non-stiff laws) or 'implicit' (linearly-implicit
+			Euler with the Jacobian of a compiled law, stable on stiff diffusion)
+		coarse_steps: int
+			[default 1] Coarse steps per slice
+		iters: int
+			[optional] Maximum Parareal iterations per window; by default the number of slices, after which the result 
+			is that of the fine propagator alone
+		tol: float
+			[default 1e-6] Convergence threshold on the largest change of the slice states between iterations, relative to 
+			their magnitude
+		''' 
+		assert sys.iter_mode is IterationMode.dydt, 'Parareal integrates differential systems'
+		assert not sys.events, 'Events are not supported by Parareal integration'
+		assert coarse in ('rk4', 'implicit'), f'Unsupported coarse propagator: {coarse}'
+		assert coarse == 'rk4' or (sys._law is not None and sys.order == 1 and sys.ensemble is None), 'Implicit coarse propagation needs a compiled first-order law'
+		Steppable.__init__(self, IterationMode.dydt)
+		self.system = sys
+		self.slices = slices
+		self.workers = workers
+		self.coarse = coarse
+		self.coarse_steps = coarse_steps
+		self.iters = slices if iters is None else iters
+		self.tol = tol
+		self.t0 = sys.t
+		self.y0 = sys.integrator.y.copy()
+		self.iterations = [] # Iterations taken by each window
+		self._executor = None
+		self._factor = None # (step, factorization) of the implicit coarse propagator
+		self.registry = StateRegistry(self)
+		self.reset()
+
+	''' Stepping ''' 
+
+	def step(self, dt: float):
+		if self._i + 1 >= len(self._window) or not np.isclose(dt, self._window_dt):
+			self.solve_window(self._window_t[self._i], self._window[self._i], dt)
+		self._i += 1
+		self.bind()
+
+	def solve_window(self, t0: Time, y0: np.ndarray, dt: float):
+		''' Parareal iteration over the next slices; slice k is exact after k iterations, so only later slices are refined ''' 
+		n = self.slices
+		T = t0 + dt * np.arange(n + 1)
+		U = np.empty((n + 1, y0.size))
+		U[0] = y0
+		G = np.empty((n, y0.size)) # Coarse predictions from the current iterate
+		for k in range(n):
+			G[k] = self.propagate_coarse(T[k], U[k], T[k+1])
+			U[k+1] = G[k]
+		for it in range(self.iters):
+			F = self.propagate_fine(T[it:n], U[it:n], T[it+1:])
+			prev = U.copy()
+			for k in range(it, n):
+				g = self.propagate_coarse(T[k], U[k], T[k+1])
+				U[k+1] = g + F[k-it] - G[k]
+				G[k] = g
+			if np.max(np.abs(U - prev)) <= self.tol * max(1., np.max(np.abs(U))):
+				break
+		self.iterations.append(it + 1)
+		self._window_t, self._window, self._window_dt, self._i = T, U, dt, 0
+
+	def propagate_fine(self, t0: np.ndarray, y0: np.ndarray, t1: np.ndarray) -> List[np.ndarray]:
+		''' The system's solver over each slice ''' 
+		if self.workers is None:
+			return [parareal_fine(self.system, a, y, b) for a, y, b in zip(t0, y0, t1)]
+		if self._executor is None:
+			_parareal_systems[id(self)] = self.system # Inherited by the forked workers
+			self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context('fork'))
+		return list(self._executor.map(parareal_worker, [id(self)] * len(t0), t0, y0, t1))
+
+	def propagate_coarse(self, t0: Time, y0: np.ndarray, t1: Time) -> np.ndarray:
+		''' Cheap fixed-step approximation of the system over a slice ''' 
+		sys, h = self.system, (t1 - t0) / self.coarse_steps
+		y, t = y0.copy(), t0
+
+		def dydt(t: Time, y: np.ndarray, out: np.ndarray):
+			self.registry.bind(sys, sys.shaped(y)[:sys.ndim]) # Laws reading sys.y (or operators' default arguments) see the stage
+			return sys.dydt(t, y, out=out)
+
+		if self.coarse == 'implicit':
+			version = (sys._op_version, sys._op_values)
+			if self._factor is None or not np.isclose(self._factor[0], h) or self._factor[2] != version:
+				J = sys._law.jacobian()
+				self._factor = (h, splu(sp.csc_matrix(sp.identity(J.shape[0]) - h*J, dtype=np.float64)), version)
+			f = np.empty_like(y)
+		else:
+			k = np.empty((4, y.size))
+		for _ in range(self.coarse_steps):
+			if self.coarse == 'implicit':
+				dydt(t, y, f)
+				y += h * self._factor[1].solve(f)
+			else:
+				dydt(t, y, k[0])
+				dydt(t + h/2, y + h/2 * k[0], k[1])
+				dydt(t + h/2, y + h/2 * k[1], k[2])
+				dydt(t + h, y + h * k[2], k[3])
+				y += h/6 * (k[0] + 2*k[1] + 2*k[2] + k[3])
+			t += h
+			sys.update_constraints(t)
+			z = sys.shaped(y)
+			z[sys.dirichlet_indices - sys.ndim] = sys.rows(sys.dirichlet_values)
+			y = np.ravel(sys.project_fun(z)).astype(np.float64, copy=True)
+		return y
+
+	def bind(self):
+		sys = self.system
+		self.registry.bind(sys, sys.shaped(self._window[self._i])[:sys.ndim])
+
+	def reset(self):
+		self.terminated = False
+		self.iterations = []
+		self._window_t, self._window, self._window_dt, self._i = np.array([self.t0]), self.y0[None].copy(), None, 0
+		self.bind()
+
+	def close(self):
+		''' Shut down the worker processes ''' 
+		if self._executor is not None:
+			self._executor.shutdown()
+			self._executor = None
+			_parareal_systems.pop(id(self), None)
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['_executor'] = None # Process pools cannot be pickled; recreated on demand
+		state['_factor'] = None
+		return state
+
+	''' Observation ''' 
+
+	@property
+	def t(self):
+		return self._window_t[self._i]
+
+_parareal_systems = dict() # Systems integrated by forked Parareal workers, by driver
+
+def parareal_fine(sys: fds, t0: Time, y0: np.ndarray, t1: Time) -> np.ndarray:
+	''' The system's solver over a slice; the system observes its integrator's state meanwhile, as in a serial run ''' 
+	registry, view = sys._registry, sys.__dict__.get('y')
+	StateRegistry.unbind(sys)
+	try:
+		sys.restart_integrator(t0, y0)
+		sys.step_dydt(t1 - t0)
+		return sys.integrator.y.copy()
+	finally:
+		if registry is not None:
+			registry.bind(sys, view)
+		sys.invalidate()
+
+def parareal_worker(key: int, t0: Time, y0: np.ndarray, t1: Time) -> np.ndarray:
+	return parareal_fine(_parareal_systems[key], t0, y0, t1)
+
+def parareal(observables: Dict[str, Observable], **kwargs) -> System:
+	''' Integrate a single differential system in parallel in time; see parareal_fds for options '''
 	steppables = [obs for obs in observables.values() if isinstance(obs, Steppable)] 
-	stepper = coupled_fds(*steppables)
-	return System(stepper, observables)
\ No newline at end of file
+	assert len(steppables) == 1, 'Parareal integrates a single system'
+	return System(parareal_fds(steppables[0], **kwargs), observables)
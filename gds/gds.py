@@ -3,10 +3,85 @@ import networkx as nx
 import scipy.sparse as sp
 from typing import Any, Union, Tuple, Callable, NewType, Iterable, Dict
 import itertools
+import functools
+import threading
 
 from .types import *
 from .fds import *
 from .utils import *
+from .utils.graph import *
+
+''' Memoization of operators ''' 
+
+def memoized(op: Callable) -> Callable:
+	''' Cache an operator's result for the current state version. 
+	Only calls whose arguments are defaults, observables (keyed on their own state version) or scalars are cached; 
+	cached arrays are returned without copying and are read-only: pass out= for a writable result, which is copied from 
+	(but not stored in) the cache.
+	Default calls on a member of a field_group are served from the group's stacked application.
+	Calls on one field (or group) hold its lock, so that threads evaluating laws concurrently (see coupled_fds) never 
+	interleave within its cache entries or work buffers.
+	''' 
+	name = op.__name__
+	@functools.wraps(op)
+	def wrapper(self, *args, out: np.ndarray=None, **kwargs):
+		if self._group is not None and name in field_group.operators and all(a is None for a in args) and not kwargs:
+			with operator_lock(self._group):
+				ret = self._group.apply(name)[self._group.index(self)]
+			if out is None:
+				return ret
+			np.copyto(out, ret)
+			return out
+		with operator_lock(self):
+			return cached(self, args, kwargs, out)
+
+	def cached(self, args: Tuple, kwargs: Dict, out: np.ndarray) -> Any:
+		if out is not None:
+			hit = self._memo.get(name)
+			if hit is not None and hit[0] == memo_key(self, args, kwargs):
+				np.copyto(out, hit[1])
+				return out
+			return op(self, *args, out=out, **kwargs)
+		key = memo_key(self, args, kwargs)
+		if key is None:
+			return op(self, *args, **kwargs)
+		hit = self._memo.get(name)
+		if hit is not None and hit[0] == key:
+			return hit[1]
+		ret = op(self, *args, **kwargs)
+		if isinstance(ret, np.ndarray):
+			ret.setflags(write=False)
+		self._memo[name] = (key, ret)
+		return ret
+	return wrapper
+
+def operator_lock(obj: Any) -> threading.RLock:
+	''' Lock serializing the operator calls on a field or group, created on first use (and dropped on pickling) ''' 
+	lock = obj.__dict__.get('_op_lock')
+	return lock if lock is not None else obj.__dict__.setdefault('_op_lock', threading.RLock()) # setdefault is atomic
+
+def memo_key(self: 'gds', args: Tuple, kwargs: Dict) -> Tuple:
+	''' Cache key of an operator call, or None if its arguments cannot be keyed ''' 
+	deps = []
+	for k, a in itertools.chain(enumerate(args), kwargs.items()):
+		if a is None:
+			continue
+		elif isinstance(a, fds):
+			deps.append((k, id(a), a.state_version))
+		elif isinstance(a, (bool, int, float, str)):
+			deps.append((k, a))
+		else:
+			return None
+	return (self.state_version, tuple(deps))
+
+def zero_rows(A: sp.csr_matrix, rows: np.ndarray) -> Tuple[sp.csr_matrix, np.ndarray]:
+	''' Copy of A with the entries of the given rows removed, and the mask of A's entries it keeps (to refill its data) ''' 
+	keep_rows = np.ones(A.shape[0], dtype=bool)
+	keep_rows[rows] = False
+	counts = np.diff(A.indptr) * keep_rows
+	keep = np.repeat(keep_rows, np.diff(A.indptr))
+	indptr = np.concatenate(([0], np.cumsum(counts))).astype(A.indptr.dtype)
+	return sp.csr_matrix((A.data[keep], A.indices[keep], indptr), shape=A.shape), keep
 
 ''' Observables on graph domains ''' 
 
@@ -14,26 +89,93 @@ class GraphObservable(Observable):
 	def __init__(self, G: nx.Graph, Gd: GraphDomain):
 		self.G = G
 		self.Gd = Gd
-		# Domains
-		self.nodes = {v: i for i, v in enumerate(G.nodes())}
-		self.nodes_i = {i: v for v, i in self.nodes.items()}
-		self.edges = bidict({e: i for i, e in enumerate(G.edges())})
-		self.edges_i = {i: e for e, i in self.edges.items()}
-		self.triangles, tri_index = {}, 0
-		for clique in nx.find_cliques(G):
-			if len(clique) == 3:
-				self.triangles[tuple(clique)] = tri_index
-				tri_index += 1
+		# Domains, indexed in the order chosen by reorder_graph() if any, or in array order for array graphs
+		if isinstance(G, ArrayGraph):
+			self.nodes, self.edges = PointIndex(G, GraphDomain.nodes), PointIndex(G, GraphDomain.edges)
+			self.nodes_i, self.edges_i = self.nodes.labels, self.edges.labels
+			node_perm = edge_perm = None
+		else:
+			nodes, edges, node_perm, edge_perm = graph_ordering(G)
+			self.nodes = {v: i for i, v in enumerate(nodes)}
+			self.nodes_i = {i: v for v, i in self.nodes.items()}
+			self.edges = bidict({e: i for i, e in enumerate(edges)})
+			self.edges_i = {i: e for e, i in self.edges.items()}
+		self._triangles = None
+		self._tri = None # Node indices of the triangles, once the topology has changed
+		self._perm = None # Natural index of each point, if reordered
+		self._perm_stale = False # Whether the natural order must be found again, after changes of topology
+		self._graph_order = None
 
 		if Gd is GraphDomain.nodes:
 			X = self.nodes
+			self._perm = node_perm
 		elif Gd is GraphDomain.edges:
 			X = self.edges
+			self._perm = edge_perm
 		elif Gd is GraphDomain.triangles:
 			X = self.triangles
 		Observable.__init__(self, X)
 
-	def project(self, Gd: GraphDomain, view: Callable[['GraphObservable'], np.ndarray]) -> 'GraphObservable':
+	def natural_perm(self) -> np.ndarray:
+		''' Natural (networkx) index of each point, or None if reordered; for array graphs, that in G.to_networkx() ''' 
+		if self._perm_stale: # Points were added or removed; compare with the current order of G
+			labels = list(self.G.nodes()) if self.Gd is GraphDomain.nodes else list(self.G.edges())
+			pos = {x: k for k, x in enumerate(labels)}
+			if self.Gd is GraphDomain.edges:
+				pos.update({(e[1], e[0]): k for k, e in enumerate(labels)})
+			perm = np.array([pos[self.iX[i]] for i in range(len(self.X))], dtype=np.intp)
+			self._perm = None if np.array_equal(perm, np.arange(perm.size)) else perm
+			self._graph_order = None
+			self._perm_stale = False
+		elif self._perm is None and isinstance(self.G, ArrayGraph) and self.Gd is not GraphDomain.triangles:
+			order = self.G.to_networkx().graph['gds_order']
+			self._perm = order[2] if self.Gd is GraphDomain.nodes else order[3]
+		return self._perm
+
+	@property
+	def graph_order(self) -> np.ndarray:
+		''' Index of each point in networkx order, or None if reordered ''' 
+		perm = self.natural_perm()
+		if perm is not None and self._graph_order is None:
+			self._graph_order = np.empty_like(perm)
+			self._graph_order[perm] = np.arange(perm.size)
+		return self._graph_order
+
+	def to_graph_order(self, y: np.ndarray, axis: int=0) -> np.ndarray:
+		''' Values (or a history of them, along the given axis) indexed in networkx order, e.g. for rendering or saving ''' 
+		return y if self.graph_order is None else np.take(y, self.graph_order, axis=axis)
+
+	def from_graph_order(self, y: np.ndarray, axis: int=0) -> np.ndarray:
+		''' Inverse of to_graph_order ''' 
+		perm = self.natural_perm()
+		return y if perm is None else np.take(y, perm, axis=axis)
+
+	@property
+	def triangles(self) -> Dict[Triangle, int]:
+		''' 3-cliques of G; found on first use, since only edge and triangle observables need them ''' 
+		if self._triangles is None and isinstance(self.G, ArrayGraph):
+			self._triangles = {tuple(self.G.node_label(v) for v in tri): k for k, tri in enumerate(self.G.triangles)}
+		elif self._triangles is None:
+			self._triangles, tri_index = {}, 0
+			for clique in nx.find_cliques(self.G):
+				if len(clique) == 3:
+					self._triangles[tuple(clique)] = tri_index
+					tri_index += 1
+		return self._triangles
+
+	def triangle_nodes(self) -> np.ndarray:
+		''' Node indices of each triangle ''' 
+		if self._tri is not None:
+			return self._tri.view()
+		if isinstance(self.G, ArrayGraph):
+			return self.G.triangles
+		tri = np.empty((len(self.triangles), 3), dtype=np.intp)
+		for clique, k in self.triangles.items():
+			tri[k] = [self.nodes[v] for v in clique]
+		return tri
+
+	def project(self, Gd: GraphDomain, view: Callable[['GraphObservable'], np.ndarray], G: nx.Graph=None) -> 'GraphObservable':
+		''' Observable viewing this one, possibly on another graph with a matching domain ''' 
 		class ProjectedObservable(GraphObservable):
 			@property
 			def y(other):
@@ -41,45 +183,300 @@ class GraphObservable(Observable):
 			@property
 			def t(other):
 				return self.t
-		return ProjectedObservable(self.G, Gd)
+		return ProjectedObservable(self.G if G is None else G, Gd)
 
 ''' Dynamical systems on generic graph domains ''' 
 
 class gds(fds, GraphObservable):
-	def __init__(self, G: nx.Graph, Gd: GraphDomain, w_key: str=None):
+	_group = None # field_group whose stacked operators this field uses
+	spmv_threads = None # Threads for operator products; None uses the spmv default
+	weights_fun = None # Time-varying edge weights, see set_weights()
+	_stale = True # Whether the assembled Laplacian lags behind the weights
+	_dirichlet_laplacian = None # (Laplacian, the one it was cut from, entries kept, _op_values when filled), assembled on first use
+	_ends = None # Tail and head of each edge, and weights, as growable arrays once the topology has changed
+	_topology = 0 # Bumped on each change of topology, e.g. to rebuild couplings
+
+	def __init__(self, G: nx.Graph, Gd: GraphDomain, w_key: str=None, ensemble: int=None, dtype: np.dtype=np.float64):
 		GraphObservable.__init__(self, G, Gd)
+		self.dtype = np.dtype(dtype) # Operators are assembled in the precision of the state
 
 		# Weights
-		self.weights = np.ones(len(G.edges()))
-		if w_key is not None:
-			for i, e in enumerate(G.edges()):
+		self.weights = np.ones(G.number_of_edges())
+		if w_key is not None and isinstance(G, ArrayGraph):
+			self.weights[:] = G.edge_attrs[w_key]
+		elif w_key is not None:
+			for e, i in self.edges.items():
 				self.weights[i] = G[e[0]][e[1]][w_key]
 
 		# Orientation / incidence
-		self.orientation = {**{e: 1 for e in self.edges}, **{(e[1], e[0]): -1 for e in self.edges}} # Orientation implicit by stored keys in domain
-		self.incidence = nx.incidence_matrix(G, oriented=True)@sp.diags(np.sqrt(self.weights)).tocsr() # |V| x |E| incidence
-
-		fds.__init__(self, self.X)
+		if isinstance(G, ArrayGraph):
+			self.orientation = self.edges.orientation
+		else:
+			self.orientation = {**{e: 1 for e in self.edges}, **{(e[1], e[0]): -1 for e in self.edges}} # Orientation implicit by stored keys in domain
+		self.unit_incidence = oriented_incidence(G, self.nodes, self.edges).astype(self.dtype).tocsr() # Fixes the sparsity of weighted operators
+		self.incidence = self.unit_incidence.copy() # |V| x |E| incidence, scaled by the square roots of the weights (see apply_weights)
+		self.transpose_incidence()
+		self.lattice = None # Slicing stencils, which replace incidence products when all weights are 1
+		self._lattice = self.fit_lattice() # Those of G's lattice, if this field's domains are its nodes and edges
+		self.neumann_correction = np.zeros(len(self.nodes) if Gd is GraphDomain.nodes else len(self.edges), dtype=self.dtype)
+
+		self._memo = dict() # Memoized operator results, by operator name
+		fds.__init__(self, self.X, ensemble=ensemble, dtype=dtype)
+		self.assemble_operators()
+		self.apply_weights(self.weights)
 
 	def set_constraints(self, *args, **kwargs):
 		# TODO: better way to handle constraints on >=1-dimensional objects (need to detect alternating signs)
 		fds.set_constraints(self, *args, **kwargs)
 
+		self._dirichlet_laplacian = None
 		if self.Gd is GraphDomain.nodes:
-			self.dirichlet_laplacian = self.vertex_laplacian.copy()
-			self.dirichlet_laplacian[self.dirichlet_indices, :] = 0
-			self.dirichlet_laplacian.eliminate_zeros()
 			self.neumann_correction[self.neumann_indices] = self.neumann_values
-		else:
-			self.dirichlet_laplacian = self.edge_laplacian.copy()
-			self.dirichlet_laplacian[self.dirichlet_indices, :] = 0
-			self.dirichlet_laplacian.eliminate_zeros()
-			# TODO: neumann conditions
+		# TODO: neumann conditions on edges
+		self.invalidate(operators=True)
 
 		if self.iter_mode is IterationMode.cvx:
 			# Rebuild cost function since operators may have changed
 			self.rebuild_cvx()
 
+	def update_constraints(self, t: float):
+		fds.update_constraints(self, t)
+		if self.weights_fun is not None:
+			self.apply_weights(self.weights_fun(t))
+
+	''' Weights ''' 
+
+	def set_weights(self, weights: Union[np.ndarray, Callable[[Time], np.ndarray]]):
+		''' 
+		Set the edge weights, given in edge index order, or a function (t) giving them, which is then applied along with 
+		time-varying constraints (i.e. before each evaluation of the dynamics). Operators keep their sparsity and are 
+		updated in place, and assembled Laplacians are recombined on first use. Fields in a field_group must be given 
+		equal weights.
+		''' 
+		self.weights_fun = weights if callable(weights) else None
+		if callable(weights):
+			weights = weights(self.t0 if self.iter_mode is IterationMode.none else self.t)
+		self.apply_weights(weights)
+
+	def apply_weights(self, weights: np.ndarray):
+		''' Rescale the weighted operators' data to the given edge weights ''' 
+		weights = np.array(weights, dtype=np.float64)
+		assert weights.shape == (len(self.edges),), 'Expected one weight per edge'
+		if self._ends is not None:
+			self._weights.view()[:] = weights
+			weights = self._weights.view()
+		self.weights = weights
+		B, s = self.unit_incidence, np.sqrt(weights)
+		np.multiply(B.data, s[B.indices], out=self.incidence.data)
+		Bt, rows = self._unit_incidence_t
+		np.multiply(Bt.data, s[rows], out=self.incidence_t.data)
+		spmv_forget(self.incidence)
+		self.lattice = self._lattice if np.all(weights == 1.) else None
+		self._stale = True
+		self._flux_work = None
+		self.invalidate(values=True) # Sparsity is unchanged, so compiled laws and the Dirichlet Laplacian are refilled
+
+	def assemble_operators(self):
+		''' Assemble the unweighted operators, and structures for weighting them, from the unit incidence ''' 
+		pass
+
+	def transpose_incidence(self):
+		''' 
+		|E| x |V| transpose of the incidence, weighted along with it. Kept as one CSR matrix (rather than incidence.T, a new 
+		CSC view on each use), so that threaded gradients reuse its row blocks across products.
+		''' 
+		Bt = self.unit_incidence.T.tocsr()
+		self._unit_incidence_t = (Bt, np.repeat(np.arange(Bt.shape[0]), np.diff(Bt.indptr))) # With the edge of each entry
+		self.incidence_t = Bt.copy()
+
+	def edge_ends(self) -> Tuple[np.ndarray, np.ndarray]:
+		''' Tail and head node index of each edge ''' 
+		if self._ends is not None:
+			ends = self._ends.view()
+			return ends[:, 0], ends[:, 1]
+		elif isinstance(self.G, ArrayGraph):
+			return self.G.tails, self.G.heads
+		return incidence_ends(self.unit_incidence)
+
+	@property
+	def dirichlet_laplacian(self) -> sp.csr_matrix:
+		''' Laplacian without the rows of Dirichlet-constrained points; its entries follow the weights in place ''' 
+		L = self.vertex_laplacian if self.Gd is GraphDomain.nodes else self.edge_laplacian
+		if len(self.dirichlet_indices) == 0:
+			return L
+		hit = self._dirichlet_laplacian
+		if hit is None or hit[1] is not L:
+			D, keep = zero_rows(L, self.dirichlet_indices)
+			self._dirichlet_laplacian = (D, L, keep, self._op_values)
+		elif hit[3] != self._op_values:
+			np.compress(hit[2], L.data, out=hit[0].data)
+			self._dirichlet_laplacian = (*hit[:3], self._op_values)
+		return self._dirichlet_laplacian[0]
+
+	''' Topology changes ''' 
+
+	def add_nodes(self, nodes: Iterable[Node], values: Any=0.):
+		''' Add nodes to G and to this field; on node fields, they take the given values ''' 
+		self.change_topology(add_nodes=nodes, values=values)
+
+	def remove_nodes(self, nodes: Iterable[Node]):
+		''' Remove nodes, and the edges incident to them, from G and from this field ''' 
+		self.change_topology(remove_nodes=nodes)
+
+	def add_edges(self, edges: Iterable[Edge], weights: Any=1., values: Any=0.):
+		''' Add edges (and any new endpoints) to G and to this field; on edge fields, they take the given values ''' 
+		self.change_topology(add_edges=edges, weights=weights, values=values)
+
+	def remove_edges(self, edges: Iterable[Edge]):
+		''' Remove edges from G and from this field ''' 
+		self.change_topology(remove_edges=edges)
+
+	def change_topology(self, add_nodes: Iterable[Node]=(), remove_nodes: Iterable[Node]=(), add_edges: Iterable[Edge]=(), 
+			remove_edges: Iterable[Edge]=(), weights: Any=1., values: Any=0.):
+		''' 
+		Add and remove nodes and edges of a live field, e.g. of a growing network or failing links; removals are applied 
+		first. G is modified in place, skipping changes already made to it (e.g. when updating other fields on G). 
+		Points are removed by moving the last point into their index, and edge ends, weights and triangles are kept in 
+		growable arrays, so that patching the domains costs time in the size of the change. The operators, however, are 
+		reassembled from those arrays (without visiting G), and the state is carried over into a restarted integrator (see 
+		fds.remap_points), which cost time in the size of the graph: batch changes into one call where possible.
+		''' 
+		assert not isinstance(self.G, ArrayGraph), 'Array graphs are static; use G.to_networkx() to change their topology'
+		assert self.Gd in (GraphDomain.nodes, GraphDomain.edges), 'Only node and edge fields support changes of topology'
+		assert self._group is None, 'Fields in a group cannot change their topology'
+		assert self._registry is None, 'Coupled fields cannot change their topology'
+		if self._ends is None:
+			self.track_topology()
+		nodes, edges, G = self.nodes, self.edges, self.G
+		n_old, m_old = len(nodes), len(edges)
+		stored = lambda e: e if dict.__contains__(edges, e) else (e[1], e[0])
+
+		# Requested changes, excluding those which do not apply to this field
+		add_edges = list({frozenset(e): tuple(e) for e in add_edges if e not in edges}.values()) # Each edge once, in either orientation
+		add_nodes = [v for v in dict.fromkeys(list(add_nodes) + [v for e in add_edges for v in e]) if v not in nodes]
+		remove_nodes = [v for v in dict.fromkeys(remove_nodes) if v in nodes]
+		B = self.unit_incidence # Its rows hold the edges incident to each node
+		incident = [B.indices[B.indptr[i]:B.indptr[i+1]] for i in (nodes[v] for v in remove_nodes)]
+		incident = np.unique(np.concatenate(incident)) if incident else []
+		remove_edges = list(dict.fromkeys([stored(e) for e in remove_edges if e in edges] + [self.edges_i[k] for k in incident]))
+		regions = self.triangle_regions(remove_edges)
+
+		# Removals, moving the last point into the place of each removed one
+		edge_src, node_src = np.arange(m_old), np.arange(n_old)
+		for e in remove_edges:
+			i = dict.pop(edges, e)
+			del self.orientation[e], self.orientation[(e[1], e[0])]
+			last = self._ends.swap_remove(i)
+			self._weights.swap_remove(i)
+			edge_src[i] = edge_src[last]
+			if i != last:
+				f = self.edges_i[last]
+				edges[f], self.edges_i[i] = i, f
+			del self.edges_i[last]
+		for v in remove_nodes:
+			i = nodes.pop(v)
+			last = len(nodes)
+			node_src[i] = node_src[last]
+			if i != last:
+				u = self.nodes_i[last]
+				nodes[u], self.nodes_i[i] = i, u
+			del self.nodes_i[last]
+		edge_src, node_src = edge_src[:len(edges)], node_src[:len(nodes)]
+		node_inv = np.full(n_old, -1, dtype=np.intp)
+		node_inv[node_src] = np.arange(node_src.size)
+		ends = self._ends.view()
+		ends[:] = node_inv[ends]
+
+		# Additions, at the end
+		for v in add_nodes:
+			nodes[v] = len(nodes)
+			self.nodes_i[nodes[v]] = v
+		for e in add_edges:
+			edges[e] = len(edges)
+			self.edges_i[edges[e]] = e
+			self.orientation[e], self.orientation[(e[1], e[0])] = 1, -1
+		self._ends.append([(nodes[e[0]], nodes[e[1]]) for e in add_edges])
+		self._weights.append(np.broadcast_to(np.asarray(weights, dtype=np.float64), (len(add_edges),)))
+		node_src = np.concatenate((node_src, np.full(len(add_nodes), -1, dtype=np.intp)))
+		edge_src = np.concatenate((edge_src, np.full(len(add_edges), -1, dtype=np.intp)))
+
+		# The graph, which other fields on it may have changed already
+		G.remove_edges_from([e for e in remove_edges if G.has_edge(*e)])
+		G.remove_nodes_from([v for v in remove_nodes if v in G])
+		G.add_nodes_from([v for v in add_nodes if v not in G])
+		G.add_edges_from([e for e in add_edges if not G.has_edge(*e)])
+		G.graph.pop('gds_order', None) # The stored order and lattice no longer describe G
+		G.graph.pop('lattice', None)
+		self._lattice = None
+		self.patch_triangles(regions, add_edges, node_inv)
+		self._perm_stale = True
+		self._topology += 1
+
+		# Operators and state
+		tails, heads = self.edge_ends()
+		self.unit_incidence = incidence_from_arrays(tails, heads, len(nodes)).astype(self.dtype).tocsr()
+		self.incidence = self.unit_incidence.copy()
+		self.transpose_incidence()
+		self.assemble_operators()
+		self.apply_weights(self._weights.view())
+		self.remap_points(node_src if self.Gd is GraphDomain.nodes else edge_src, values)
+		self.neumann_correction = np.zeros(self.ndim, dtype=self.dtype)
+		if self.Gd is GraphDomain.nodes:
+			self.neumann_correction[self.neumann_indices] = self.neumann_values
+		self._dirichlet_laplacian = None
+
+	def track_topology(self):
+		''' Move the edge ends and weights into growable arrays, before the first change of topology ''' 
+		tails, heads = self.edge_ends()
+		self._ends = growable(np.stack((tails, heads), axis=1).astype(np.intp))
+		self._weights = growable(self.weights)
+		self._iX = self.nodes_i if self.Gd is GraphDomain.nodes else self.edges_i # Maintained along with the domain
+
+	def triangle_regions(self, edges: List[Edge]) -> List[Tuple[Node, Node, set]]:
+		''' Ends and common neighbors of the given edges, among which triangles may change with them, where tracked ''' 
+		return []
+
+	def node_adjacency(self) -> sp.csr_matrix:
+		''' Symmetric adjacency of the nodes, assembled from the edge ends ''' 
+		tails, heads = self.edge_ends()
+		n = len(self.nodes)
+		return sp.csr_matrix((np.ones(2*tails.size), (np.concatenate((tails, heads)), np.concatenate((heads, tails)))), shape=(n, n))
+
+	def patch_triangles(self, regions: List[Tuple[Node, Node, set]], added: List[Edge], node_inv: np.ndarray):
+		''' Update triangles after a change of topology ''' 
+		self._triangles = None # Found again on use
+
+	def fit_lattice(self) -> Any:
+		''' Stencils of G's lattice in this field's index order, if its domains are the lattice's nodes and edges ''' 
+		lattice = graph_lattice(self.G)
+		if lattice is None or isinstance(self.G, ArrayGraph): # Array graphs follow their lattice's order
+			return lattice
+		return lattice.fit(self.nodes, self.edges, self.orientation)
+
+	def stencil_work(self, n: int, y: np.ndarray) -> np.ndarray:
+		''' Work array of n rows shaped like y, reused by stencil operators ''' 
+		key = (n, y.shape[1:], y.dtype)
+		if getattr(self, '_stencil_work', None) is None or self._stencil_work[0] != key:
+			self._stencil_work = (key, np.empty((n,) + y.shape[1:], dtype=y.dtype))
+		return self._stencil_work[1]
+
+	def uses_stencil(self, y: Any) -> bool:
+		return self.lattice is not None and isinstance(y, np.ndarray)
+
+	def set_threads(self, threads: int=None):
+		''' Number of threads for this field's sparse operator products (None for the default); results do not depend on it ''' 
+		self.spmv_threads = threads
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state.pop('_op_lock', None) # Locks cannot be pickled; recreated on demand
+		return state
+
+	def member(self, k: int) -> GraphObservable:
+		''' Observable of a single ensemble member, e.g. for rendering ''' 
+		assert self.ensemble is not None, 'Not an ensemble'
+		return self.project(self.Gd, lambda obs: obs.y[:, k])
+
 ''' Dynamical systems on specific graph domains ''' 
 
 class node_gds(gds):
@@ -88,33 +485,66 @@ class node_gds(gds):
 	def __init__(self, G: nx.Graph, *args, **kwargs):
 		gds.__init__(self, G, GraphDomain.nodes, *args, **kwargs)
 
-		# Operators
-		self.vertex_laplacian = -self.incidence@self.incidence.T # |V| x |V| laplacian operator
-		self.dirichlet_laplacian = self.vertex_laplacian
-		self.neumann_correction = np.zeros(self.ndim)	
+	def assemble_operators(self):
+		# Structure and weight map of the laplacian, so that reweighting refills it in place; after changes of topology, 
+		# found again on first use
+		self._vertex_laplacian = laplacian_map(self.unit_incidence) if self._ends is None else None
+
+	@property
+	def vertex_laplacian(self) -> sp.csr_matrix:
+		''' |V| x |V| laplacian operator ''' 
+		if self._vertex_laplacian is None:
+			self._vertex_laplacian = laplacian_map(self.unit_incidence)
+			self._stale = True
+		L, P = self._vertex_laplacian
+		if self._stale:
+			np.copyto(L.data, P@self.weights, casting='same_kind')
+		self._stale = False
+		return L
 
 	''' Differential operators: all of the following are CVXPY-compatible '''
 
 	def partial(self, e: Edge) -> float:
 		return np.sqrt(self.weights[self.edges[e]]) * (self(e[1]) - self(e[0])) 
 
-	def grad(self, y: np.ndarray=None) -> np.ndarray:
+	@memoized
+	def grad(self, y: np.ndarray=None, out: np.ndarray=None) -> np.ndarray:
 		if y is None: y=self.y
-		return self.incidence.T@y
+		if self.uses_stencil(y):
+			return self.lattice.grad(y, out)
+		return spmv(self.incidence_t, y, out, threads=self.spmv_threads)
 
-	def laplacian(self, y: np.ndarray=None) -> np.ndarray:
+	@memoized
+	def laplacian(self, y: np.ndarray=None, out: np.ndarray=None) -> np.ndarray:
 		''' Dirichlet-Neumann Laplacian. TODO: should minimize error from laplacian on interior? ''' 
 		if y is None: y=self.y
-		return self.dirichlet_laplacian@y + self.neumann_correction
-
-	def bilaplacian(self, y: np.ndarray=None) -> np.ndarray:
+		nc = self.neumann_correction if y.ndim == 1 else self.neumann_correction[:, None] # Shared by ensemble members
+		if self.uses_stencil(y):
+			out = self.lattice.laplacian(y, out)
+			out[self.dirichlet_indices] = 0.
+			out += nc
+			return out
+		if out is None:
+			return spmv(self.dirichlet_laplacian, y, threads=self.spmv_threads) + nc
+		spmv(self.dirichlet_laplacian, y, out, threads=self.spmv_threads)
+		out += nc
+		return out
+
+	@memoized
+	def bilaplacian(self, y: np.ndarray=None, out: np.ndarray=None) -> np.ndarray:
 		# TODO correct way to handle Neumann in this case? (Gradient constraint only specifies one neighbor beyond)
 		if y is None: y=self.y
-		return self.dirichlet_laplacian@self.laplacian(y)
-
-	def advect(self, v_field: Union[Callable[[Edge], float], np.ndarray], y: np.ndarray=None) -> np.ndarray:
+		if self.uses_stencil(y):
+			out = self.lattice.laplacian(self.laplacian(y), out)
+			out[self.dirichlet_indices] = 0.
+			return out
+		return spmv(self.dirichlet_laplacian, self.laplacian(y), out, threads=self.spmv_threads)
+
+	@memoized
+	def advect(self, v_field: Union[Callable[[Edge], float], np.ndarray], y: np.ndarray=None, out: np.ndarray=None) -> np.ndarray:
 		'''
 		Transportation of a scalar field.
+		The transport operator depends on the velocity field, so is assembled on each call; only its product uses out.
 		'''
 		if isinstance(v_field, edge_gds):
 			assert v_field.G is self.G, 'Incompatible domains'
@@ -123,87 +553,194 @@ class node_gds(gds):
 		Bp = self.incidence@sp.diags(np.sign(v_field))
 		Bp.data[Bp.data > 0] = 0.
 		Bp.data *= -1
-		return -self.incidence@sp.diags(v_field)@Bp.T@y
+		return spmv(-self.incidence@sp.diags(v_field)@Bp.T, y, out, threads=self.spmv_threads)
 
 class edge_gds(gds):
 	''' Dynamical system defined on the edges of a graph ''' 
 	def __init__(self, G: nx.Graph, *args, **kwargs):
 		gds.__init__(self, G, GraphDomain.edges, *args, **kwargs)
 
-		self.edge_laplacian = -self.incidence.T@self.incidence # |E| x |E| laplacian operator
-		self.dirichlet_laplacian = self.edge_laplacian
-		self.neumann_correction = np.zeros(self.ndim)	
+	def assemble_operators(self):
+		D = self.unit_incidence
+		U = -(D.T@D).tocsr() # Unweighted laplacian, whose structure is shared by all weightings
+		U.sort_indices()
+		self._edge_laplacian = (U.copy(), U, np.repeat(np.arange(U.shape[0]), np.diff(U.indptr)))
 
 		''' Additional operators '''
 
-		# Edge-edge adjacency matrix
-		def edge_adj_func(e_i, e_j):
-			if e_i == e_j:
-				return 0
-			elif e_i[0] == e_j[0] or e_i[1] == e_j[1]:
-				return -1
-			elif e_i[1] == e_j[0] or e_i[0] == e_j[1]:
-				return 1
-			return 0
-		self.edge_adj = sparse_product(self.edges.keys(), self.edges.keys(), edge_adj_func).tocsr() # |E| x |E| edge adjacency matrix
-
-		def curl_element(tri, edge):
-			if edge[0] in tri and edge[1] in tri:
-				c = np.sqrt(self.weights[self.edges[edge]])
-				if edge == (tri[0], tri[1]) or edge == (tri[1], tri[2]) or edge == (tri[2], tri[0]): # Orientation of triangle
-					return c
-				return -c
-			return 0
-		self.curl3 = sparse_product(self.triangles.keys(), self.edges.keys(), curl_element).tocsr() # |T| x |E| curl operator, where T is the set of 3-cliques in G; respects implicit orientation
+		# Edge-edge adjacency matrix: -1 for edges sharing a head or tail, 1 for head-to-tail; assembled from the unweighted incidence
+		self.edge_adj = -(D.T@D).tocsr() # |E| x |E| edge adjacency matrix
+		self.edge_adj.setdiag(0)
+		self.edge_adj.eliminate_zeros()
+
+		# |T| x |E| curl operator, where T is the set of 3-cliques in G; respects implicit orientation
+		tails, heads = self.edge_ends()
+		self.unit_curl = triangle_curl(self.triangle_nodes(), tails, heads, len(self.nodes), np.ones(len(self.edges))).astype(self.dtype)
+		self.curl3 = self.unit_curl.copy() # Scaled like the incidence
+
+	''' Triangles under changes of topology ''' 
+
+	def track_topology(self):
+		gds.track_topology(self)
+		self._tri = growable(self.triangle_nodes())
+		self._triangles_i = {k: t for t, k in self.triangles.items()}
+		self._triangle_keys = {frozenset(t): t for t in self.triangles}
+
+	def triangle_regions(self, edges: List[Edge]) -> List[Tuple[Node, Node, set]]:
+		if len(edges) == 0:
+			return []
+		A = self.node_adjacency()
+		nbrs = lambda i: A.indices[A.indptr[i]:A.indptr[i+1]]
+		return [(u, v, {self.nodes_i[k] for k in np.intersect1d(nbrs(self.nodes[u]), nbrs(self.nodes[v]))}) for u, v in edges]
+
+	def patch_triangles(self, regions: List[Tuple[Node, Node, set]], added: List[Edge], node_inv: np.ndarray):
+		''' 
+		Update the triangles (maximal 3-cliques) after edges changed. Any triangle which appears, disappears or stops 
+		being maximal consists of a changed edge's ends and common neighbors (before or after the change), so only those
+		are examined. Triangles are removed by moving the last one into their index.
+		''' 
+		tri = self._tri.view()
+		tri[:] = node_inv[tri]
+		A = self.node_adjacency()
+		nbrs = lambda i: set(A.indices[A.indptr[i]:A.indptr[i+1]])
+		regions = regions + self.triangle_regions(added)
+		candidates = set()
+		for u, v, common in regions:
+			candidates.update(frozenset((u, v, a)) for a in common)
+			for a, b in itertools.combinations(common, 2):
+				candidates.update((frozenset((u, a, b)), frozenset((v, a, b))))
+
+		def maximal(t: frozenset) -> bool:
+			if not all(x in self.nodes for x in t):
+				return False
+			i, j, k = (self.nodes[x] for x in t)
+			ni, nj, nk = nbrs(i), nbrs(j), nbrs(k)
+			return j in ni and k in ni and k in nj and len(ni & nj & nk) == 0
+
+		for t in candidates:
+			present, valid = t in self._triangle_keys, maximal(t)
+			if present and not valid:
+				k = self._triangles.pop(self._triangle_keys.pop(t))
+				last = self._tri.swap_remove(k)
+				if k != last:
+					moved = self._triangles_i[last]
+					self._triangles[moved], self._triangles_i[k] = k, moved
+				del self._triangles_i[last]
+			elif valid and not present:
+				key = tuple(t)
+				k = len(self._triangles)
+				self._triangles[key], self._triangles_i[k], self._triangle_keys[t] = k, key, key
+				self._tri.append([[self.nodes[x] for x in key]])
+
+	def apply_weights(self, weights: np.ndarray):
+		gds.apply_weights(self, weights)
+		C = self.unit_curl
+		np.multiply(C.data, np.sqrt(self.weights)[C.indices], out=self.curl3.data)
+		spmv_forget(self.curl3)
+
+	@property
+	def edge_laplacian(self) -> sp.csr_matrix:
+		''' |E| x |E| laplacian operator ''' 
+		L, U, rows = self._edge_laplacian
+		if self._stale:
+			s = np.sqrt(self.weights)
+			np.multiply(U.data, s[rows] * s[U.indices], out=L.data, casting='same_kind')
+		self._stale = False
+		return L
 
 	def __call__(self, x: Edge):
 		return self.orientation[x] * self.y[self.X[x]]
 
 	''' Differential operators: all of the following are CVXPY-compatible '''
 
-	def div(self, y: np.ndarray=None) -> np.ndarray:
+	@memoized
+	def div(self, y: np.ndarray=None, out: np.ndarray=None) -> np.ndarray:
 		if y is None: y=self.y
-		return -self.incidence@y
-
-	def influx(self, y: np.ndarray=None) -> np.ndarray:
+		if self.uses_stencil(y):
+			out = self.lattice.incidence(y, out)
+			return np.negative(out, out=out)
+		if out is None:
+			return -spmv(self.incidence, y, threads=self.spmv_threads)
+		spmv(self.incidence, y, out, threads=self.spmv_threads)
+		np.negative(out, out=out)
+		return out
+
+	@memoized
+	def influx(self, y: np.ndarray=None, out: np.ndarray=None) -> np.ndarray:
 		''' In-flux through nodes ''' 
 		if y is None: y=self.y
+		if out is not None:
+			return self._flux(y, 1., out)
 		f = self.incidence.multiply(y)
 		f.data[f.data < 0] = 0.
-		return f.sum(axis=1)
+		return np.asarray(f.sum(axis=1)).ravel()
 
-	def outflux(self, y: np.ndarray=None) -> np.ndarray:
+	@memoized
+	def outflux(self, y: np.ndarray=None, out: np.ndarray=None) -> np.ndarray:
 		''' Out-flux through nodes ''' 
 		if y is None: y=self.y
+		if out is not None:
+			return self._flux(y, -1., out)
 		f = -self.incidence.multiply(y)
 		f.data[f.data < 0] = 0.
-		return f.sum(axis=1)
-
-	def curl(self, y: np.ndarray=None) -> np.ndarray:
+		return np.asarray(f.sum(axis=1)).ravel()
+
+	def _flux(self, y: np.ndarray, sign: float, out: np.ndarray) -> np.ndarray:
+		''' Row sums of the positive part of sign * B diag(y), using a work matrix sharing the incidence sparsity ''' 
+		if getattr(self, '_flux_work', None) is None or self._flux_work[1].nnz != self.incidence.nnz:
+			B = self.incidence.tocsr()
+			self._flux_work = (B, sp.csr_matrix((np.empty_like(B.data), B.indices, B.indptr), shape=B.shape), np.ones(B.shape[1], dtype=B.dtype))
+		B, W, ones = self._flux_work
+		np.take(y, B.indices, out=W.data)
+		np.multiply(W.data, B.data, out=W.data)
+		if sign < 0:
+			np.negative(W.data, out=W.data)
+		np.maximum(W.data, 0., out=W.data)
+		return spmv(W, ones, out, threads=self.spmv_threads)
+
+	@memoized
+	def curl(self, y: np.ndarray=None, out: np.ndarray=None) -> np.ndarray:
 		if y is None: y=self.y
-		raise self.curl3@y
+		return spmv(self.curl3, y, out, threads=self.spmv_threads)
 
-	def laplacian(self, y: np.ndarray=None) -> np.ndarray:
+	@memoized
+	def laplacian(self, y: np.ndarray=None, out: np.ndarray=None) -> np.ndarray:
 		''' Vector laplacian or discrete Helmholtz operator or Hodge-1 laplacian
 		https://www.stat.uchicago.edu/~lekheng/work/psapm.pdf 
 		TODO: neumann conditions
 		''' 
 		if y is None: y=self.y
-		ret = self.dirichlet_laplacian@y 
+		if self.uses_stencil(y):
+			out = self.lattice.grad(self.lattice.incidence(y, self.stencil_work(len(self.nodes), y)), out)
+			np.negative(out, out=out)
+			out[self.dirichlet_indices] = 0.
+		elif out is None:
+			ret = spmv(self.dirichlet_laplacian, y, threads=self.spmv_threads)
+			if self.curl3.shape[0] > 0:
+				ret -= spmv(self.curl3.T, spmv(self.curl3, y, threads=self.spmv_threads), threads=self.spmv_threads)
+			return ret
+		else:
+			spmv(self.dirichlet_laplacian, y, out, threads=self.spmv_threads)
 		if self.curl3.shape[0] > 0:
-			ret -= self.curl3.T@self.curl3@y
-		return ret
-
-	def bilaplacian(self, y: np.ndarray=None) -> np.ndarray:
+			if getattr(self, '_curl_work', None) is None or self._curl_work[1].shape != out.shape or self._curl_work[0].shape[0] != self.curl3.shape[0]:
+				self._curl_work = (np.empty((self.curl3.shape[0],) + out.shape[1:], dtype=out.dtype), np.empty_like(out))
+			c = spmv(self.curl3, y, self._curl_work[0], threads=self.spmv_threads)
+			out -= spmv(self.curl3.T, c, self._curl_work[1], threads=self.spmv_threads)
+		return out
+
+	@memoized
+	def bilaplacian(self, y: np.ndarray=None, out: np.ndarray=None) -> np.ndarray:
 		''' 
 		TODO: neumann conditions
 		TODO: check curl term?
 		''' 
-		return self.laplacian(self.laplacian(y))
+		return self.laplacian(self.laplacian(y), out=out)
 
-	def advect(self, v_field: Union[Callable[[Edge], float], np.ndarray] = None, y: np.ndarray=None, vectorized=True, check=False) -> np.ndarray:
+	@memoized
+	def advect(self, v_field: Union[Callable[[Edge], float], np.ndarray] = None, y: np.ndarray=None, vectorized=True, check=False, out: np.ndarray=None) -> np.ndarray:
 		'''
 		Transportation of a vector field.
+		The transport operator depends on the velocity field, so is assembled on each call; the result is copied into out.
 		'''
 		if y is None: y=self.y
 		if v_field is None: 
@@ -245,6 +782,9 @@ class edge_gds(gds):
 				except:
 					print('Advection check failed')
 					pdb.set_trace()
+			if out is not None:
+				np.copyto(out, ret)
+				return out
 			return ret
 		else:
 			''' Non-vectorized version, for debugging purposes ''' 
@@ -287,4 +827,95 @@ class edge_gds(gds):
 
 class simplex_gds(gds):
 	''' Dynamical system defined on k-simplices of a graph ''' 
-	pass
\ No newline at end of file
+	pass
+
+''' Groups of fields on the same graph ''' 
+
+class field_group:
+	''' Fields sharing a graph domain, whose operators are applied to all of them at once.
+	''' 
+	operators = ('grad', 'div', 'curl', 'laplacian', 'bilaplacian')
+
+	def __init__(self, *fields: Tuple[gds]):
+		''' 
+		Stacks the fields' states as columns of an (ndim, k) block and applies each shared operator with a single sparse-dense 
+		product, so its matrix is streamed from memory once per evaluation instead of once per field. The result is memoized
+		against the fields' state versions. Afterwards, calling e.g. laplacian() on any member (with default arguments) returns 
+		its column of the stacked result. Boundary conditions may differ between fields; they are applied per column.
+		''' 
+		assert len(fields) >= 1, 'Pass one or more fields to group'
+		f0 = fields[0]
+		for f in fields:
+			assert f.G is f0.G and f.Gd is f0.Gd, 'Grouped fields must be defined on the same graph domain'
+			assert np.array_equal(f.weights, f0.weights), 'Grouped fields must share edge weights'
+			assert f.dtype == f0.dtype, 'Grouped fields must share a dtype'
+			assert f.ensemble is None, 'Ensembles cannot be grouped'
+			assert f._group is None, 'Field already belongs to a group'
+		self.fields = fields
+		self._index = {id(f): j for j, f in enumerate(fields)}
+		self._block = np.zeros((f0.ndim, len(fields)), dtype=f0.dtype)
+		self._memo = dict()
+		for f in fields:
+			f._group = self
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state.pop('_op_lock', None) # Locks cannot be pickled; recreated on demand
+		return state
+
+	def index(self, f: gds) -> int:
+		return self._index[id(f)]
+
+	def version(self) -> Tuple:
+		return tuple((f.state_version, f._op_version) for f in self.fields)
+
+	def gather(self) -> np.ndarray:
+		''' Stack the fields' current states as columns ''' 
+		for j, f in enumerate(self.fields):
+			self._block[:, j] = f.y
+		return self._block
+
+	def apply(self, name: str) -> np.ndarray:
+		''' Stacked result of an operator, one contiguous row per field ''' 
+		key = self.version()
+		hit = self._memo.get(name)
+		if hit is not None and hit[0] == key:
+			return hit[1]
+		f0, Y = self.fields[0], self.gather()
+		if name == 'grad':
+			R = f0.lattice.grad(Y) if f0.uses_stencil(Y) else spmv(f0.incidence_t, Y, threads=f0.spmv_threads)
+		elif name == 'div':
+			R = np.negative(f0.lattice.incidence(Y) if f0.uses_stencil(Y) else spmv(f0.incidence, Y, threads=f0.spmv_threads))
+		elif name == 'curl':
+			R = spmv(f0.curl3, Y, threads=f0.spmv_threads)
+		elif name == 'laplacian':
+			R = self.laplacian(Y)
+		elif name == 'bilaplacian':
+			R = self.dirichlet_laplacian(self.laplacian(Y))
+		ret = np.ascontiguousarray(R.T)
+		ret.flags.writeable = False
+		self._memo[name] = (key, ret)
+		return ret
+
+	def dirichlet_laplacian(self, Y: np.ndarray) -> np.ndarray:
+		''' Each field's Dirichlet Laplacian (for edges, including the curl term) applied to its column ''' 
+		f0 = self.fields[0]
+		t = f0.spmv_threads
+		if f0.uses_stencil(Y) and f0.Gd is GraphDomain.nodes:
+			R = f0.lattice.laplacian(Y)
+		elif f0.uses_stencil(Y):
+			R = np.negative(f0.lattice.grad(f0.lattice.incidence(Y)))
+		else:
+			R = spmv(f0.vertex_laplacian if f0.Gd is GraphDomain.nodes else f0.edge_laplacian, Y, threads=t)
+		for j, f in enumerate(self.fields):
+			R[f.dirichlet_indices, j] = 0.
+		if f0.Gd is GraphDomain.edges and f0.curl3.shape[0] > 0:
+			R -= spmv(f0.curl3.T, spmv(f0.curl3, Y, threads=t), threads=t)
+		return R
+
+	def laplacian(self, Y: np.ndarray) -> np.ndarray:
+		R = self.dirichlet_laplacian(Y)
+		if self.fields[0].Gd is GraphDomain.nodes:
+			for j, f in enumerate(self.fields):
+				R[:, j] += f.neumann_correction
+		return R
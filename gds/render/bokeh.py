@@ -117,6 +117,8 @@ class Renderer(ABC):
 	def create_plot(self, items: List[Observable]):
 		assert all([obs.G is items[0].G for obs in items]), 'Co-rendered observables must use the same graph'
 		orig_G = items[0].G
+		if isinstance(orig_G, ArrayGraph): # Only rendering needs the networkx graph
+			orig_G = orig_G.to_networkx()
 		layout = self.layout_func(orig_G)
 		G = nx.convert_node_labels_to_integers(orig_G) # Bokeh cannot handle non-primitive node keys (eg. tuples)
 		G = clear_attributes(G)
@@ -137,12 +139,12 @@ class Renderer(ABC):
 			# Domain-specific rendering
 			if isinstance(obs, GraphObservable):
 				if obs.Gd is GraphDomain.nodes: 
-					plot.renderers[0].node_renderer.data_source.data['node'] = list(map(str, items[0].G.nodes()))
-					plot.renderers[0].node_renderer.data_source.data['value'] = obs.y 
+					plot.renderers[0].node_renderer.data_source.data['node'] = list(map(str, orig_G.nodes()))
+					plot.renderers[0].node_renderer.data_source.data['value'] = obs.to_graph_order(obs.y)
 					cmap = LinearColorMapper(palette=self.node_palette, low=self.node_rng[0], high=self.node_rng[1])
 					self.node_cmaps[obs.plot_id] = cmap
 					if isinstance(obs, gds):
-						plot.renderers[0].node_renderer.data_source.data['thickness'] = [3 if (x in obs.X_dirichlet or x in obs.X_neumann) else 1 for x in obs.X] 
+						plot.renderers[0].node_renderer.data_source.data['thickness'] = [3 if (x in obs.X_dirichlet or x in obs.X_neumann) else 1 for x in orig_G.nodes()] 
 						plot.renderers[0].node_renderer.glyph = Ellipse(height=self.node_size, width=self.node_size, fill_color=field('value', cmap), line_width='thickness')
 					else:
 						plot.renderers[0].node_renderer.glyph = Ellipse(height=self.node_size, width=self.node_size, fill_color=field('value', cmap))
@@ -151,8 +153,8 @@ class Renderer(ABC):
 						plot.add_layout(cbar, 'right')
 				elif obs.Gd is GraphDomain.edges:
 					self.prep_layout_data(obs, G, layout)
-					obs.arr_source.data['edge'] = list(map(str, items[0].G.edges()))
-					self.draw_arrows(obs, obs.y)
+					obs.arr_source.data['edge'] = list(map(str, orig_G.edges()))
+					self.draw_arrows(obs, obs.to_graph_order(obs.y))
 					plot.renderers[0].edge_renderer.data_source.data['value'] = obs.arr_source.data['value']
 					cmap = LinearColorMapper(palette=self.edge_palette, low=self.edge_rng[0], high=self.edge_rng[1])
 					self.edge_cmaps[obs.plot_id] = cmap
@@ -165,7 +167,7 @@ class Renderer(ABC):
 						if self.edge_colors:
 							plot.renderers[0].edge_renderer.glyph = MultiLine(line_width=5, line_color=field('value', cmap))
 						else:
-							plot.renderers[0].edge_renderer.data_source.data['thickness'] = [3 if (x in obs.X_dirichlet or x in obs.X_neumann) else 1 for x in obs.X] 
+							plot.renderers[0].edge_renderer.data_source.data['thickness'] = [3 if (x in obs.X_dirichlet or x in obs.X_neumann) else 1 for x in orig_G.edges()] 
 							plot.renderers[0].edge_renderer.glyph = MultiLine(line_width='thickness')
 				else:
 					raise Exception('unknown graph domain.')
@@ -208,7 +210,7 @@ class Renderer(ABC):
 		else:
 			# TODO: cleanup
 			magn = np.clip(np.sqrt(absy), a_min=None, a_max=self.edge_max)
-		dx = -np.sign(obs.y) * magn * obs.layout['dx_dir'] * h / np.sqrt(obs.layout['m'] ** 2 + 1)
+		dx = -np.sign(y) * magn * obs.layout['dx_dir'] * h / np.sqrt(obs.layout['m'] ** 2 + 1)
 		dy = obs.layout['m'] * dx
 		p1x = obs.layout['x_mid'] - dx/2
 		p1y = obs.layout['y_mid'] - dy/2
@@ -263,7 +265,7 @@ class LiveRenderer(Renderer):
 			if hasattr(obs, 'plot_id'):
 				plot = self.plots[obs.plot_id]
 				if obs.Gd is GraphDomain.nodes:
-					self.plots[obs.plot_id].renderers[0].node_renderer.data_source.data['value'] = obs.y
+					self.plots[obs.plot_id].renderers[0].node_renderer.data_source.data['value'] = obs.to_graph_order(obs.y)
 					if self.dynamic_ranges:
 						lo, hi = obs.y.min(), obs.y.max()
 						mid = (lo+hi)/2
@@ -271,7 +273,7 @@ class LiveRenderer(Renderer):
 						self.node_cmaps[obs.plot_id].low = lo
 						self.node_cmaps[obs.plot_id].high = hi
 				elif obs.Gd is GraphDomain.edges:
-					self.draw_arrows(obs, obs.y)
+					self.draw_arrows(obs, obs.to_graph_order(obs.y))
 					self.plots[obs.plot_id].renderers[0].edge_renderer.data_source.data['value'] = obs.arr_source.data['value']
 					if self.dynamic_ranges:
 						lo, hi = obs.arr_source.data['value'].min(), obs.arr_source.data['value'].max()
@@ -310,7 +312,7 @@ class StaticRenderer(Renderer):
 			self.system = cloudpickle.load(f)
 		self.data = dict()
 		for name in self.system.observables.keys():
-			self.data[name] = hkl.load(f'{path}/{name}.hkl')
+			self.data[name] = load_frames(path, name)
 		self._t = 0.
 		self._i = 0
 		super().__init__(*args, **kwargs)
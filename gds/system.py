@@ -4,6 +4,7 @@ import pdb
 import os.path
 import os
 import hickle as hkl
+import h5py
 import cloudpickle
 from tqdm import tqdm
 
@@ -12,6 +13,11 @@ from .render.base import *
 
 ''' System objects ''' 
 
+def graph_order(obs: Observable, y: np.ndarray) -> np.ndarray:
+	''' Values of an observable as saved to disk: in networkx order for observables on reordered graphs ''' 
+	return obs.to_graph_order(y) if hasattr(obs, 'to_graph_order') else y
+
+
 class System:
 	def __init__(self, stepper: Steppable, observables: Dict[str, Observable]):
 		self._stepper = stepper
@@ -31,64 +37,164 @@ class System:
 	def arrange(self, ncols: int=np.inf) -> Canvas:
 		return grid_canvas(list(self._observables.values()), ncols=ncols)
 
-	def solve_to_disk(self, T: float, dt: float, folder: str, parent='runs'): 
+	def solve_to_disk(self, T: float, dt: float, folder: str, parent='runs', flush: int=100, compression: str='gzip'):
+		'''
+		Step to time T, streaming the observables' values after each step of dt to {parent}/{folder}/trajectory.h5.
+		Frames are buffered and appended to the file every flush steps, so memory stays bounded and the file holds a
+		valid partial result throughout (see TrajectoryWriter).
+		'''
 		assert os.path.isdir(parent), f'Parent directory "{parent}" does not exist'
 		path = parent + '/' + folder
 		if not os.path.isdir(path):
 			os.mkdir(path)
-		dump = dict()
+		# Dump system object first, so that partial results can be loaded
+		with open(f'{path}/system.pkl', 'wb') as f:
+			self.dt = dt # Save the dt (hacky)
+			cloudpickle.dump(self, f)
 		obs_items = self.observables.items()
-		for name, obs in obs_items:
-			dump[name] = []
 		t = 0.
-		try:
+		with TrajectoryWriter(f'{path}/trajectory.h5', flush=flush, compression=compression, attrs={'dt': dt}) as writer:
 			with tqdm(total=int(T / dt), desc=folder) as pbar:
-				while t < T:
+				while t < T and not self.stepper.terminated:
 					self.stepper.step(dt)
-					for name, obs in obs_items:
-						dump[name].append(obs.y.copy())
+					writer.append(self.stepper.t, {name: graph_order(obs, obs.y) for name, obs in obs_items})
 					t += dt
 					pbar.update(1)
-		finally:
-			# Dump simulation data
-			for name, data in dump.items():
-				hkl.dump(np.array(data), f'{path}/{name}.hkl', mode='w', compression='gzip')
-			# Dump system object
-			with open(f'{path}/system.pkl', 'wb') as f:
-				self.dt = dt # Save the dt (hacky)
-				cloudpickle.dump(self, f)
 
 	@staticmethod
 	def from_disk(folder: str, parent='runs'):
+		''' Replay a solution from disk; frames are read as they are stepped to (those of older .hkl runs are loaded whole) '''
 		path = parent + '/' + folder
 		assert os.path.isdir(path), 'The given path does not exist'
 		with open(f'{path}/system.pkl', 'rb') as f:
 			sys = cloudpickle.load(f)
 		data = dict()
 		n = 0
-		for name in sys.observables.keys():
-			data[name] = hkl.load(f'{path}/{name}.hkl')
-			n = data[name].shape[0]
+		for name, obs in sys.observables.items():
+			data[name] = StoredFrames(load_frames(path, name), obs) # Saved in networkx order
+			n = len(data[name])
 		sys_dt = sys.dt
 
 		class DummySteppable(Steppable):
 			def __init__(self):
 				self.t = 0.
 				self.i = 0
+				self.registry = StateRegistry(self)
 
 			def step(self, dt: float):
 				T = self.t + dt
-				while self.t < T and self.i < n:
+				while self.t < T and self.i < n - 1:
 					self.t += sys_dt
 					self.i += 1
+				self.bind()
 
 			def reset(self):
 				self.t = 0.
 				self.i = 0
+				self.bind()
+
+			def bind(self):
+				for name, obs in sys.observables.items():
+					if isinstance(obs, Steppable):
+						self.registry.bind(obs, data[name][self.i])
 
 		stepper = DummySteppable()
 		for name, obs in sys.observables.items():
 			obs.history = data[name] # Hacky
-			attach_dyn_props(obs, {'y': lambda self: self.history[stepper.i], 't': lambda _: stepper.t})
+			if not isinstance(obs, Steppable): # Observables without a registry-aware state
+				attach_dyn_props(obs, {'y': lambda self: self.history[stepper.i], 't': lambda _: stepper.t})
+		stepper.bind()
 
 		return System(stepper, sys.observables)
+
+
+''' Trajectories on disk ''' 
+
+class TrajectoryWriter:
+	''' 
+	Streams frames of named arrays to an HDF5 file, as resizable datasets of shape (frames, *frame shape) with compressed 
+	chunks along time, plus a dataset t of frame times. Frames are buffered and appended every flush frames (and on 
+	close), so memory is bounded by the buffer. The file is written in single-writer/multiple-reader mode: after each 
+	flush it is a valid result up to that frame, which other processes may read with h5py.File(path, 'r', swmr=True).
+	''' 
+	chunk_bytes = 1 << 20 # Target size of uncompressed chunks
+
+	def __init__(self, path: str, flush: int=100, compression: str='gzip', attrs: Dict[str, Any]={}):
+		assert flush >= 1, 'Flush after at least one frame'
+		self.file = h5py.File(path, 'w', libver='latest')
+		self.file.attrs.update(attrs)
+		self.flush_every = flush
+		self.compression = compression
+		self.buffers = None # Frame buffers by name, created on the first frame
+		self.n = 0 # Frames buffered
+
+	def append(self, t: float, frames: Dict[str, np.ndarray]):
+		frames = {'t': np.float64(t), **frames}
+		if self.buffers is None:
+			self.create(frames)
+		for name, y in frames.items():
+			self.buffers[name][self.n] = y
+		self.n += 1
+		if self.n == self.flush_every:
+			self.flush()
+
+	def create(self, frames: Dict[str, np.ndarray]):
+		self.buffers = dict()
+		for name, y in frames.items():
+			y = np.asarray(y)
+			rows = max(1, min(self.flush_every, self.chunk_bytes // max(y.nbytes, 1)))
+			self.file.create_dataset(name, shape=(0, *y.shape), maxshape=(None, *y.shape), dtype=y.dtype, 
+				chunks=(rows, *y.shape), compression=self.compression)
+			self.buffers[name] = np.empty((self.flush_every, *y.shape), dtype=y.dtype)
+		self.file.swmr_mode = True
+
+	def flush(self):
+		''' Append the buffered frames to the datasets, and flush the file to disk ''' 
+		if self.n > 0:
+			for name, buf in self.buffers.items():
+				ds = self.file[name]
+				m = ds.shape[0]
+				ds.resize(m + self.n, axis=0)
+				ds[m:] = buf[:self.n]
+			self.n = 0
+		self.file.flush()
+
+	def close(self):
+		if self.file.id.valid:
+			self.flush()
+			self.file.close()
+
+	def __enter__(self) -> 'TrajectoryWriter':
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+def load_frames(path: str, name: str) -> Any:
+	''' Saved frames of an observable: a lazily-read dataset of trajectory.h5, or an array from an older .hkl file ''' 
+	if os.path.isfile(f'{path}/trajectory.h5'):
+		return h5py.File(f'{path}/trajectory.h5', 'r', swmr=True)[name]
+	return hkl.load(f'{path}/{name}.hkl')
+
+class StoredFrames:
+	''' Frames of an observable as saved (in networkx order), read on indexing and returned in its own index order ''' 
+	def __init__(self, data: Any, obs: Observable):
+		self.data = data
+		self.obs = obs
+
+	def __getitem__(self, idx) -> np.ndarray:
+		y = np.asarray(self.data[idx])
+		if not hasattr(self.obs, 'from_graph_order'):
+			return y
+		return self.obs.from_graph_order(y, axis=1 if y.ndim == len(self.data.shape) else 0)
+
+	def __len__(self) -> int:
+		return self.data.shape[0]
+
+	@property
+	def shape(self) -> Tuple[int, ...]:
+		return self.data.shape
+
+	def __array__(self, dtype=None, copy=None) -> np.ndarray:
+		y = self[:]
+		return y if dtype is None else y.astype(dtype)
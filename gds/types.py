@@ -27,7 +27,8 @@ Orientation = Dict[Edge, Sign]
 BoundaryCondition = Union[
 	Dict[Point, float],
 	Callable[[Point], float],
-	Callable[[Time, Point], float]
+	Callable[[Time, Point], float],
+	Tuple[np.ndarray, Union[float, np.ndarray, Callable[[Time], np.ndarray]]] # Point indices and values
 ]
 
 ''' Base interfaces ''' 
@@ -41,6 +42,8 @@ class IterationMode(Enum):
 
 class Steppable(ABC):
 	''' An object which can be stepped through time ''' 
+	terminated = False # Set when a terminal event stops the run
+
 	def __init__(self, iter_mode: IterationMode):
 		self.iter_mode = iter_mode
 
@@ -57,9 +60,17 @@ class Observable(ABC):
 	''' An object which can be observed through time ''' 
 	def __init__(self, X: Domain):
 		self.X = X # Domain
-		self.iX = {i: x for x, i in X.items()} # Reverse-lookup domain
+		self._iX = None
 		self.ndim = len(X)
 
+	@property
+	def iX(self) -> Dict[int, Point]:
+		''' Reverse-lookup domain, built on first use ''' 
+		if getattr(self, '_iX', None) is None:
+			labels = getattr(self.X, 'labels', None) # Lazy domains provide their own
+			self._iX = labels if labels is not None else {i: x for x, i in self.X.items()}
+		return self._iX
+
 	@property
 	@abstractmethod
 	def t(self) -> float:
@@ -78,4 +89,47 @@ class Observable(ABC):
 		return self.y[self.X[x]]
 
 	def __len__(self):
-		return self.ndim
\ No newline at end of file
+		return self.ndim
+
+class bound_state:
+	''' 
+	Read-only state attribute computed by the given getter, unless a StateRegistry has set the observable's view of the 
+	shared state as an instance attribute of the same name. Unlike a property, it does not shadow instance attributes, 
+	so reading a bound state is a plain attribute lookup.
+	''' 
+	def __init__(self, fget: Callable):
+		self.fget = fget
+		self.__doc__ = fget.__doc__
+
+	def __get__(self, obj: Any, cls: type=None):
+		return self if obj is None else self.fget(obj)
+
+class StateRegistry:
+	''' State of observables which are stepped by another object, such as a coupled system.
+	Bound observables hold a precomputed view of the shared state as their y attribute (see bound_state), so reading 
+	it goes through neither the stepper nor the observable. The stepper keeps the view current by writing into it.
+	''' 
+	def __init__(self, stepper: Steppable):
+		self.stepper = stepper
+		self.version = 0
+
+	@property
+	def t(self) -> float:
+		return self.stepper.t
+
+	def bind(self, obs: Observable, y: np.ndarray):
+		''' Bind an observable to a view of the shared state; rebinding replaces the view ''' 
+		assert y.dtype == getattr(obs, 'dtype', y.dtype), 'Views must be in the precision of the observable'
+		obs._registry = self
+		obs.__dict__['y'] = y
+		self.invalidate()
+
+	@staticmethod
+	def unbind(obs: Observable):
+		''' Return an observable to reading its own state ''' 
+		obs._registry = None
+		obs.__dict__.pop('y', None)
+
+	def invalidate(self):
+		''' Mark the shared state as changed ''' 
+		self.version += 1
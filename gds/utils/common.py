@@ -2,6 +2,13 @@ import numpy as np
 from typing import Tuple, List, Any, Iterable, Callable, Dict, Set
 import shortuuid
 from scipy.sparse import csr_matrix, coo_matrix, dok_matrix
+try:
+	from scipy.sparse._sparsetools import csr_matvec, csc_matvec, csr_matvecs, csc_matvecs
+except ImportError:
+	from scipy.sparse.sparsetools import csr_matvec, csc_matvec, csr_matvecs, csc_matvecs
+from concurrent.futures import ThreadPoolExecutor
+import weakref
+import os
 import random
 from functools import reduce
 from inspect import signature
@@ -35,6 +42,36 @@ class bidict(dict):
 	def __contains__(self, key: Tuple[Any, Any]):
 		return dict.__contains__(self, key) or dict.__contains__(self, (key[1], key[0]))
 
+class growable:
+	''' Array with amortized constant-time appends and removals of rows, by doubling its capacity ''' 
+	def __init__(self, data: np.ndarray):
+		data = np.asarray(data)
+		self._buf = np.empty((max(2*len(data), 8),) + data.shape[1:], dtype=data.dtype)
+		self._buf[:len(data)] = data
+		self.size = len(data)
+
+	def view(self) -> np.ndarray:
+		return self._buf[:self.size]
+
+	def append(self, rows: np.ndarray):
+		rows = np.asarray(rows, dtype=self._buf.dtype).reshape((-1,) + self._buf.shape[1:])
+		k = len(rows)
+		if self.size + k > len(self._buf):
+			buf = np.empty((max(2*len(self._buf), self.size + k),) + self._buf.shape[1:], dtype=self._buf.dtype)
+			buf[:self.size] = self._buf[:self.size]
+			self._buf = buf
+		self._buf[self.size:self.size+k] = rows
+		self.size += k
+
+	def swap_remove(self, i: int) -> int:
+		''' Remove row i by moving the last row into its place; returns the previous index of the moved row ''' 
+		self.size -= 1
+		self._buf[i] = self._buf[self.size]
+		return self.size
+
+	def __len__(self):
+		return self.size
+
 def replace(arr: np.ndarray, replace_at: list, replace_with: np.ndarray):
 	arr[replace_at] = replace_with
 	return arr
@@ -71,6 +108,116 @@ def sparse_product(X: Iterable[Any], Y: Iterable[Any], fun: Callable[[Any, Any],
 	data = coo_matrix((vals, (xi, yi)), shape=(m, n))
 	return data
 
+def spmv(A: Any, x: np.ndarray, out: np.ndarray=None, accumulate: bool=False, threads: int=None) -> np.ndarray:
+	''' Sparse product A@x. If out is given, the product is written (or added, if accumulate) into it without temporaries. 
+	With more than one thread (by default, see set_spmv_threads), large products are split by rows across a thread pool; 
+	threads beyond the available cores only add dispatch overhead, so their number is capped at spmv_cores. 
+	''' 
+	threads = min(spmv_threads if threads is None else threads, spmv_cores)
+	if threads > 1 and isinstance(x, np.ndarray) and A.format in ('csr', 'csc') and A.nnz >= threaded_min_nnz:
+		if out is None: # Written, not accumulated, so that CSC products (e.g. gradients) are eligible too
+			out = np.empty((A.shape[0],) + x.shape[1:], dtype=np.result_type(A.dtype, x.dtype))
+			accumulate = False
+		if threaded_spmv(A, x, out, accumulate, threads):
+			return out
+	if out is None:
+		return A@x
+	if not accumulate:
+		out.fill(0.)
+	fast = A.format in ('csr', 'csc') and x.dtype == A.dtype == out.dtype and x.flags.c_contiguous and out.flags.c_contiguous
+	if fast and x.ndim == 1:
+		matvec = csr_matvec if A.format == 'csr' else csc_matvec
+		matvec(A.shape[0], A.shape[1], A.indptr, A.indices, A.data, x, out)
+	elif fast and x.ndim == 2:
+		matvecs = csr_matvecs if A.format == 'csr' else csc_matvecs
+		matvecs(A.shape[0], A.shape[1], x.shape[1], A.indptr, A.indices, A.data, x.ravel(), out.ravel())
+	else:
+		out += A@x
+	return out
+
+''' Threaded sparse products ''' 
+
+spmv_threads = 1 # Default number of threads used by spmv
+spmv_cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1) # Available to this process
+threaded_min_nnz = 1 << 16 # Smaller products are not worth dispatching to the pool
+_spmv_pool = None
+_row_blocks = dict() # id(A) -> (weakref to A, its row blocks)
+
+def set_spmv_threads(threads: int):
+	''' Set the default number of threads for sparse products; fields may override it with gds.set_threads() ''' 
+	global spmv_threads
+	spmv_threads = threads
+
+def spmv_forget(A: Any):
+	''' Drop the cached row blocks of A, e.g. after modifying its data in place ''' 
+	_row_blocks.pop(id(A), None)
+
+def row_blocks(A: Any, threads: int) -> List[Tuple]:
+	''' 
+	Partition of A's rows into contiguous blocks of near-equal nonzeros, as (start, stop, indptr, indices, data) with 
+	indices and data viewing A's (or, for CSC, those of a cached CSR copy). 
+	''' 
+	hit = _row_blocks.get(id(A))
+	if hit is not None and hit[0]() is A and len(hit[1]) == threads and hit[2] is A.data:
+		return hit[1]
+	R = A if A.format == 'csr' else A.tocsr()
+	bounds = np.searchsorted(R.indptr, np.linspace(0, R.nnz, threads+1)[1:-1])
+	bounds = np.concatenate(([0], bounds, [R.shape[0]]))
+	blocks = []
+	for r0, r1 in zip(bounds[:-1], bounds[1:]):
+		p0, p1 = R.indptr[r0], R.indptr[r1]
+		blocks.append((r0, r1, R.indptr[r0:r1+1] - p0, R.indices[p0:p1], R.data[p0:p1]))
+	key = id(A)
+	_row_blocks[key] = (weakref.ref(A, lambda _: _row_blocks.pop(key, None)), blocks, A.data) # Dropped along with A
+	return blocks
+
+def threaded_spmv(A: Any, x: np.ndarray, out: np.ndarray, accumulate: bool, threads: int) -> bool:
+	''' 
+	Row-partitioned product on the thread pool; the sparsetools kernels release the GIL. Each row is computed by one 
+	thread exactly as in the serial kernel, so results are bit-identical to it. Returns False if the product is not 
+	eligible, in which case the caller falls back to the serial path.
+	''' 
+	global _spmv_pool
+	if not (x.dtype == A.dtype == out.dtype and x.flags.c_contiguous and out.flags.c_contiguous and x.ndim in (1, 2)):
+		return False
+	if A.format == 'csc' and accumulate: # Serial CSC accumulates column by column, which row blocks cannot reproduce
+		return False
+	blocks = row_blocks(A, threads)
+	if _spmv_pool is None or _spmv_pool._max_workers < threads:
+		_spmv_pool = ThreadPoolExecutor(max_workers=threads)
+	n = A.shape[1]
+	def run(block: Tuple):
+		r0, r1, indptr, indices, data = block
+		o = out[r0:r1]
+		if not accumulate:
+			o.fill(0.)
+		if x.ndim == 1:
+			csr_matvec(r1-r0, n, indptr, indices, data, x, o)
+		else:
+			csr_matvecs(r1-r0, n, x.shape[1], indptr, indices, data, x.ravel(), o.ravel())
+	for _ in _spmv_pool.map(run, blocks): # Propagate exceptions
+		pass
+	return True
+
+def lincomb(out: np.ndarray, *terms: Tuple, const: float=0., work: np.ndarray=None) -> np.ndarray:
+	''' In-place expression: out = const + sum(coef * f1 * f2 * ...) over terms (coef, f1, f2, ...). 
+	Pass a work buffer shaped like out to avoid allocating a temporary; factors must not alias out. E.g.
+
+		lincomb(out, (dS, S.laplacian(out=lap)), (-muS, S.y), (-beta, S.y, I.y), const=Lambda, work=work)
+	''' 
+	out[...] = const
+	for coef, *factors in terms:
+		if np.isscalar(coef) and coef == 1 and len(factors) == 1:
+			np.add(out, factors[0], out=out)
+			continue
+		if work is None:
+			work = np.empty_like(out)
+		np.multiply(factors[0], coef, out=work)
+		for f in factors[1:]:
+			np.multiply(work, f, out=work)
+		np.add(out, work, out=out)
+	return out
+
 def oneof(xs: List[bool]):
 	return reduce(lambda x, y: x ^ y, xs)
 
@@ -87,5 +234,29 @@ def merge_dicts(xs: Iterable[Dict]) -> Dict:
 def flatten(arr: List[Any]) -> List:
 	return list(chain.from_iterable(arr))
 
+def topological_levels(xs: List[Any], deps: Dict[Any, Iterable[Any]]) -> List[List[Any]]:
+	''' Group xs into levels such that each item comes after the items of xs it depends on ''' 
+	members = set(xs)
+	level = dict()
+	def visit(x, stack):
+		if x not in level:
+			assert x not in stack, 'Cyclic dependency'
+			stack.add(x)
+			level[x] = 1 + max([visit(d, stack) for d in deps.get(x, []) if d in members], default=-1)
+			stack.remove(x)
+		return level[x]
+	for x in xs:
+		visit(x, set())
+	return [[x for x in xs if level[x] == l] for l in range(max(level.values(), default=-1) + 1)]
+
+def lazy(thunk: Callable[[], Any]) -> Callable[[], Any]:
+	''' Memoize a zero-argument function on first call ''' 
+	ret = []
+	def fun():
+		if not ret:
+			ret.append(thunk())
+		return ret[0]
+	return fun
+
 def now():
 	return datetime.datetime.now()
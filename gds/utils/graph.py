@@ -1,8 +1,14 @@
 ''' Graph utilities ''' 
 import networkx as nx
 import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.csgraph
 import pdb
 import matplotlib.pyplot as plt
+from typing import Any, List, Dict, Callable, Tuple, Union
+from collections.abc import Mapping
+
+from gds.types import *
 
 ''' Graph generators ''' 
 
@@ -32,6 +38,10 @@ def square_lattice(m: int, n: int, diagonals=False, with_boundaries=False, **kwa
 				G.add_edges_from([((i, j), (i+1, j+1)), ((i, j+1), (i+1, j))])
 	pos = grid_graph_layout(G)
 	nx.set_node_attributes(G, pos, 'pos')
+	periodic = kwargs.get('periodic', False)
+	periodic = tuple(periodic) if np.iterable(periodic) else (periodic, periodic)
+	if (not periodic[0] or n >= 3) and (not periodic[1] or m >= 3): # Shorter wraps duplicate edges
+		Lattice.square(n, m, periodic=periodic, diagonals=diagonals).attach(G)
 	if with_boundaries:
 		l = G.subgraph([(0, i) for i in range(m)])
 		r = G.subgraph([(n-1, i) for i in range(m)])
@@ -72,6 +82,8 @@ def triangular_lattice(m, n, with_boundaries=False, **kwargs) -> nx.Graph:
 		return G
 	else:
 		G = nx.triangular_lattice_graph(m, n, **kwargs)
+		if n % 2 == 0 and m > 0 and n > 0: # Otherwise nodes are missing from the last column
+			Lattice.triangular(m, n // 2).attach(G)
 		if with_boundaries:
 			l = G.subgraph([(0, i) for i in range(m+1)])
 			r_nodes = [(n//2, 2*i+1) for i in range(m//2+1)]
@@ -97,40 +109,686 @@ def hexagonal_lattice(*args, **kwargs) -> nx.Graph:
 		return nx.triangular_lattice_graph(*args, **kwargs)
 
 
+def planar_boundary_masks(pos: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+	''' 
+	Masks of the points of a planar layout (one row of coordinates each) which are extreme within their row or column: 
+	any, leftmost, rightmost, topmost and bottommost. Rows and columns group points of exactly equal coordinate. 
+	''' 
+	def extremes(key: np.ndarray, val: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+		order = np.argsort(key, kind='stable')
+		k = key[order]
+		new = np.concatenate(([True], k[1:] != k[:-1]))
+		starts = np.flatnonzero(new)
+		group = np.empty(len(key), dtype=np.intp)
+		group[order] = np.cumsum(new) - 1
+		lo, hi = np.minimum.reduceat(val[order], starts), np.maximum.reduceat(val[order], starts)
+		return val == lo[group], val == hi[group]
+	if len(pos) == 0:
+		empty = np.zeros(0, dtype=bool)
+		return empty, empty, empty, empty, empty
+	x, y = pos[:, 0], pos[:, 1]
+	L, R = extremes(y, x)
+	B, T = extremes(x, y)
+	return L | R | T | B, L, R, T, B
+
 def get_planar_boundary(G: nx.Graph) -> (nx.Graph, nx.Graph, nx.Graph, nx.Graph, nx.Graph):
 	''' Get boundary of planar graph using layout coordinates. ''' 
-	nodes = set(G.nodes())
-	edges = set(G.edges())
+	nodes, edges = list(G.nodes()), list(G.edges())
 	pos = nx.get_node_attributes(G, 'pos')
-	xrng, yrng = list(set([pos[n][0] for n in nodes])), list(set([pos[n][1] for n in nodes]))
-	xmin = dict(zip(yrng, [min([pos[n][0] for n in nodes if pos[n][1]==y]) for y in yrng]))
-	ymin = dict(zip(xrng, [min([pos[n][1] for n in nodes if pos[n][0]==x]) for x in xrng]))
-	xmax = dict(zip(yrng, [max([pos[n][0] for n in nodes if pos[n][1]==y]) for y in yrng]))
-	ymax = dict(zip(xrng, [max([pos[n][1] for n in nodes if pos[n][0]==x]) for x in xrng]))
-	dG, dG_L, dG_R, dG_T, dG_B = nx.Graph(), nx.Graph(), nx.Graph(), nx.Graph(), nx.Graph()
-	for n in nodes:
-		x, y = pos[n]
-		if x == xmin[y]:
-			dG_L.add_node(n)
-			dG.add_node(n)
-		if x == xmax[y]:
-			dG_R.add_node(n)
-			dG.add_node(n)
-		if y == ymin[x]:
-			dG_B.add_node(n)
-			dG.add_node(n)
-		if y == ymax[x]:
-			dG_T.add_node(n)
-			dG.add_node(n)
-	for _dG in (dG, dG_L, dG_R, dG_T, dG_B):
-		for n in _dG.nodes():
-			for m in _dG.nodes():
-				# Preserve implicit orientation
-				if (n, m) in edges:
-					_dG.add_edge(n, m)
-				elif (m, n) in edges:
-					_dG.add_edge(m, n)
-	return (dG, dG_L, dG_R, dG_T, dG_B)
+	masks = planar_boundary_masks(np.array([pos[n] for n in nodes], dtype=np.float64).reshape(-1, 2))
+	index = {v: i for i, v in enumerate(nodes)}
+	tails = np.fromiter((index[e[0]] for e in edges), dtype=np.intp, count=len(edges))
+	heads = np.fromiter((index[e[1]] for e in edges), dtype=np.intp, count=len(edges))
+	graphs = []
+	for mask in masks:
+		_dG = nx.Graph()
+		_dG.add_nodes_from(nodes[i] for i in np.flatnonzero(mask))
+		_dG.add_edges_from(edges[k] for k in np.flatnonzero(mask[tails] & mask[heads])) # Preserve implicit orientation
+		graphs.append(_dG)
+	return tuple(graphs)
+
+def planar_boundary_indices(G: nx.Graph, Gd: GraphDomain=GraphDomain.nodes) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+	''' 
+	As get_planar_boundary, but as sorted index arrays into observables on G of the given domain (nodes, or edges with 
+	both ends on the boundary part), usable directly as constraint sets, e.g. dirichlet=(indices, values). 
+	''' 
+	if isinstance(G, ArrayGraph):
+		pos, tails, heads = G.pos, G.tails, G.heads
+	else:
+		nodes, edges, _, _ = graph_ordering(G)
+		attrs = nx.get_node_attributes(G, 'pos')
+		pos = np.array([attrs[v] for v in nodes], dtype=np.float64).reshape(-1, 2)
+		if Gd is GraphDomain.edges:
+			tails, heads = incidence_ends(oriented_incidence(G, {v: i for i, v in enumerate(nodes)}, edges))
+	masks = planar_boundary_masks(np.asarray(pos, dtype=np.float64))
+	if Gd is GraphDomain.nodes:
+		return tuple(np.flatnonzero(mask) for mask in masks)
+	assert Gd is GraphDomain.edges, 'Boundaries are only defined on nodes and edges'
+	return tuple(np.flatnonzero(mask[tails] & mask[heads]) for mask in masks)
+
+''' Operators ''' 
+
+def oriented_incidence(G: nx.Graph, nodes: Dict[Node, int]=None, edges: Iterable[Edge]=None) -> sp.csc_matrix:
+	''' 
+	|V| x |E| incidence matrix with -1 at the tail and 1 at the head of each edge (self-loops give zero columns).
+	Same as nx.incidence_matrix(G, oriented=True), but assembled from index arrays rather than entry by entry.
+	''' 
+	if isinstance(G, ArrayGraph):
+		return incidence_from_arrays(G.tails, G.heads, G.number_of_nodes())
+	if nodes is None:
+		nodes = {v: i for i, v in enumerate(G.nodes())}
+	if edges is None:
+		edges = list(G.edges())
+	m = len(edges)
+	tails = np.fromiter((nodes[e[0]] for e in edges), dtype=np.intp, count=m)
+	heads = np.fromiter((nodes[e[1]] for e in edges), dtype=np.intp, count=m)
+	return incidence_from_arrays(tails, heads, len(nodes))
+
+def incidence_from_arrays(tails: np.ndarray, heads: np.ndarray, n: int) -> sp.csc_matrix:
+	m = len(tails)
+	cols = np.arange(m)
+	data = np.concatenate((-np.ones(m), np.ones(m)))
+	B = sp.csc_matrix((data, (np.concatenate((tails, heads)), np.concatenate((cols, cols)))), shape=(n, m))
+	B.eliminate_zeros()
+	return B
+
+def incidence_ends(B: sp.spmatrix) -> Tuple[np.ndarray, np.ndarray]:
+	''' Tail and head node of each edge (column) of an oriented incidence matrix without self-loops ''' 
+	B = sp.coo_matrix(B)
+	order = np.lexsort((B.data, B.col)) # Per column, the tail (-1) precedes the head (+1)
+	rows = B.row[order].reshape(-1, 2)
+	return rows[:, 0], rows[:, 1]
+
+def laplacian_map(B: sp.spmatrix) -> Tuple[sp.csr_matrix, sp.csr_matrix]:
+	''' 
+	For an incidence matrix B with at most two entries per column, the sparsity pattern of the Laplacian -B diag(w) B.T 
+	(with zero data) and the (nnz x |E|) matrix taking edge weights w to its data, so that the Laplacians of all weightings 
+	of a graph share one structure.
+	''' 
+	B = sp.coo_matrix(B)
+	order = np.argsort(B.col, kind='stable')
+	r, c, d = B.row[order], B.col[order], B.data[order]
+	k = np.flatnonzero(c[1:] == c[:-1]) # Entries followed by the other end of their edge
+	rows = np.concatenate((r, r[k], r[k+1])).astype(np.int64)
+	cols = np.concatenate((r, r[k+1], r[k])).astype(np.int64)
+	edges = np.concatenate((c, c[k], c[k]))
+	vals = -np.concatenate((d*d, d[k]*d[k+1], d[k]*d[k+1]))
+	n = B.shape[0]
+	L = sp.csr_matrix((np.ones(rows.size, dtype=B.dtype), (rows, cols)), shape=(n, n))
+	L.sum_duplicates()
+	L.data[:] = 0.
+	keys = np.repeat(np.arange(n, dtype=np.int64), np.diff(L.indptr)) * n + L.indices
+	P = sp.csr_matrix((vals, (np.searchsorted(keys, rows * n + cols), edges)), shape=(L.nnz, B.shape[1]))
+	return L, P
+
+def triangle_curl(triangles: np.ndarray, tails: np.ndarray, heads: np.ndarray, n: int, weights: np.ndarray) -> sp.csr_matrix:
+	''' 
+	|T| x |E| curl operator of triangles given as node index triples, circulating a -> b -> c -> a; the entry of each of 
+	their edges is its weight's square root, signed by whether the edge is oriented along the circulation.
+	''' 
+	m, T = len(tails), len(triangles)
+	if T == 0:
+		return sp.csr_matrix((0, m))
+	lookup = sp.csr_matrix((np.arange(1, m+1), (tails, heads)), shape=(n, n)) # Edge index + 1 by (tail, head)
+	u, v = triangles.ravel(), triangles[:, [1, 2, 0]].ravel()
+	fwd = np.asarray(lookup[u, v]).ravel()
+	bwd = np.asarray(lookup[v, u]).ravel()
+	cols = np.where(fwd > 0, fwd, bwd) - 1
+	signs = np.where(fwd > 0, 1., -1.)
+	return sp.csr_matrix((signs * np.sqrt(weights[cols]), (np.repeat(np.arange(T), 3), cols)), shape=(T, m))
+
+''' Ordering ''' 
+
+def reorder_graph(G: nx.Graph, method: str='rcm') -> nx.Graph:
+	''' 
+	Choose the order in which observables on G index its nodes and edges, to be called before creating them. 
+	With 'rcm', nodes follow the reverse Cuthill-McKee ordering of the adjacency, which keeps neighbors close in memory 
+	and the operators banded; edges follow by their endpoints' positions. 'natural' restores networkx's order.
+	Labels, orientations and values seen in networkx order (see GraphObservable.to_graph_order) are unaffected.
+	''' 
+	if method == 'natural':
+		G.graph.pop('gds_order', None)
+		return G
+	assert method == 'rcm', f'Unknown ordering {method}'
+	nodes, edges = list(G.nodes()), list(G.edges())
+	index = {v: i for i, v in enumerate(nodes)}
+	B = oriented_incidence(G, index, edges)
+	node_perm = sp.csgraph.reverse_cuthill_mckee(abs(B@B.T).tocsr(), symmetric_mode=True) # Natural index of each node
+	rank = np.empty(len(nodes), dtype=np.intp)
+	rank[node_perm] = np.arange(len(nodes))
+	tails = rank[np.fromiter((index[e[0]] for e in edges), dtype=np.intp, count=len(edges))]
+	heads = rank[np.fromiter((index[e[1]] for e in edges), dtype=np.intp, count=len(edges))]
+	edge_perm = np.lexsort((np.maximum(tails, heads), np.minimum(tails, heads)))
+	G.graph['gds_order'] = ([nodes[i] for i in node_perm], [edges[i] for i in edge_perm], node_perm, edge_perm)
+	return G
+
+def attach_order(G: nx.Graph, nodes: List[Node], edges: List[Edge]) -> Tuple:
+	''' Index observables on G by the given node and edge lists, which must hold G's nodes and (identically oriented) edges ''' 
+	natural_nodes = {v: i for i, v in enumerate(G.nodes())}
+	natural_edges = {e: i for i, e in enumerate(G.edges())}
+	assert len(nodes) == len(natural_nodes) and len(edges) == len(natural_edges), 'Order does not match graph'
+	assert all(e in natural_edges for e in edges), 'Edges must follow the orientation of the graph'
+	node_perm = np.fromiter((natural_nodes[v] for v in nodes), dtype=np.intp, count=len(nodes))
+	edge_perm = np.fromiter((natural_edges[e] for e in edges), dtype=np.intp, count=len(edges))
+	G.graph['gds_order'] = (nodes, edges, node_perm, edge_perm)
+	return G.graph['gds_order']
+
+def graph_ordering(G: nx.Graph) -> Tuple[List[Node], List[Edge], np.ndarray, np.ndarray]:
+	''' 
+	Nodes and edges of G in observable index order, with the natural (networkx) index of each; the latter are None 
+	if the order is natural. Orders that do not fit G, e.g. inherited by its subgraphs or relabeled copies, or left 
+	behind by edits, are ignored.
+	''' 
+	order = G.graph.get('gds_order')
+	if order is None or not order_fits(G, order):
+		return list(G.nodes()), list(G.edges()), None, None
+	return order
+
+def order_fits(G: nx.Graph, order: Tuple) -> bool:
+	''' Whether a stored order still lists G's nodes and edges at their natural indices ''' 
+	nodes, edges, node_perm, edge_perm = order
+	if len(nodes) != G.number_of_nodes() or len(edges) != G.number_of_edges():
+		return False
+	natural_nodes, natural_edges = list(G.nodes()), list(G.edges())
+	return all(natural_nodes[i] == v for v, i in zip(nodes, node_perm)) and all(natural_edges[i] == e for e, i in zip(edges, edge_perm))
+
+def graph_lattice(G: nx.Graph) -> 'Lattice':
+	''' Lattice structure attached to G, if any; see Lattice.fit for whether it applies to observables on G ''' 
+	if isinstance(G, ArrayGraph):
+		return G.lattice
+	return G.graph.get('lattice')
+
+''' Lattices ''' 
+
+class Lattice:
+	def __init__(self, shape: Tuple[int, int], classes: List[Tuple[Tuple[slice, slice], Tuple[slice, slice]]]):
+		''' 
+		Structure of a graph whose node (i, j) sits at position (i, j) of a 2-D array, and whose edges come in classes, 
+		each joining the block of nodes at some slices (tails) to the equally-shaped block at others (heads); e.g. 
+		periodic wraps are classes joining the first row to the last. Its stencils take nodes in row-major order and 
+		edges class by class (each in row-major order of its tails), so that incidence products reduce to arithmetic on 
+		slices of the reshaped state, with trailing (ensemble) axes broadcast; observables indexing them otherwise 
+		use a PermutedLattice (see fit).
+		''' 
+		self.shape = tuple(shape)
+		self.classes = classes
+		self.regions = [tuple(len(range(*sl.indices(d))) for sl, d in zip(tails, self.shape)) for tails, _ in classes]
+		self.offsets = np.cumsum([0] + [int(np.prod(r)) for r in self.regions])
+
+	@property
+	def nodes(self) -> List[Node]:
+		return [(i, j) for i in range(self.shape[0]) for j in range(self.shape[1])]
+
+	@property
+	def edges(self) -> List[Edge]:
+		edges = []
+		for tails, heads in self.classes:
+			ti, tj = [np.arange(d)[sl] for sl, d in zip(tails, self.shape)]
+			hi, hj = [np.arange(d)[sl] for sl, d in zip(heads, self.shape)]
+			edges.extend(((int(a), int(b)), (int(c), int(d))) for a, c in zip(ti, hi) for b, d in zip(tj, hj))
+		return edges
+
+	def attach(self, G: nx.Graph) -> nx.Graph:
+		''' Offer this lattice's stencils to observables on G, which keep their index order (see fit) ''' 
+		G.graph['lattice'] = self
+		return G
+
+	def fit(self, nodes: Dict[Node, int], edges: Dict[Edge, int], orientation: Dict[Edge, int]) -> Any:
+		''' 
+		This lattice as seen by observables with the given domains: itself if they index its nodes and edges in its 
+		order, a PermutedLattice if in another order, or None if they are not exactly its nodes and (identically 
+		oriented) edges, e.g. after G was relabeled or edited.
+		''' 
+		lattice_nodes, lattice_edges = self.nodes, self.edges
+		if len(lattice_nodes) != len(nodes) or len(lattice_edges) != len(edges):
+			return None
+		if not all(v in nodes for v in lattice_nodes) or not all(orientation.get(e) == 1 for e in lattice_edges):
+			return None
+		node_perm = np.fromiter((nodes[v] for v in lattice_nodes), dtype=np.intp, count=len(lattice_nodes))
+		edge_perm = np.fromiter((edges[e] for e in lattice_edges), dtype=np.intp, count=len(lattice_edges))
+		node_perm = None if np.array_equal(node_perm, np.arange(node_perm.size)) else node_perm
+		edge_perm = None if np.array_equal(edge_perm, np.arange(edge_perm.size)) else edge_perm
+		if node_perm is None and edge_perm is None:
+			return self
+		return PermutedLattice(self, node_perm, edge_perm)
+
+	def index_grid(self) -> np.ndarray:
+		return np.arange(self.shape[0]*self.shape[1]).reshape(self.shape)
+
+	def ends(self) -> Tuple[np.ndarray, np.ndarray]:
+		''' Tail and head node index of each edge ''' 
+		idx = self.index_grid()
+		tails = np.concatenate([idx[t].ravel() for t, _ in self.classes])
+		heads = np.concatenate([idx[h].ravel() for _, h in self.classes])
+		return tails, heads
+
+	def node_index(self, v: Node) -> int:
+		i, j = v
+		if 0 <= i < self.shape[0] and 0 <= j < self.shape[1]:
+			return i*self.shape[1] + j
+		return None
+
+	def edge_index(self, e: Edge) -> Tuple[int, Sign]:
+		''' Index of an edge given in either orientation, and +1 or -1 as the orientation is the stored one or not ''' 
+		for (a, b), sign in ((e, 1), ((e[1], e[0]), -1)):
+			for k, ((tails, heads), region) in enumerate(zip(self.classes, self.regions)):
+				pos = []
+				for ai, bi, t, h, d in zip(a, b, tails, heads, self.shape):
+					t0, _, step = t.indices(d)
+					if bi - ai != h.indices(d)[0] - t0 or (ai - t0) % step != 0 or not (0 <= (ai - t0) // step < len(range(*t.indices(d)))):
+						break
+					pos.append((ai - t0) // step)
+				else:
+					return self.offsets[k] + pos[0]*region[1] + pos[1], sign
+		return None
+
+	def blocks(self, e: np.ndarray) -> List[np.ndarray]:
+		''' Views of an edge vector as one array per class, shaped as its tails ''' 
+		return [e[a:b].reshape(r + e.shape[1:]) for a, b, r in zip(self.offsets[:-1], self.offsets[1:], self.regions)]
+
+	def grad(self, y: np.ndarray, out: np.ndarray=None) -> np.ndarray:
+		''' B.T@y: head minus tail on each edge ''' 
+		if out is None:
+			out = np.empty((self.offsets[-1],) + y.shape[1:], dtype=y.dtype)
+		Y = y.reshape(self.shape + y.shape[1:])
+		for (tails, heads), E in zip(self.classes, self.blocks(out)):
+			np.subtract(Y[heads], Y[tails], out=E)
+		return out
+
+	def incidence(self, e: np.ndarray, out: np.ndarray=None) -> np.ndarray:
+		''' B@e: inflow minus outflow at each node ''' 
+		if out is None:
+			out = np.empty((self.shape[0]*self.shape[1],) + e.shape[1:], dtype=e.dtype)
+		Y = out.reshape(self.shape + e.shape[1:])
+		Y.fill(0.)
+		for (tails, heads), E in zip(self.classes, self.blocks(e)):
+			Y[heads] += E
+			Y[tails] -= E
+		return out
+
+	def laplacian(self, y: np.ndarray, out: np.ndarray=None) -> np.ndarray:
+		''' -B@B.T@y: sum of neighbors minus degree times value ''' 
+		if out is None:
+			out = np.empty_like(y)
+		if getattr(self, '_degree', None) is None:
+			self._degree = dict() # Negated degrees, by dtype
+		if y.dtype not in self._degree:
+			degree = np.zeros(self.shape, dtype=y.dtype)
+			for tails, heads in self.classes:
+				degree[tails] -= 1.
+				degree[heads] -= 1.
+			self._degree[y.dtype] = degree
+		Y, O = y.reshape(self.shape + y.shape[1:]), out.reshape(self.shape + y.shape[1:])
+		np.multiply(Y, self._degree[y.dtype].reshape(self.shape + (1,) * (y.ndim - 1)), out=O)
+		for tails, heads in self.classes:
+			O[tails] += Y[heads]
+			O[heads] += Y[tails]
+		return out
+
+	@staticmethod
+	def square(n: int, m: int, periodic: Tuple[bool, bool]=(False, False), diagonals: bool=False) -> 'Lattice':
+		''' Lattice of nx.grid_2d_graph(n, m), optionally with square_lattice's diagonals ''' 
+		classes = [
+			((slice(0, n-1), slice(None)), (slice(1, n), slice(None))),
+			((slice(None), slice(0, m-1)), (slice(None), slice(1, m))),
+		]
+		if periodic[0]:
+			classes.append(((slice(0, 1), slice(None)), (slice(n-1, n), slice(None))))
+		if periodic[1]:
+			classes.append(((slice(None), slice(0, 1)), (slice(None), slice(m-1, m))))
+		if diagonals:
+			classes.append(((slice(0, n-1), slice(0, m-1)), (slice(1, n), slice(1, m))))
+			classes.append(((slice(0, n-1), slice(1, m)), (slice(1, n), slice(0, m-1))))
+		return Lattice((n, m), classes)
+
+	@staticmethod
+	def triangular(m: int, N: int) -> 'Lattice':
+		''' Lattice of nx.triangular_lattice_graph(m, 2N) (non-periodic), whose nodes fill an (N+1) x (m+1) array ''' 
+		return Lattice((N+1, m+1), [
+			((slice(0, N), slice(None)), (slice(1, N+1), slice(None))),
+			((slice(None), slice(0, m)), (slice(None), slice(1, m+1))),
+			((slice(0, N), slice(1, m, 2)), (slice(1, N+1), slice(2, m+1, 2))),
+			((slice(1, N+1), slice(0, m, 2)), (slice(0, N), slice(1, m+1, 2))),
+		])
+
+class PermutedLattice:
+	''' 
+	Stencils of a lattice for observables indexing its nodes and edges in another order, e.g. networkx's: node_perm and 
+	edge_perm hold the observable index of each lattice node and edge (None where the orders agree), by which arguments 
+	are gathered into lattice order and results scattered back.
+	''' 
+	def __init__(self, lattice: Lattice, node_perm: np.ndarray, edge_perm: np.ndarray):
+		self.lattice = lattice
+		self.node_perm = node_perm
+		self.edge_perm = edge_perm
+
+	@staticmethod
+	def gather(y: np.ndarray, perm: np.ndarray) -> np.ndarray:
+		return y if perm is None else np.take(y, perm, axis=0)
+
+	@staticmethod
+	def scatter(r: np.ndarray, perm: np.ndarray, out: np.ndarray) -> np.ndarray:
+		if out is None and perm is None:
+			return r
+		if out is None:
+			out = np.empty_like(r)
+		if perm is None:
+			np.copyto(out, r)
+		else:
+			out[perm] = r
+		return out
+
+	def grad(self, y: np.ndarray, out: np.ndarray=None) -> np.ndarray:
+		return self.scatter(self.lattice.grad(self.gather(y, self.node_perm)), self.edge_perm, out)
+
+	def incidence(self, e: np.ndarray, out: np.ndarray=None) -> np.ndarray:
+		return self.scatter(self.lattice.incidence(self.gather(e, self.edge_perm)), self.node_perm, out)
+
+	def laplacian(self, y: np.ndarray, out: np.ndarray=None) -> np.ndarray:
+		if self.node_perm is None:
+			return self.lattice.laplacian(y, out)
+		return self.scatter(self.lattice.laplacian(self.gather(y, self.node_perm)), self.node_perm, out)
+
+''' Array graphs ''' 
+
+class ArrayGraph:
+	def __init__(self, labels: np.ndarray, tails: np.ndarray, heads: np.ndarray, pos: np.ndarray=None, 
+			triangles: np.ndarray=None, boundaries: Dict[str, np.ndarray]=None, lattice: Lattice=None, 
+			edge_attrs: Dict[str, np.ndarray]=None, nx_order: np.ndarray=None):
+		''' 
+		Graph held as arrays: a label per node (a row of integers, read as a tuple), tail and head node indices of each 
+		(oriented) edge, and optionally node positions, triangles as node index triples, named boundary node index sets, 
+		edge attribute arrays, and lattice structure (whose node and edge order the arrays must follow). Observables 
+		may be constructed on it in place of an nx.Graph, indexing nodes and edges in array order; the networkx graph is 
+		only built on request, e.g. by a renderer, with its nodes inserted in nx_order (by default array order), which 
+		must place each tail before its head.
+		''' 
+		self.labels = np.asarray(labels)
+		self.tails, self.heads = np.asarray(tails, dtype=np.intp), np.asarray(heads, dtype=np.intp)
+		self.pos = pos
+		self.triangles = np.empty((0, 3), dtype=np.intp) if triangles is None else np.asarray(triangles, dtype=np.intp)
+		self.boundaries = dict() if boundaries is None else boundaries
+		self.lattice = lattice
+		self.edge_attrs = dict() if edge_attrs is None else edge_attrs
+		self.nx_order = nx_order
+		self.graph = dict()
+		self._index = None
+		self._nx = None
+
+	def number_of_nodes(self) -> int:
+		return len(self.labels)
+
+	def number_of_edges(self) -> int:
+		return len(self.tails)
+
+	def node_label(self, i: int) -> Node:
+		return tuple(self.labels[i].tolist())
+
+	def edge_label(self, k: int) -> Edge:
+		return (self.node_label(self.tails[k]), self.node_label(self.heads[k]))
+
+	def nodes(self) -> List[Node]:
+		return [tuple(v) for v in self.labels.tolist()]
+
+	def edges(self) -> List[Edge]:
+		nodes = self.nodes()
+		return [(nodes[a], nodes[b]) for a, b in zip(self.tails.tolist(), self.heads.tolist())]
+
+	def node_index(self, v: Node) -> int:
+		if self.lattice is not None:
+			return self.lattice.node_index(v)
+		return self.index()[0].get(v)
+
+	def edge_index(self, e: Edge) -> Tuple[int, Sign]:
+		''' Index of an edge given in either orientation, and +1 or -1 as the orientation is the stored one or not ''' 
+		if self.lattice is not None:
+			return self.lattice.edge_index(e)
+		edges = self.index()[1]
+		if e in edges:
+			return edges[e], 1
+		if (e[1], e[0]) in edges:
+			return edges[(e[1], e[0])], -1
+		return None
+
+	def index(self) -> Tuple[Dict[Node, int], Dict[Edge, int]]:
+		''' Lookup tables by label, built on first use ''' 
+		if self._index is None:
+			nodes = self.nodes()
+			self._index = ({v: i for i, v in enumerate(nodes)}, {(nodes[a], nodes[b]): k for k, (a, b) in enumerate(zip(self.tails.tolist(), self.heads.tolist()))})
+		return self._index
+
+	def boundary_edges(self, nodes: np.ndarray) -> np.ndarray:
+		''' Indices of the edges with both ends in a set of node indices ''' 
+		mask = np.zeros(self.number_of_nodes(), dtype=bool)
+		mask[nodes] = True
+		return np.flatnonzero(mask[self.tails] & mask[self.heads])
+
+	def to_networkx(self) -> nx.Graph:
+		''' Equivalent networkx graph, whose observables index nodes and edges as this graph's do ''' 
+		if self._nx is None:
+			G = nx.Graph()
+			nodes, edges = self.nodes(), self.edges()
+			order = range(len(nodes)) if self.nx_order is None else self.nx_order
+			if self.pos is None:
+				G.add_nodes_from(nodes[i] for i in order)
+			else:
+				G.add_nodes_from((nodes[i], {'pos': self.pos[i]}) for i in order)
+			G.add_edges_from(edges)
+			for key, vals in self.edge_attrs.items():
+				nx.set_edge_attributes(G, dict(zip(edges, vals.tolist())), key)
+			attach_order(G, nodes, edges) # Observables on G index as those on this graph, i.e. in lattice order if any
+			if self.lattice is not None:
+				self.lattice.attach(G)
+			self._nx = G
+		return self._nx
+
+	def __getstate__(self):
+		return {**self.__dict__, '_index': None, '_nx': None}
+
+class PointIndex(Mapping):
+	''' 
+	Domain of an observable on an ArrayGraph: maps labels to indices like the dictionaries used for networkx graphs (edges 
+	in either orientation), computing each lookup rather than holding a table; see also labels and orientation.
+	''' 
+	def __init__(self, G: ArrayGraph, Gd: GraphDomain):
+		self.G, self.Gd = G, Gd
+		self.n = G.number_of_nodes() if Gd is GraphDomain.nodes else G.number_of_edges()
+		self.labels = PointLabels(self)
+		self.orientation = PointOrientation(self)
+
+	def find(self, x: Point) -> Tuple[int, Sign]:
+		if self.Gd is GraphDomain.nodes:
+			try:
+				i = self.G.node_index(x)
+			except (TypeError, ValueError):
+				i = None
+			return None if i is None else (i, 1)
+		try:
+			return self.G.edge_index(x)
+		except (TypeError, ValueError):
+			return None
+
+	def label(self, i: int) -> Point:
+		return self.G.node_label(i) if self.Gd is GraphDomain.nodes else self.G.edge_label(i)
+
+	def __getitem__(self, x: Point) -> int:
+		found = self.find(x)
+		if found is None:
+			raise KeyError(x)
+		return found[0]
+
+	def __contains__(self, x: Point) -> bool:
+		return self.find(x) is not None
+
+	def __iter__(self):
+		return (self.label(i) for i in range(self.n))
+
+	def __len__(self) -> int:
+		return self.n
+
+	def items(self):
+		return ((self.label(i), i) for i in range(self.n))
+
+class PointLabels(Mapping):
+	''' Label of each index of a PointIndex ''' 
+	def __init__(self, index: PointIndex):
+		self.index = index
+
+	def __getitem__(self, i: int) -> Point:
+		if not 0 <= i < self.index.n:
+			raise KeyError(i)
+		return self.index.label(i)
+
+	def __iter__(self):
+		return iter(range(self.index.n))
+
+	def __len__(self) -> int:
+		return self.index.n
+
+class PointOrientation(Mapping):
+	''' +1 for edges given in their stored orientation, -1 for the reverse ''' 
+	def __init__(self, index: PointIndex):
+		self.index = index
+
+	def __getitem__(self, e: Edge) -> Sign:
+		found = self.index.find(e)
+		if found is None:
+			raise KeyError(e)
+		return found[1]
+
+	def __iter__(self):
+		for e in self.index:
+			yield e
+			yield (e[1], e[0])
+
+	def __len__(self) -> int:
+		return 2 * self.index.n
+
+def lattice_graph(lattice: Lattice, pos: np.ndarray, triangles: np.ndarray=None, boundaries: Dict[str, np.ndarray]=None, 
+		nx_order: np.ndarray=None) -> ArrayGraph:
+	I, J = np.divmod(np.arange(lattice.shape[0]*lattice.shape[1]), lattice.shape[1])
+	tails, heads = lattice.ends()
+	return ArrayGraph(np.stack((I, J), axis=1), tails, heads, pos=pos, triangles=triangles, boundaries=boundaries, 
+		lattice=lattice, nx_order=nx_order)
+
+def square_lattice_arrays(m: int, n: int, diagonals: bool=False, periodic: Union[bool, Tuple[bool, bool]]=False) -> ArrayGraph:
+	''' 
+	Array version of square_lattice(m, n, diagonals=diagonals, periodic=periodic), with the same labels, positions, 
+	orientation and indexing; boundary node sets 'l', 'r', 't', 'b' as in with_boundaries. 
+	''' 
+	periodic = tuple(periodic) if np.iterable(periodic) else (periodic, periodic)
+	assert (not periodic[0] or n >= 3) and (not periodic[1] or m >= 3), 'Periodic axes need at least 3 nodes'
+	lattice = Lattice.square(n, m, periodic=periodic, diagonals=diagonals)
+	idx = lattice.index_grid()
+	I, J = np.divmod(idx.ravel(), m)
+	dh = 1/max(m, n)
+	pos = np.stack((2*I*dh - n*dh, 2*J*dh - m*dh), axis=1)
+	boundaries = {'l': idx[0, :], 'r': idx[n-1, :], 't': idx[:, m-1], 'b': idx[:, 0]}
+	# Cells with both diagonals are 4-cliques, so, as with networkx's maximal cliques, there are no triangles
+	return lattice_graph(lattice, pos, boundaries=boundaries)
+
+def triangular_lattice_arrays(m: int, n: int) -> ArrayGraph:
+	''' 
+	Array version of triangular_lattice(m, n) (non-periodic), with the same labels, positions, orientation and indexing; 
+	boundary node sets 'l', 'r', 't', 'b' as in with_boundaries, and its triangles. For odd n, the nodes networkx removes 
+	from the last column are dropped, and the lattice structure with them.
+	''' 
+	N = (n + 1) // 2
+	lattice = Lattice.triangular(m, N)
+	idx = lattice.index_grid()
+	I, J = np.divmod(idx.ravel(), m+1)
+	pos = np.stack((0.5 * (J % 2) + I, np.sqrt(3) / 2 * J), axis=1)
+	# Each cell splits along its diagonal: rising on odd rows, falling on even ones
+	a, b, c, d = idx[:N, :m], idx[1:, :m], idx[1:, 1:], idx[:N, 1:] # Corners (i, j), (i+1, j), (i+1, j+1), (i, j+1)
+	odd = (np.arange(m) % 2 == 1)[None, :]
+	first = np.stack((a, b, np.where(odd, c, d)), axis=-1).reshape(-1, 3)
+	second = np.stack((np.where(odd, a, b), c, d), axis=-1).reshape(-1, 3)
+	triangles = np.concatenate((first, second))
+	nx_order = np.lexsort((I, J)) # networkx inserts nodes row by row
+	if n % 2 == 0:
+		boundaries = {'l': idx[0, :], 'r': idx[N, :], 't': idx[:, m], 'b': idx[:, 0]}
+		return lattice_graph(lattice, pos, triangles=triangles, boundaries=boundaries, nx_order=nx_order)
+	keep = ~((I == N) & (J % 2 == 1))
+	new = np.cumsum(keep) - 1
+	tails, heads = lattice.ends()
+	kept = keep[tails] & keep[heads]
+	triangles = triangles[keep[triangles].all(axis=1)]
+	r = np.concatenate((idx[N-1, 1::2], idx[N, ::2]))
+	boundaries = {'l': idx[0, :], 'r': np.sort(r), 't': idx[:, m][keep[idx[:, m]]], 'b': idx[:, 0]}
+	nx_order = nx_order[keep[nx_order]]
+	return ArrayGraph(np.stack((I, J), axis=1)[keep], new[tails[kept]], new[heads[kept]], pos=pos[keep], 
+		triangles=new[triangles], boundaries={k: new[v] for k, v in boundaries.items()}, nx_order=new[nx_order])
+
+def lattice45_arrays(m: int, n: int) -> ArrayGraph:
+	''' Array version of lattice45(m, n), with the same labels, positions, orientation and indexing ''' 
+	sizes = np.where(np.arange(n) % 2 == 0, m-1, m)
+	I = np.repeat(np.arange(n), sizes)
+	J = np.arange(len(I)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+	start = np.cumsum(sizes) - sizes
+	dy, dx = 2/(m-1), 2/(n-1)
+	pos = np.stack((-1 + I*dx, -1 + np.where(I % 2 == 0, dy/2, 0.) + J*dy), axis=1)
+	tails, heads = [], []
+	for i in range(1, n):
+		prev, cur = start[i-1], start[i]
+		if i % 2 == 0: # Node (i, j) joins (i-1, j) and (i-1, j+1)
+			j = np.arange(m-1)
+			tails.append(np.stack((prev + j, prev + j + 1), axis=1).ravel())
+			heads.append(np.repeat(cur + j, 2))
+		else: # Node (i, j) joins (i-1, j-1) and (i-1, j)
+			j = np.arange(1, m)
+			tails.append(np.stack((prev + j - 1, prev + j - 1), axis=1).ravel())
+			heads.append(np.stack((cur + j - 1, cur + j), axis=1).ravel())
+	tails = np.concatenate(tails) if tails else np.empty(0, dtype=np.intp)
+	heads = np.concatenate(heads) if heads else np.empty(0, dtype=np.intp)
+	return ArrayGraph(np.stack((I, J), axis=1), tails, heads, pos=pos)
+
+''' Batching ''' 
+
+class GraphBatch:
+	def __init__(self, graphs: List[nx.Graph]):
+		''' 
+		Disjoint union of many graphs, on which one observable simulates the same dynamics on all of them at once.
+		Node v of the k-th graph becomes node (k, v) of the union. Nodes and edges of each graph keep their order and 
+		orientation, and occupy a contiguous block of the union's domain, so results split back into per-graph views.
+		''' 
+		self.graphs = list(graphs)
+		self.G = G = nx.Graph()
+		for k, g in enumerate(self.graphs):
+			G.add_nodes_from(((k, v), d) for v, d in g.nodes(data=True))
+		for k, g in enumerate(self.graphs):
+			# Adding edges in adjacency order reproduces each graph's edge order
+			for u, nbrs in g.adj.items():
+				G.add_edges_from(((k, u), (k, v), d) for v, d in nbrs.items())
+		self.node_offsets = np.cumsum([0] + [g.number_of_nodes() for g in self.graphs])
+		self.edge_offsets = np.cumsum([0] + [g.number_of_edges() for g in self.graphs])
+
+	def __len__(self):
+		return len(self.graphs)
+
+	def block(self, Gd: GraphDomain, k: int) -> slice:
+		''' Indices of the k-th graph in an observable on the union ''' 
+		offsets = self.node_offsets if Gd is GraphDomain.nodes else self.edge_offsets
+		return slice(offsets[k], offsets[k+1])
+
+	def split(self, obs: Any) -> List[np.ndarray]:
+		''' Per-graph views of an observable on the union (or of its recorded history, along the last axis but one) ''' 
+		return [obs.y[self.block(obs.Gd, k)] for k in range(len(self))]
+
+	def view(self, obs: Any, k: int) -> Any:
+		''' Observable on the k-th graph, viewing its block of an observable on the union; e.g. for rendering ''' 
+		sl = self.block(obs.Gd, k)
+		return obs.project(obs.Gd, lambda o: o.y[sl], G=self.graphs[k])
+
+	def lift_nodes(self, k: int, nodes: List[Any]) -> List[Any]:
+		''' Nodes of the union corresponding to nodes of the k-th graph, e.g. to impose boundary conditions ''' 
+		return [(k, v) for v in nodes]
+
+	def lift_edges(self, k: int, edges: List[Any]) -> List[Any]:
+		return [((k, u), (k, v)) for u, v in edges]
+
+def batch_graphs(graphs: List[nx.Graph]) -> GraphBatch:
+	''' Batch graphs into one block-diagonal domain; simulate on batch.G and split results with batch.split() ''' 
+	return GraphBatch(graphs)
 
 def clear_attributes(G):
 	ns = list(G.nodes(data=True))
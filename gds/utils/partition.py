@@ -0,0 +1,56 @@
+''' Graph partitioning '''
+
+import numpy as np
+import warnings
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+from typing import List
+
+def fiedler_vector(A: sp.spmatrix, seed: int=0) -> np.ndarray:
+	''' Eigenvector of the second-smallest eigenvalue of the Laplacian of the (symmetric, nonnegative) adjacency A '''
+	n = A.shape[0]
+	L = sp.diags(np.asarray(A.sum(axis=1)).ravel()) - A
+	if n <= 1000:
+		_, V = np.linalg.eigh(L.toarray())
+		return V[:, 1]
+	rng = np.random.default_rng(seed)
+	X = rng.standard_normal((n, 2))
+	with warnings.catch_warnings(): # An approximate vector suffices to split by
+		warnings.simplefilter('ignore')
+		_, V = spla.lobpcg(L.tocsr(), X, Y=np.ones((n, 1)), largest=False, tol=1e-4, maxiter=200)
+	return V[:, 0]
+
+def spectral_bisection(A: sp.spmatrix, parts: int, seed: int=0) -> np.ndarray:
+	'''
+	Partition the vertices of a graph, given by its adjacency (or any square operator with the same sparsity), into parts
+	of near-equal size by recursive spectral bisection. Each part is split at a quantile of its Fiedler vector, so that
+	parts need not be a power of two. Returns the part label of each vertex.
+	'''
+	A = abs(sp.csr_matrix(A))
+	A = ((A + A.T) > 0).astype(np.float64)
+	A.setdiag(0)
+	A.eliminate_zeros()
+	labels = np.zeros(A.shape[0], dtype=np.intp)
+
+	def bisect(idx: np.ndarray, label: int, k: int):
+		if k <= 1 or idx.size <= 1:
+			labels[idx] = label
+			return
+		k0 = k // 2
+		f = fiedler_vector(A[idx][:, idx], seed=seed)
+		order = np.argsort(f, kind='stable')
+		split = int(round(idx.size * k0 / k))
+		bisect(idx[order[:split]], label, k0)
+		bisect(idx[order[split:]], label + k0, k - k0)
+
+	bisect(np.arange(A.shape[0]), 0, parts)
+	return labels
+
+def partition_sets(labels: np.ndarray, parts: int) -> List[np.ndarray]:
+	''' Sorted vertex indices of each part '''
+	return [np.flatnonzero(labels == p) for p in range(parts)]
+
+def edge_cut(A: sp.spmatrix, labels: np.ndarray) -> int:
+	''' Number of edges between parts '''
+	A = sp.triu(sp.coo_matrix(A), k=1)
+	return int(np.count_nonzero(labels[A.row] != labels[A.col]))
@@ -145,6 +145,7 @@ setup(
         'pyzmq',
         'cloudpickle',
         'hickle',
+        'h5py',
         'tqdm',
         'networkx',
         'cvxpy',
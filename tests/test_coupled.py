@@ -0,0 +1,74 @@
+import numpy as np
+import networkx as nx
+import pytest
+
+import gds
+
+def grid() -> nx.Graph:
+	return nx.grid_2d_graph(10, 10)
+
+def run_discrete(workers: int) -> np.ndarray:
+	G = grid()
+	src, dst = gds.node_gds(G), gds.node_gds(G)
+	frames = np.random.default_rng(0).standard_normal((20, src.ndim))
+	src.set_evolution(traj_t=np.arange(20.), traj_y=frames)
+	dst.set_evolution(map_fun=lambda y: 0.5*y + src.y + 0.1*dst.laplacian(), dt=1.)
+	dst.set_initial(y0=lambda v: 0.)
+	sys = gds.coupled_fds(src, dst, workers=workers)
+	for _ in range(10):
+		sys.step(1.)
+	return dst.y.copy()
+
+def run_continuous(workers: int) -> np.ndarray:
+	G = grid()
+	u, v = gds.node_gds(G), gds.node_gds(G)
+	# Each right-hand side reads the other's memoized operator
+	u.set_evolution(dydt=lambda t, y: u.laplacian() + 0.5*(v.laplacian() - u.y), max_step=1e-2)
+	v.set_evolution(dydt=lambda t, y: 0.3*v.laplacian() + 0.5*(u.laplacian() - v.y), max_step=1e-2)
+	u.set_initial(y0=lambda x: float(x == (2, 2)))
+	v.set_initial(y0=lambda x: float(x == (7, 7)))
+	sys = gds.coupled_fds(u, v, workers=workers)
+	for _ in range(10):
+		sys.step(0.05)
+	return np.concatenate([u.y, v.y])
+
+def run_split(workers: int, reverse: bool) -> np.ndarray:
+	G = grid()
+	u, v = gds.node_gds(G), gds.node_gds(G)
+	u.set_evolution(dydt=lambda t, y: u.laplacian() + 0.5*(v.y - u.y), max_step=1e-2)
+	v.set_evolution(dydt=lambda t, y: 0.3*v.laplacian() + 0.5*(u.y - v.y), max_step=1e-2)
+	u.set_initial(y0=lambda x: float(x == (2, 2)))
+	v.set_initial(y0=lambda x: float(x == (7, 7)))
+	systems = (v, u) if reverse else (u, v)
+	sys = gds.coupled_fds(*systems, splitting='strang', workers=workers, depends={u: [], v: []})
+	for _ in range(10):
+		sys.step(0.05)
+	return np.concatenate([u.y, v.y])
+
+def test_maps_reading_trajectories_are_deterministic():
+	serial = run_discrete(None)
+	for _ in range(3):
+		assert np.array_equal(run_discrete(2), serial)
+
+def test_concurrent_right_hand_sides_match_serial():
+	serial = run_continuous(None)
+	for _ in range(3):
+		assert np.array_equal(run_continuous(2), serial)
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_split_levels_do_not_depend_on_order(workers):
+	assert np.array_equal(run_split(workers, False), run_split(workers, True))
+
+def test_bound_state_is_a_plain_attribute():
+	G = grid()
+	u, v = gds.node_gds(G), gds.node_gds(G)
+	u.set_evolution(dydt=lambda t, y: u.laplacian(), max_step=1e-2)
+	v.set_evolution(map_fun=lambda y: 0.5*y + u.y, dt=0.1)
+	u.set_initial(y0=lambda x: float(x == (2, 2)))
+	sys = gds.coupled_fds(u, v)
+	assert 'y' in u.__dict__ and 'y' in v.__dict__
+	y = u.y
+	sys.step(0.1)
+	assert u.y is y # The same view, updated in place
+	assert np.array_equal(y, sys.integrator.y[u.view])
+	assert np.array_equal(v.y, v._y)
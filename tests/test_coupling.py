@@ -0,0 +1,39 @@
+import numpy as np
+import networkx as nx
+import pytest
+
+import gds
+from gds.expr import laplacian, ident
+
+def grid(n: int, spacing: float) -> nx.Graph:
+	G = nx.grid_2d_graph(n, n)
+	nx.set_node_attributes(G, {v: (v[0]*spacing, v[1]*spacing) for v in G}, 'pos')
+	return G
+
+def test_laws_follow_invalidated_couplings():
+	coarse, fine = gds.node_gds(grid(5, 1.)), gds.node_gds(grid(9, .5))
+	C = gds.proximity_coupling(coarse, fine, k=3)
+	coarse.set_evolution(dydt=lambda t, y: 0*y)
+	coarse.set_initial(y0=np.random.default_rng(0).standard_normal(coarse.ndim))
+	fine.set_evolution(dydt=0.1*laplacian(fine) + gds.transfer(C) - ident(fine), max_step=1e-2)
+	y = np.zeros(fine.ndim)
+	expected = lambda: 0.1*fine.laplacian(y) + C() - y
+	assert np.allclose(fine._law(0., y), expected(), atol=1e-12)
+	before = C.matrix
+
+	# Moving the coarse nodes changes the interpolation once the coupling is invalidated
+	for v in coarse.G:
+		x, z = coarse.G.nodes[v]['pos']
+		coarse.G.nodes[v]['pos'] = (0.5*x + 0.3, z)
+	C.invalidate()
+	assert abs(C.matrix - before).max() > 0
+	assert np.allclose(fine._law(0., y), expected(), atol=1e-12)
+
+	# And stepping uses the rebuilt map
+	fine.set_initial(y0=y)
+	fine.step(0.05)
+	ref = gds.node_gds(fine.G)
+	ref.set_evolution(dydt=lambda t, x: 0.1*ref.laplacian(x) + C() - x, max_step=1e-2)
+	ref.set_initial(y0=y)
+	ref.step(0.05)
+	assert np.allclose(fine.y, ref.y, atol=1e-6)
@@ -0,0 +1,48 @@
+import importlib
+import numpy as np
+import networkx as nx
+import pytest
+from scipy.integrate import LSODA
+
+import gds
+from gds.expr import laplacian, ident
+
+fds_module = importlib.import_module('gds.fds') # The package re-exports the fds class under the module's name
+
+def diffusion() -> gds.node_gds:
+	u = gds.node_gds(nx.grid_2d_graph(8, 8))
+	u.set_evolution(dydt=laplacian(u) - 0.1*ident(u), max_step=0.05, solver_args={'rtol': 1e-8, 'atol': 1e-10})
+	u.set_initial(y0=lambda v: float(v == (4, 4)))
+	return u
+
+def test_lsoda_critical_time_is_reachable():
+	''' set_t_bound relies on scipy's private LSODA work array; if this fails, integrators are restarted on every step ''' 
+	integrator = fds_module.make_integrator(lambda t, y: -y, 0., np.ones(3), 0.1, {})
+	assert isinstance(integrator, LSODA)
+	assert fds_module.lsoda_rwork(integrator) is not None
+
+@pytest.mark.parametrize('reachable', [True, False])
+def test_steps_stop_at_bound(monkeypatch, reachable):
+	ref = diffusion()
+	ref.step(1.)
+	if not reachable:
+		monkeypatch.setattr(fds_module, 'lsoda_rwork', lambda integrator: None)
+	u = diffusion()
+	for k in range(10):
+		u.step(0.1)
+		assert u.t == pytest.approx(0.1*(k+1), abs=1e-12)
+	assert isinstance(u.integrator, LSODA)
+	assert np.abs(u.y - ref.y).max() < 1e-6 * np.abs(ref.y).max()
+
+def test_restart_does_not_fire_events():
+	u = diffusion()
+	crossing, passage = gds.threshold_event(0.5), gds.first_passage(0.5)
+	u.add_event(crossing)
+	u.add_event(passage)
+	u.step(0.1)
+	assert not crossing.t_events and np.isnan(passage.times).sum() == u.ndim - 1 # Only the initial peak
+	u.set_initial(t0=u.t, y0=lambda v: 1.)
+	u.set_constraints(dirichlet={(0, 0): 1.})
+	u.step(0.1)
+	assert not crossing.t_events # The jump above the threshold is not a crossing
+	assert np.all(passage.times[np.arange(u.ndim) != u.X[(4, 4)]] == pytest.approx(0.1))
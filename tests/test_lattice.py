@@ -0,0 +1,61 @@
+import numpy as np
+import networkx as nx
+import pytest
+
+import gds
+
+graphs = {
+	'square': lambda: gds.square_lattice(6, 5),
+	'periodic': lambda: gds.square_lattice(6, 5, periodic=True),
+	'diagonals': lambda: gds.square_lattice(6, 5, diagonals=True),
+	'triangular': lambda: gds.triangular_lattice(4, 6),
+	'reordered': lambda: gds.reorder_graph(gds.square_lattice(6, 5)),
+}
+
+def operators(f: gds.gds) -> list:
+	return ['laplacian', 'grad', 'bilaplacian'] if f.Gd is gds.GraphDomain.nodes else ['laplacian', 'div', 'curl']
+
+@pytest.mark.parametrize('cls', [gds.node_gds, gds.edge_gds])
+@pytest.mark.parametrize('name', list(graphs))
+def test_stencils_match_sparse_operators(name, cls):
+	rng = np.random.default_rng(0)
+	for ensemble in (None, 3):
+		f = cls(graphs[name](), ensemble=ensemble)
+		assert f.lattice is not None
+		f.set_evolution(dydt=lambda t, y: 0*y)
+		f.set_constraints(dirichlet={f.iX[0]: 1., f.iX[f.ndim // 2]: -1.})
+		y = rng.standard_normal((f.ndim,) if ensemble is None else (f.ndim, ensemble))
+		for op in operators(f):
+			stencil = getattr(f, op)(y)
+			lattice, f.lattice = f.lattice, None # Off the stencil path
+			f.invalidate()
+			assert np.allclose(stencil, getattr(f, op)(y), atol=1e-12), op
+			f.lattice = lattice
+			f.invalidate()
+
+arrays = {
+	'square': (lambda: gds.square_lattice_arrays(6, 5), lambda: nx.grid_2d_graph(5, 6)),
+	'periodic': (lambda: gds.square_lattice_arrays(6, 5, periodic=True), lambda: nx.grid_2d_graph(5, 6, periodic=True)),
+	'triangular': (lambda: gds.triangular_lattice_arrays(4, 6), lambda: nx.triangular_lattice_graph(4, 6)),
+	'lattice45': (lambda: gds.lattice45_arrays(5, 7), lambda: gds.lattice45(5, 7)),
+}
+
+@pytest.mark.parametrize('cls', [gds.node_gds, gds.edge_gds])
+@pytest.mark.parametrize('name', list(arrays))
+def test_array_lattices_match_networkx_graphs(name, cls):
+	make_array, make_graph = arrays[name]
+	f, g = cls(make_array()), cls(make_graph())
+	assert g.lattice is None and set(f.X) == set(g.X)
+	idx = np.array([g.X[f.iX[i]] for i in range(f.ndim)])
+	sign = np.ones(f.ndim) if cls is gds.node_gds else np.array([f.orientation[f.iX[i]] * g.orientation[f.iX[i]] for i in range(f.ndim)])
+	y = np.random.default_rng(0).standard_normal(f.ndim)
+	yg = np.empty(g.ndim)
+	yg[idx] = sign * y
+	assert np.allclose(f.laplacian(y), sign * g.laplacian(yg)[idx], atol=1e-12)
+	if cls is gds.node_gds:
+		eidx = np.array([g.edges[f.edges_i[i]] for i in range(len(f.edges))])
+		esign = np.array([f.orientation[f.edges_i[i]] * g.orientation[f.edges_i[i]] for i in range(len(f.edges))])
+		assert np.allclose(f.grad(y), esign * g.grad(yg)[eidx], atol=1e-12)
+	else:
+		nidx = np.array([g.nodes[f.nodes_i[i]] for i in range(len(f.nodes))])
+		assert np.allclose(f.div(y), g.div(yg)[nidx], atol=1e-12)
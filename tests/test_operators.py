@@ -0,0 +1,52 @@
+import numpy as np
+import networkx as nx
+import pytest
+
+import gds
+
+def test_memoized_results_are_shared_and_read_only():
+	u = gds.node_gds(nx.grid_2d_graph(8, 8))
+	u.set_evolution(dydt=lambda t, y: u.laplacian(), max_step=1e-2)
+	u.set_initial(y0=lambda x: float(x == (3, 3)))
+	a = u.laplacian()
+	assert u.laplacian() is a # Served without copying
+	with pytest.raises(ValueError):
+		a *= 2
+	out = np.empty(u.ndim)
+	assert u.laplacian(out=out) is out
+	out *= 2 # A writable copy
+	assert np.array_equal(out, 2 * u.laplacian())
+	u.step(0.05)
+	assert not np.array_equal(u.laplacian(), a)
+
+def diffuse(dtype: np.dtype) -> gds.node_gds:
+	u = gds.node_gds(nx.grid_2d_graph(30, 30), dtype=dtype)
+	u.set_evolution(map_fun=lambda y: y + 0.2 * u.laplacian(y), dt=1.)
+	u.set_initial(y0=lambda x: np.sin(x[0] / 3.) * np.cos(x[1] / 5.))
+	u.set_constraints(dirichlet={(0, 0): 1.})
+	for _ in range(200):
+		u.step(1.)
+	return u
+
+def test_reduced_precision_recurrence():
+	single, double = diffuse(np.float32), diffuse(np.float64)
+	assert single.y.dtype == np.float32 and single.incidence.dtype == np.float32 and single.laplacian().dtype == np.float32
+	err = np.abs(single.y - double.y).max() / np.abs(double.y).max()
+	assert err < 1e-6 # About 5e-8: single-precision rounding, which does not grow over the run
+	assert err > 0
+
+def test_reduced_precision_is_not_integrated():
+	u = gds.node_gds(nx.grid_2d_graph(5, 5), dtype=np.float32)
+	with pytest.raises(AssertionError):
+		u.set_evolution(dydt=lambda t, y: u.laplacian(y))
+
+def test_fluxes_are_vectors():
+	v = gds.edge_gds(nx.grid_2d_graph(6, 6))
+	v.set_evolution(dydt=lambda t, y: 0*y)
+	v.set_initial(y0=np.random.default_rng(0).standard_normal(v.ndim))
+	B = v.incidence.toarray() * v.y
+	for op, expected in ((v.influx, np.maximum(B, 0).sum(axis=1)), (v.outflux, np.maximum(-B, 0).sum(axis=1))):
+		ret = op()
+		assert type(ret) is np.ndarray and ret.shape == (len(v.nodes),)
+		assert np.allclose(ret, expected)
+		assert np.allclose(op(out=np.empty(len(v.nodes))), ret)
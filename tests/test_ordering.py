@@ -0,0 +1,44 @@
+import numpy as np
+import networkx as nx
+import pytest
+
+import gds
+
+def shuffled_grid() -> nx.Graph:
+	''' A grid whose insertion order scatters neighbors, so that reordering changes the indices ''' 
+	G = nx.grid_2d_graph(8, 8)
+	nodes = list(G.nodes())
+	np.random.default_rng(0).shuffle(nodes)
+	H = nx.Graph()
+	H.add_nodes_from(nodes)
+	H.add_edges_from(G.edges())
+	return H
+
+def diffuse(cls: type, G: nx.Graph) -> gds.gds:
+	f = cls(G)
+	f.set_evolution(dydt=lambda t, y: f.laplacian(y) - 0.1*f.y, max_step=1e-2)
+	center = (4, 4) if cls is gds.node_gds else ((4, 4), (4, 5))
+	f.set_initial(y0=lambda x: float(x == center or (cls is gds.edge_gds and x == center[::-1])))
+	return f
+
+@pytest.mark.parametrize('cls', [gds.node_gds, gds.edge_gds])
+def test_reordering_is_invisible(cls, tmp_path):
+	G = shuffled_grid()
+	natural, reordered = diffuse(cls, G.copy()), diffuse(cls, gds.reorder_graph(G.copy()))
+	assert reordered.natural_perm() is not None
+	sys = gds.couple({'natural': natural, 'reordered': reordered})
+	sys.solve_to_disk(0.3, 0.1, 'run', parent=str(tmp_path))
+
+	# Same points, labels and values, in whichever order each field indexes them
+	assert set(natural.X) == set(reordered.X)
+	assert all(natural(x) == pytest.approx(reordered(x), abs=1e-12) for x in natural.X)
+	assert np.allclose(reordered.to_graph_order(reordered.y), natural.y, atol=1e-12)
+	assert not np.allclose(reordered.y, natural.y) # The orders do differ
+
+	# Saved and replayed identically
+	replay = gds.System.from_disk('run', parent=str(tmp_path))
+	a, b = replay.observables['natural'], replay.observables['reordered']
+	assert np.allclose(a.history[:], b.history.data[:], atol=1e-12) # Both saved in networkx order
+	for _ in range(3):
+		replay.stepper.step(0.1)
+		assert all(a(x) == pytest.approx(b(x), abs=1e-12) for x in a.X)
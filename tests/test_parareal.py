@@ -0,0 +1,35 @@
+import numpy as np
+import networkx as nx
+import pytest
+
+import gds
+from gds.expr import laplacian, ident
+
+def heat(law: str) -> gds.node_gds:
+	u = gds.node_gds(nx.grid_2d_graph(12, 12))
+	if law == 'lambda': # Reads the state through u.y and the operators' default arguments
+		u.set_evolution(dydt=lambda t, y: 0.5*u.laplacian() - 0.1*u.y, max_step=1e-2)
+	else:
+		u.set_evolution(dydt=0.5*laplacian(u) - 0.1*ident(u), max_step=1e-2)
+	u.set_initial(y0=lambda v: 4*np.exp(-((v[0]-6)**2 + (v[1]-6)**2)/8))
+	return u
+
+@pytest.mark.parametrize('law', ['lambda', 'expr'])
+@pytest.mark.parametrize('workers', [None, 2])
+def test_parareal_matches_serial(law, workers):
+	u = heat(law)
+	serial = []
+	for _ in range(16):
+		u.step(0.25)
+		serial.append(u.y.copy())
+
+	v = heat(law)
+	sys = gds.parareal({'v': v}, slices=8, workers=workers, coarse_steps=2, tol=1e-8)
+	try:
+		for k in range(16):
+			sys.stepper.step(0.25)
+			assert np.isclose(v.t, 0.25*(k+1))
+			assert np.abs(v.y - serial[k]).max() < 1e-3 * np.abs(serial[k]).max()
+	finally:
+		sys.stepper.close()
+	assert all(it > 1 for it in sys.stepper.iterations) # The coarse propagator alone is not exact
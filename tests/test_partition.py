@@ -0,0 +1,41 @@
+import numpy as np
+import networkx as nx
+import pytest
+
+import gds
+from gds.expr import laplacian, ident, advect, pointwise
+
+def sir(partitions: int) -> np.ndarray:
+	G = nx.grid_2d_graph(20, 20)
+	S, I = gds.node_gds(G), gds.node_gds(G)
+	beta = np.linspace(0.5, 1.5, S.ndim)
+	S.set_evolution(dydt=0.1*laplacian(S) - beta*ident(S)*ident(I), max_step=1e-2, partitions=partitions)
+	I.set_evolution(dydt=0.1*laplacian(I) + beta*ident(S)*ident(I) - 0.2*ident(I) + 0.*pointwise(np.tanh, S), max_step=1e-2, partitions=partitions)
+	S.set_initial(y0=lambda x: 1.)
+	I.set_initial(y0=lambda x: 0.5 if x == (10, 10) else 0.)
+	S.set_constraints(dirichlet={(0, 0): 1.})
+	sys = gds.coupled_fds(S, I)
+	for _ in range(10):
+		sys.step(0.05)
+	return np.concatenate([S.y, I.y])
+
+def test_partitioned_law_matches_serial():
+	serial, partitioned = sir(None), sir(3)
+	assert np.allclose(partitioned, serial, rtol=1e-10, atol=1e-12)
+
+def test_partitioned_single_system_matches_serial():
+	ys = []
+	for partitions in (None, 2):
+		u = gds.node_gds(nx.grid_2d_graph(20, 20))
+		u.set_evolution(dydt=laplacian(u) - ident(u)*ident(u), max_step=1e-2, partitions=partitions)
+		u.set_initial(y0=lambda x: float(x[0] == 5))
+		for _ in range(5):
+			u.step(0.05)
+		ys.append(u.y.copy())
+	assert np.allclose(ys[1], ys[0], rtol=1e-10, atol=1e-12)
+
+def test_unsupported_terms_are_rejected_up_front():
+	G = nx.grid_2d_graph(5, 5)
+	u, v = gds.node_gds(G), gds.edge_gds(G)
+	with pytest.raises(ValueError, match='Advect'):
+		u.set_evolution(dydt=laplacian(u) + pointwise(np.abs, advect(u, v)), partitions=2)
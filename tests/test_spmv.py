@@ -0,0 +1,38 @@
+import time
+import numpy as np
+import networkx as nx
+import pytest
+
+import gds
+from gds.utils import common
+
+@pytest.fixture
+def field() -> gds.node_gds:
+	u = gds.node_gds(nx.grid_2d_graph(300, 300))
+	u.set_weights(np.random.default_rng(0).uniform(0.5, 2., len(u.edges))) # Off the stencil path
+	return u
+
+def test_threaded_operators_are_bit_identical(field, monkeypatch):
+	monkeypatch.setattr(common, 'spmv_cores', 4) # Exercise the pool even on a single core
+	y = np.random.default_rng(1).standard_normal(field.ndim)
+	serial = [field.grad(y), field.laplacian(y)]
+	field.set_threads(4)
+	threaded = [field.grad(y), field.laplacian(y)]
+	assert all(np.array_equal(a, b) for a, b in zip(serial, threaded))
+	blocks = common._row_blocks[id(field.incidence_t)][1]
+	field.grad(y)
+	assert common._row_blocks[id(field.incidence_t)][1] is blocks # Split once, not on every product
+
+def test_threaded_gradient_is_not_slower(field):
+	y = np.random.default_rng(1).standard_normal(field.ndim)
+	def timing(threads: int) -> float:
+		field.set_threads(threads)
+		field.grad(y)
+		best = np.inf
+		for _ in range(5):
+			t0 = time.perf_counter()
+			for _ in range(10):
+				field.grad(y)
+			best = min(best, time.perf_counter() - t0)
+		return best
+	assert timing(4) < 1.5 * timing(1)
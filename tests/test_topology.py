@@ -0,0 +1,65 @@
+import numpy as np
+import networkx as nx
+import pytest
+
+import gds
+
+def correspondence(f: gds.gds, g: gds.gds):
+	''' Index in g of each point of f, and the sign relating their orientations (edges only) '''
+	idx = np.array([g.X[f.iX[i]] for i in range(f.ndim)], dtype=np.intp)
+	if f.Gd is gds.GraphDomain.nodes:
+		return idx, np.ones(f.ndim)
+	return idx, np.array([f.orientation[f.iX[i]] * g.orientation[f.iX[i]] for i in range(f.ndim)])
+
+def edge_correspondence(f: gds.gds, g: gds.gds):
+	''' Index in g of each edge of f, and the sign relating their orientations '''
+	es = [f.edges_i[i] for i in range(len(f.edges))]
+	return np.array([g.edges[e] for e in es], dtype=np.intp), np.array([f.orientation[e] * g.orientation[e] for e in es])
+
+def edge_weights(f: gds.gds, w: dict) -> np.ndarray:
+	return np.array([w[frozenset(f.edges_i[i])] for i in range(len(f.edges))])
+
+def change(f: gds.gds, rng: np.random.Generator):
+	nodes, edges = list(f.G.nodes()), list(f.G.edges())
+	f.remove_edges([edges[i] for i in rng.choice(len(edges), 5, replace=False)])
+	f.remove_nodes([nodes[i] for i in rng.choice(len(nodes), 3, replace=False)])
+	nodes = list(f.G.nodes())
+	f.add_edges([(nodes[0], nodes[-1]), (nodes[1], ('new', 0)), (('new', 0), ('new', 1)), (('new', 1), nodes[1])])
+
+@pytest.mark.parametrize('cls', [gds.node_gds, gds.edge_gds])
+def test_topology_change_matches_rebuilt_field(cls):
+	rng = np.random.default_rng(0)
+	f = cls(nx.triangular_lattice_graph(6, 6))
+	y0 = rng.standard_normal(f.ndim)
+	f.set_evolution(dydt=lambda t, y: f.laplacian(), max_step=1e-2)
+	f.set_initial(y0=lambda x: y0[f.X[x]])
+	before = {f.iX[i]: f.y[i] for i in range(f.ndim)} # Edges keep their stored orientation
+	change(f, rng)
+
+	g = cls(f.G.copy())
+	idx, sign = correspondence(f, g)
+	assert sorted(idx) == list(range(g.ndim))
+	# Surviving points keep their values, new ones are zero
+	assert np.array_equal(f.y, [before.get(f.iX[i], 0.) for i in range(f.ndim)])
+
+	# Operators agree with those of the rebuilt field, also after reweighting
+	w = {frozenset(e): rng.uniform(0.5, 2.) for e in f.G.edges()}
+	for weighted in (False, True):
+		if weighted:
+			L = f.vertex_laplacian if cls is gds.node_gds else f.edge_laplacian
+			f.set_weights(edge_weights(f, w))
+			g.set_weights(edge_weights(g, w))
+			assert (f.vertex_laplacian if cls is gds.node_gds else f.edge_laplacian) is L # Refilled in place
+		y = rng.standard_normal(f.ndim)
+		yg = np.empty(g.ndim)
+		yg[idx] = sign * y
+		assert np.allclose(f.laplacian(y), sign * g.laplacian(yg)[idx])
+		L = f.vertex_laplacian if cls is gds.node_gds else f.edge_laplacian
+		Lg = g.vertex_laplacian if cls is gds.node_gds else g.edge_laplacian
+		assert np.allclose((L.toarray() * sign[:, None] * sign[None, :]), Lg.toarray()[np.ix_(idx, idx)])
+		if cls is gds.node_gds:
+			eidx, esign = edge_correspondence(f, g)
+			assert np.allclose(f.grad(y), esign * g.grad(yg)[eidx])
+		else:
+			nidx = np.array([g.nodes[f.nodes_i[i]] for i in range(len(f.nodes))], dtype=np.intp)
+			assert np.allclose(f.div(y), g.div(yg)[nidx])
@@ -0,0 +1,53 @@
+import os
+import numpy as np
+import networkx as nx
+import h5py
+import pytest
+
+import gds
+
+def frames(n: int) -> list:
+	rng = np.random.default_rng(0)
+	return [(0.1*k, {'u': rng.standard_normal(5), 'v': rng.standard_normal((3, 2)).astype(np.float32)}) for k in range(n)]
+
+def test_round_trip(tmp_path):
+	path = str(tmp_path / 'trajectory.h5')
+	with gds.TrajectoryWriter(path, flush=3, attrs={'dt': 0.1}) as writer:
+		for t, ys in frames(7):
+			writer.append(t, ys)
+	with h5py.File(path, 'r') as f:
+		assert f.attrs['dt'] == 0.1
+		assert np.array_equal(f['t'][:], [t for t, _ in frames(7)])
+		for name in ('u', 'v'):
+			assert f[name].dtype == frames(1)[0][1][name].dtype
+			assert np.array_equal(f[name][:], np.stack([ys[name] for _, ys in frames(7)]))
+
+def test_partial_file_after_crash(tmp_path):
+	path = str(tmp_path / 'trajectory.h5')
+	pid = os.fork()
+	if pid == 0: # Dies without closing the file, after two flushes and one buffered frame
+		try:
+			writer = gds.TrajectoryWriter(path, flush=3)
+			for t, ys in frames(7):
+				writer.append(t, ys)
+		finally:
+			os._exit(0)
+	os.waitpid(pid, 0)
+	with h5py.File(path, 'r', swmr=True) as f:
+		assert f['t'].shape[0] == 6
+		assert np.array_equal(f['u'][:], np.stack([ys['u'] for _, ys in frames(6)]))
+
+def test_interrupted_run_replays(tmp_path):
+	u = gds.node_gds(nx.grid_2d_graph(4, 4))
+	def step(y):
+		if u.t > 0.55:
+			raise RuntimeError('crash')
+		return y + 1.
+	u.set_evolution(map_fun=step, dt=0.125) # Exact in binary, so that the map fires on every step
+	sys = gds.couple({'u': u})
+	with pytest.raises(RuntimeError):
+		sys.solve_to_disk(1., 0.125, 'run', parent=str(tmp_path), flush=2)
+	replay = gds.System.from_disk('run', parent=str(tmp_path))
+	history = replay.observables['u'].history
+	assert len(history) == 5 # Every frame stepped before the crash, including the one still buffered
+	assert np.allclose(history[:], np.arange(1., 6.)[:, None] * np.ones(u.ndim))